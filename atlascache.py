@@ -0,0 +1,88 @@
+"""
+A disk cache of scaled tile atlas images, so the game and the editor don't
+have to decode and scale the atlas PNG on every start.
+
+The scaled image is stored as raw pixels behind a small header, which is
+loaded with a single read and no PNG decoding. Cache files are named after
+the hash of the source file, the scale and the scaling method, so a changed
+atlas image or ATLAS_SCALE simply leads to a new cache file.
+
+    tile_image = atlascache.load_scaled_image("resources/ohmydungeon_v1.1.png", ATLAS_SCALE)
+"""
+import hashlib
+import os
+import os.path
+import struct
+
+import pygame
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), ".cache", "atlas")
+
+# magic, width, height of the scaled image, followed by its RGBA pixels
+HEADER = struct.Struct("<4sII")
+MAGIC = b"ATL1"
+
+
+def get_cache_path(path, scale, smooth=False, cache_dir=CACHE_DIR) -> str:
+    """
+    Returns the cache file for the image at path scaled by scale.
+    """
+    with open(path, "rb") as file:
+        digest = hashlib.sha1(file.read()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(path))[0]
+    method = "smooth" if smooth else "scale"
+    return os.path.join(cache_dir, f"{name}-{digest}-x{scale:g}-{method}.atlas")
+
+
+def load_scaled_image(path, scale, smooth=False, cache_dir=CACHE_DIR):
+    """
+    Returns the image at path scaled by scale, with pygame.transform.smoothscale
+    if smooth is set, else with pygame.transform.scale. Loaded from the cache
+    if possible, else scaled and written to the cache. Raises FileNotFoundError
+    if there is no image at path.
+    """
+    cache_path = get_cache_path(path, scale, smooth, cache_dir)
+    image = _read_cache(cache_path)
+    if image is not None:
+        return image
+
+    image = pygame.image.load(path)
+    size = (int(image.get_width() * scale), int(image.get_height() * scale))
+    if smooth:
+        # needs a 24 or 32 bit image, like the atlas PNG
+        image = pygame.transform.smoothscale(image, size)
+    else:
+        image = pygame.transform.scale(image, size)
+    data = pygame.image.tobytes(image, "RGBA")
+    try:
+        _write_cache(cache_path, image.get_size(), data)
+    except OSError as exception:
+        print(f"Could not write atlas cache {cache_path}: {exception}")
+    # the same pixel format as an image read from the cache, so the first start
+    # renders like the ones after it
+    return pygame.image.frombytes(data, image.get_size(), "RGBA")
+
+
+def _read_cache(cache_path):
+    try:
+        with open(cache_path, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    magic, width, height = HEADER.unpack_from(data)
+    if magic != MAGIC or len(data) != HEADER.size + width * height * 4:
+        # written by another version or cut short, it gets overwritten
+        return None
+    return pygame.image.frombytes(data[HEADER.size:], (width, height), "RGBA")
+
+
+def _write_cache(cache_path, size, data):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # written under a temporary name first, a concurrent start never reads half a file
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, size[0], size[1]))
+        file.write(data)
+    os.replace(temp_path, cache_path)
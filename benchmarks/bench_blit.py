@@ -0,0 +1,77 @@
+"""
+Measures how many tiles per second can be blitted from the tile atlas.
+
+Compares the three ways of getting a tile image: a new subsurface of the
+atlas image for every blit (what TileAtlas.get_tile_image used to do), the
+cached tiles of TileAtlas without a display (same pixel format as the loaded
+PNG) and the cached tiles converted to the pixel format of the display.
+
+Run from the repository root:  python benchmarks/bench_blit.py
+"""
+import sys, os, os.path, time
+
+BASEDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, BASEDIR)
+sys.path.append(os.path.join(BASEDIR, "graphics2d"))
+# no window needed, but a display for convert()
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+from tileatlas import TileAtlas
+
+ATLAS_SCALE = 2
+MAPSIZE = (15, 15)
+DURATION = 1.0          # seconds per measurement
+
+
+def throughput(draw, surface):
+    """
+    Returns how many tiles per second draw(surface) blits, with draw blitting
+    one map of MAPSIZE per call.
+    """
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        draw(surface)
+        count += MAPSIZE[0] * MAPSIZE[1]
+    return count / (time.perf_counter() - start)
+
+
+def make_draw(atlas, get_tile_image):
+    tilesize = atlas.tilesize
+    # floor and wall tiles of the default rooms
+    tiles = [(22 if i % 7 else 14, (i % MAPSIZE[0] * tilesize[0], i // MAPSIZE[0] * tilesize[1]))
+             for i in range(MAPSIZE[0] * MAPSIZE[1])]
+
+    def draw(surface):
+        for tileid, position in tiles:
+            surface.blit(get_tile_image(tileid), position)
+    return draw
+
+
+def main():
+    pygame.init()
+    image = pygame.image.load(os.path.join(BASEDIR, "resources", "ohmydungeon_v1.1.png"))
+    image = pygame.transform.scale(image, (image.get_width() * ATLAS_SCALE, image.get_height() * ATLAS_SCALE))
+    tilesize = (16 * ATLAS_SCALE, 16 * ATLAS_SCALE)
+    atlas = TileAtlas(tilesize=tilesize, atlassize=(6, 15), image=image)
+    size = (MAPSIZE[0] * tilesize[0], MAPSIZE[1] * tilesize[1])
+
+    # without a display the tiles keep the format of the PNG
+    surface = pygame.Surface(size)
+    uncached = throughput(make_draw(atlas, lambda index: atlas.image.subsurface(atlas.get_tile_rect(index))),
+                          surface)
+    cached = throughput(make_draw(atlas, atlas.get_tile_image), surface)
+
+    screen = pygame.display.set_mode(size)
+    atlas.image = image             # slices the tiles again, now converted
+    converted = throughput(make_draw(atlas, atlas.get_tile_image), screen)
+
+    print(f"{'tile images':<32} {'tiles/s':>10} {'speedup':>8}")
+    for name, value in [("subsurface per blit", uncached), ("cached", cached),
+                        ("cached, display format", converted)]:
+        print(f"{name:<32} {value:>10.0f} {value / uncached:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Simulates several game instances sharing one database file and measures how the
+total throughput develops with the number of clients.
+
+Every client is a separate process with its own storage connections. It polls
+its room 10 times as often as it moves, like dungeon_game does, and writes every
+move through (flush interval 0). The run is repeated with the rollback journal
+the database used before and with the WAL configuration storage now uses by
+default. A temporary copy of the default database is used.
+
+This only reports numbers; dbtests/multiclient.py checks that the clients 
+don't run into lock errors and don't block each other.
+
+Run from the repository root:  python benchmarks/bench_multiclient.py
+"""
+import sys, os.path, shutil, sqlite3, tempfile, time
+import multiprocessing
+
+BASEDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, BASEDIR)
+
+import storage
+
+CLIENT_COUNTS = [1, 2, 4, 8]
+DURATION = 3.0          # seconds per run
+POLLS_PER_MOVE = 10
+
+CONFIGS = {
+    'rollback journal': {'journal_mode': "DELETE", 'synchronous': "FULL"},
+    'WAL': {},
+}
+
+
+def client(dbpath, config, clientno, start_at, results):
+    storage.initialize(dbpath, flush_interval=0, config=config)
+    playerid = storage.register_player(f"bench client {clientno}", 50)
+    roomid = 2
+    revision = None
+    polls = moves = errors = 0
+
+    while time.time() < start_at:
+        time.sleep(0.001)
+    end_at = start_at + DURATION
+    while time.time() < end_at:
+        try:
+            revision = storage.get_room_changes_since(roomid, revision).revision
+            polls += 1
+            if polls % POLLS_PER_MOVE == 0:
+                storage.set_player_location(playerid, roomid, (moves % 15) + 15)
+                moves += 1
+        except sqlite3.OperationalError:
+            # "database is locked"
+            errors += 1
+    storage.finalize()
+    results.put((polls, moves, errors))
+
+
+def run(dbpath, config, clients):
+    results = multiprocessing.Queue()
+    start_at = time.time() + 1.0
+    processes = [multiprocessing.Process(target=client, args=(dbpath, config, i, start_at, results))
+                 for i in range(clients)]
+    for process in processes:
+        process.start()
+    totals = [0, 0, 0]
+    for _ in processes:
+        for i, value in enumerate(results.get()):
+            totals[i] += value
+    for process in processes:
+        process.join()
+    return totals
+
+
+def main():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print(f"{'configuration':<18} {'clients':>7} {'polls/s':>9} {'moves/s':>8} {'lock errors':>11}")
+        for name, config in CONFIGS.items():
+            dbpath = os.path.join(tmpdir, f"{name}.db")
+            shutil.copy(os.path.join(BASEDIR, storage.DATABASE_PATH), dbpath)
+            for clients in CLIENT_COUNTS:
+                polls, moves, errors = run(dbpath, config, clients)
+                print(f"{name:<18} {clients:>7} {polls/DURATION:>9.0f} {moves/DURATION:>8.0f} {errors:>11}")
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Measures the wire format of protocol.py for rooms with 1, 100 and 1000 players.
+
+For every room size the benchmark compares the bytes per tick of sending the
+whole room to every client (a room message) with sending only what changed:
+one player_moved message per moving player, with all players moving every 
+tick and with only 10% of them moving. It also measures how many messages per
+second can be encoded and decoded.
+
+Run from the repository root:  python benchmarks/bench_protocol.py
+"""
+import sys, os.path, random, time
+
+BASEDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, BASEDIR)
+
+import protocol
+
+PLAYER_COUNTS = [1, 100, 1000]
+MAPSIZE = (15, 15)
+DURATION = 0.5          # seconds per throughput measurement
+
+
+def make_room_message(playercount):
+    cells = MAPSIZE[0] * MAPSIZE[1]
+    return {
+        "type": "room", "roomid": 2, "sequence": 1000, "size": MAPSIZE,
+        "tiles": [22] * cells, "portals": [(68, 3, 142)],
+        "objects": [(45, i) for i in range(0, cells, 9)],
+        "players": [(playerid, random.randrange(cells)) for playerid in range(playercount)],
+        "position": 99
+    }
+
+
+def make_moves(playercount):
+    cells = MAPSIZE[0] * MAPSIZE[1]
+    return [{"type": "player_moved", "roomid": 2, "sequence": 1001 + playerid, "playerid": playerid,
+             "tileindex": random.randrange(cells)} for playerid in range(playercount)]
+
+
+def throughput(function, items):
+    """
+    Returns how many items per second function handles.
+    """
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        for item in items:
+            function(item)
+        count += len(items)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    print(f"{'players':>8} {'room B/tick':>12} {'all moving':>11} {'10% moving':>11}"
+          f" {'move enc/s':>11} {'move dec/s':>11}"
+          f" {'room enc/s':>11} {'room dec/s':>11}")
+    for playercount in PLAYER_COUNTS:
+        room = make_room_message(playercount)
+        moves = make_moves(playercount)
+        room_frame = protocol.encode(room)
+        move_frames = [protocol.encode(move) for move in moves]
+        # every client in the room gets the message
+        room_bytes = len(room_frame) * playercount
+        delta_bytes = sum(len(frame) for frame in move_frames) * playercount
+        some_delta_bytes = sum(len(frame) for frame in move_frames[:max(1, playercount // 10)]) * playercount
+
+        move_payloads = [frame[4:] for frame in move_frames]
+        room_payload = room_frame[4:]
+        print(f"{playercount:>8} {room_bytes:>12} {delta_bytes:>11} {some_delta_bytes:>11}"
+              f" {throughput(protocol.encode, moves):>11.0f} {throughput(protocol.decode, move_payloads):>11.0f}"
+              f" {throughput(protocol.encode, [room]):>11.0f} {throughput(protocol.decode, [room_payload]):>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
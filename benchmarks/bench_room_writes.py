@@ -0,0 +1,88 @@
+"""
+Measures how long it takes to save fully painted rooms of different sizes.
+
+The current storage.store_room (one UPDATE of the packed room layers) is compared
+to the old row-by-row implementation, which issued one INSERT per non-empty cell 
+into the legacy TileMap and ObjectMap tables. The benchmark works on a temporary 
+copy of the default database, so resources/default_db.db is never modified.
+
+Run from the repository root:  python benchmarks/bench_room_writes.py
+"""
+import sys, os.path, shutil, tempfile, time
+from types import SimpleNamespace
+
+BASEDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, BASEDIR)
+
+import storage
+
+ROOM_SIZES = [(15, 15), (64, 64), (256, 256)]
+REPEATS = 5
+
+
+def make_room(size):
+    """
+    Returns a tilemap-like object with every cell painted and an object on every 
+    fourth cell.
+    """
+    cells = size[0] * size[1]
+    return SimpleNamespace(
+        mapsize=size,
+        tilemap=[22] * cells,
+        objectmap=[45 if i % 4 == 0 else None for i in range(cells)])
+
+
+def store_room_rowwise(roomid, tilemap):
+    """
+    The previous implementation of storage.store_room: one execute per cell.
+    """
+    connection = storage.backend.connection
+    cur = connection.cursor()
+    cur.execute("DELETE FROM TileMap WHERE roomid = ?", [roomid])
+    cur.execute("DELETE FROM ObjectMap WHERE roomid = ?", [roomid])
+    QUERY = "INSERT INTO TileMap (tileid, tileindex, roomid) VALUES (?, ?, ?)"
+    for index, tileid in enumerate(tilemap.tilemap):
+        if tileid is None:
+            continue
+        cur.execute(QUERY, [tileid, index, roomid])
+    QUERY = "INSERT INTO ObjectMap (objectid, objectindex, roomid) VALUES (?, ?, ?)"
+    for index, objectid in enumerate(tilemap.objectmap):
+        if objectid is None:
+            continue
+        cur.execute(QUERY, [objectid, index, roomid])
+    connection.commit()
+
+
+def measure(store, roomid, room):
+    """
+    Returns the best of REPEATS save times in milliseconds.
+    """
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        store(roomid, room)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    tmpdir = tempfile.mkdtemp()
+    dbpath = os.path.join(tmpdir, "bench.db")
+    shutil.copy(os.path.join(BASEDIR, storage.DATABASE_PATH), dbpath)
+    storage.initialize(dbpath)
+    try:
+        print(f"{'room size':>10} {'row-by-row ms':>14} {'current ms':>11} {'speedup':>8}")
+        for size in ROOM_SIZES:
+            room = make_room(size)
+            roomid = storage.store_new_room(f"bench {size[0]}x{size[1]}", room)
+            before = measure(store_room_rowwise, roomid, room)
+            after = measure(storage.store_room, roomid, room)
+            print(f"{size[0]:>4}x{size[1]:<5} {before:>14.2f} {after:>11.2f} {before/after:>7.1f}x")
+    finally:
+        storage.finalize()
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Measures where the startup time of dungeon_game.py goes: importing modules,
+initializing the database, preparing the tile atlas and building the GUI.
+
+The atlas is prepared three ways: loaded and scaled like before the atlas
+cache, with an empty cache (which also fills it) and from the filled cache.
+Building the GUI needs graphics2d and is reported as skipped without it.
+
+Run from the repository root:  python benchmarks/bench_startup.py [--scale 2] [--smooth]
+"""
+import time
+_started = time.perf_counter()
+
+import argparse
+import importlib
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+
+BASEDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, BASEDIR)
+sys.path.append(os.path.join(BASEDIR, "graphics2d"))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+ATLAS_PATH = os.path.join(BASEDIR, "resources", "ohmydungeon_v1.1.png")
+# the modules dungeon_game.py imports, in the same order
+MODULES = ["pygame", "graphics2d", "tileatlas", "tilemap", "gameworld", "storageworker",
+           "tilecatalog", "gameclient", "protocol", "storage", "sqlitebackend", "atlascache"]
+
+
+def timed(results, name, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    results[name] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def measure_imports(results):
+    for name in MODULES:
+        try:
+            timed(results, f"import {name}", importlib.import_module, name)
+        except ImportError as exception:
+            results[f"import {name}"] = f"skipped: {exception}"
+
+
+def measure_database(results, tmpdir):
+    import storage
+    path = os.path.join(tmpdir, "startup.db")
+    shutil.copy(os.path.join(BASEDIR, storage.DATABASE_PATH), path)
+    timed(results, "storage.initialize", storage.initialize, path)
+    timed(results, "storage.load_tile_catalog", storage.load_tile_catalog)
+    timed(results, "storage.register_player", storage.register_player, "startup", 50)
+    storage.finalize()
+
+
+def measure_atlas(results, tmpdir, scale, smooth):
+    import pygame
+    import atlascache
+    pygame.init()
+
+    def uncached():
+        image = pygame.image.load(ATLAS_PATH)
+        size = (int(image.get_width() * scale), int(image.get_height() * scale))
+        return (pygame.transform.smoothscale if smooth else pygame.transform.scale)(image, size)
+
+    cache_dir = os.path.join(tmpdir, "atlas")
+    timed(results, "atlas without cache", uncached)
+    timed(results, "atlas, empty cache", atlascache.load_scaled_image, ATLAS_PATH, scale, smooth, cache_dir)
+    return timed(results, "atlas from cache", atlascache.load_scaled_image, ATLAS_PATH, scale, smooth, cache_dir)
+
+
+def measure_gui(results, image, scale):
+    try:
+        import pygame
+        from tileatlas import TileAtlas
+        from gameworld import GameWorld
+    except ImportError as exception:
+        results["GUI build"] = f"skipped: {exception}"
+        return
+
+    def build():
+        tilesize = (int(16 * scale), int(16 * scale))
+        atlas = TileAtlas(tilesize=tilesize, atlassize=(6, 15), image=image)
+        world = GameWorld(mapsize=(15, 15), atlas=atlas)
+        world.set_tilemap([22] * 15 * 15)
+        return world
+
+    world = timed(results, "GUI build", build)
+    surface = pygame.display.set_mode((int(world.size[0]), int(world.size[1])))
+    timed(results, "first frame", world.on_draw, surface)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the startup time of the game")
+    parser.add_argument("--scale", type=float, default=2, help="ATLAS_SCALE")
+    parser.add_argument("--smooth", action="store_true", help="scale the atlas with smoothscale")
+    args = parser.parse_args()
+
+    results = {}
+    measure_imports(results)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        measure_database(results, tmpdir)
+        image = measure_atlas(results, tmpdir, args.scale, args.smooth)
+    finally:
+        shutil.rmtree(tmpdir)
+    measure_gui(results, image, args.scale)
+
+    for name, value in results.items():
+        if isinstance(value, str):
+            print(f"{name:<32} {value}")
+        else:
+            print(f"{name:<32} {value:>9.2f} ms")
+    print(f"{'total':<32} {(time.perf_counter() - _started) * 1000:>9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Measures drawing the tile and object layers of TileMap on maps from 15x15 up
+to 256x256 cells.
+
+Compares a blit per cell with the position computed by get_cell_rect() (how
+TileMap used to draw its layers) with the batched drawing of TileMap, which
+uses precomputed cell positions and one Surface.blits() call per layer.
+
+Run from the repository root:  python benchmarks/bench_tilemap.py
+"""
+import sys, os, os.path, time
+
+BASEDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, BASEDIR)
+sys.path.append(os.path.join(BASEDIR, "graphics2d"))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+from tileatlas import TileAtlas
+from tilemap import TileMap
+
+MAP_SIZES = [(15, 15), (32, 32), (64, 64), (128, 128), (256, 256)]
+TILESIZE = (16, 16)
+REPEATS = 20
+
+
+def measure(function):
+    """
+    Returns the median time of a call in milliseconds.
+    """
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def draw_per_cell(tilemap, layer, surface):
+    for i in range(tilemap.mapsize[0] * tilemap.mapsize[1]):
+        dest_rect = tilemap.get_cell_rect(i)
+        tileidx = layer[i]
+        if tileidx is None:
+            continue
+        surface.blit(tilemap.atlas.get_tile_image(tileidx), dest_rect.topleft)
+
+
+def main():
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    image = pygame.image.load(os.path.join(BASEDIR, "resources", "ohmydungeon_v1.1.png"))
+    atlas = TileAtlas(tilesize=TILESIZE, atlassize=(6, 15), image=image)
+
+    print(f"{'map':>9} {'tiles per cell':>15} {'tiles blits':>12} {'speedup':>8}"
+          f" {'objects per cell':>17} {'objects blits':>14} {'speedup':>8}")
+    for size in MAP_SIZES:
+        cells = size[0] * size[1]
+        tilemap = TileMap(mapsize=size, atlas=atlas, tilemap=[22] * cells,
+                          objectmap=[45 if i % 8 == 0 else None for i in range(cells)])
+        surface = pygame.Surface(tilemap.size).convert()
+        tiles_before = measure(lambda: draw_per_cell(tilemap, tilemap.tilemap, surface))
+        tiles_after = measure(lambda: tilemap._draw_tiles(surface))
+        objects_before = measure(lambda: draw_per_cell(tilemap, tilemap.objectmap, surface))
+        objects_after = measure(lambda: tilemap._draw_objects(surface))
+        print(f"{size[0]:>4}x{size[1]:<4} {tiles_before:>12.2f} ms {tiles_after:>9.2f} ms "
+              f"{tiles_before / tiles_after:>7.2f}x {objects_before:>14.2f} ms {objects_after:>11.2f} ms "
+              f"{objects_before / objects_after:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
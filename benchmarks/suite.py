@@ -0,0 +1,228 @@
+"""
+The benchmark suite: measures storage, room loading and rendering on synthetic
+databases of several sizes and writes the results as JSON, so runs on
+different commits can be compared.
+
+    python benchmarks/suite.py [--quick] [--output results.json] [--compare old.json]
+
+Every database is generated from a copy of the default database (for the tile
+properties) with a fixed random seed: a chain of rooms connected by portals,
+with objects on every eighth cell, and a players table of the given size,
+with a crowd of players in the first room. The rendering benchmarks need
+graphics2d and are reported as skipped without it.
+
+Results go to benchmarks/results/ unless --output is given. Every result is
+the time of one call in milliseconds (median, p95 and best of all repeats).
+"""
+import argparse
+import json
+import os.path
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+BASEDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, BASEDIR)
+sys.path.append(os.path.join(BASEDIR, "graphics2d"))
+
+import storage
+from storagebackend import timestamp
+
+# name -> number of rooms, room size, number of players, players in the crowded room
+DATABASES = {
+    'small': (10, (15, 15), 100, 10),
+    'medium': (100, (64, 64), 10000, 500),
+    'large': (200, (128, 128), 100000, 5000),
+}
+QUICK_DATABASES = ['small']
+
+MAP_SIZES = [(15, 15), (64, 64), (128, 128)]
+REPEATS = 50
+SEED = 1
+
+RESULTS_DIR = os.path.join(BASEDIR, "benchmarks", "results")
+
+
+def measure(function, repeats=REPEATS, setup=None) -> dict:
+    """
+    Calls function repeats times and returns the median, p95 and best time of
+    a call in milliseconds. setup is called before every call, untimed, and its
+    result passed to function.
+    """
+    times = []
+    for _ in range(repeats):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        function(argument) if setup is not None else function()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {'median_ms': times[len(times) // 2], 'p95_ms': times[min(len(times) - 1, len(times) * 95 // 100)],
+            'min_ms': times[0], 'repeats': repeats}
+
+
+def make_room(size, tileid=22, objectid=45):
+    cells = size[0] * size[1]
+    return SimpleNamespace(mapsize=size, tilemap=[tileid] * cells,
+                           objectmap=[objectid if i % 8 == 0 else None for i in range(cells)])
+
+
+def make_database(path, roomcount, roomsize, playercount, crowd):
+    """
+    Generates a synthetic database and returns the IDs of its rooms.
+    """
+    shutil.copy(os.path.join(BASEDIR, storage.DATABASE_PATH), path)
+    storage.initialize(path)
+    rng = random.Random(SEED)
+    roomids = [storage.store_new_room(f"bench room {i}", make_room(roomsize)) for i in range(roomcount)]
+    # a chain of rooms, the left edge of each room leads to the right edge of the previous one
+    middle = roomsize[1] // 2 * roomsize[0]
+    for previous, roomid in zip(roomids, roomids[1:]):
+        storage.create_room_connection(previous, middle + roomsize[0] - 1, roomid, middle + 1)
+        storage.create_room_connection(roomid, middle, previous, middle + roomsize[0] - 2)
+
+    cells = roomsize[0] * roomsize[1]
+    seen = timestamp()
+    rows = []
+    for i in range(playercount):
+        roomid = roomids[0] if i < crowd else rng.choice(roomids)
+        rows.append((f"bench player {i}", roomid, rng.randrange(cells), 50, seen))
+    connection = storage.backend.connection
+    connection.executemany("INSERT INTO players (name, room_id, position, object_id, last_seen, online) "
+                           "VALUES (?, ?, ?, ?, ?, 1)", rows)
+    connection.commit()
+    storage.finalize()
+    return roomids
+
+
+def bench_storage(path, roomids, roomsize) -> dict:
+    storage.initialize(path)
+    rng = random.Random(SEED)
+    results = {}
+    try:
+        results['load_tilemap_data'] = measure(lambda: storage.load_tilemap_data(rng.choice(roomids)))
+        room = make_room(roomsize, tileid=14)
+        results['store_room'] = measure(lambda: storage.store_room(rng.choice(roomids), room))
+        results['get_players_at crowded room'] = measure(lambda: storage.get_players_at(roomids[0]))
+        results['get_players_at random room'] = measure(lambda: storage.get_players_at(rng.choice(roomids)))
+
+        # what entering a portal costs in dungeon_game: the layout and a snapshot of the target room
+        def enter(roomid):
+            storage.load_room_layout(roomid)
+            storage.get_room_changes_since(roomid, None)
+
+        def cold_target():
+            storage.room_cache.clear()
+            return rng.choice(roomids[1:])
+
+        def prefetched_target():
+            # the game prefetches the rooms next to the current one, snapshots included
+            index = rng.randrange(1, len(roomids))
+            storage.room_cache.clear()
+            storage.prefetch_neighbour_rooms(roomids[index - 1])
+            return roomids[index]
+
+        results['portal transition cold'] = measure(enter, setup=cold_target)
+        results['portal transition prefetched'] = measure(storage.peek_room_layout, setup=prefetched_target)
+    finally:
+        storage.finalize()
+    return results
+
+
+def bench_rendering() -> dict:
+    """
+    Draws rooms of MAP_SIZES onto offscreen surfaces.
+    """
+    try:
+        import pygame
+        from tileatlas import TileAtlas
+        from tilemap import TileMap
+    except ImportError as exception:
+        return {'skipped': f"rendering needs graphics2d and pygame: {exception}"}
+
+    pygame.init()
+    image = pygame.image.load(os.path.join(BASEDIR, "resources", "ohmydungeon_v1.1.png"))
+    image = pygame.transform.scale(image, (image.get_width() * 2, image.get_height() * 2))
+    atlas = TileAtlas(tilesize=(32, 32), atlassize=(6, 15), image=image)
+    results = {'TileAtlas.get_tile_image': measure(lambda: atlas.get_tile_image(22), repeats=REPEATS * 100)}
+    for size in MAP_SIZES:
+        room = make_room(size)
+        tilemap = TileMap(mapsize=size, atlas=atlas, tilemap=room.tilemap, objectmap=room.objectmap)
+        surface = pygame.Surface(tilemap.size)
+        name = f"{size[0]}x{size[1]}"
+        results[f'TileMap._draw_tiles {name}'] = measure(lambda: tilemap._draw_tiles(surface), repeats=REPEATS // 5)
+        results[f'TileMap._draw_objects {name}'] = measure(lambda: tilemap._draw_objects(surface), repeats=REPEATS // 5)
+        # the floor layer is composed on the first call, after that a frame is a single blit
+        results[f'TileMap._draw_floor {name}'] = measure(lambda: tilemap._draw_floor(surface), repeats=REPEATS // 5)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASEDIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, path):
+    with open(path) as file:
+        old = json.load(file)['results']
+    print(f"\nCompared to {path} (median, >1 is slower now):")
+    for group, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            before = old.get(group, {}).get(name)
+            if isinstance(result, dict) and isinstance(before, dict) and before.get('median_ms'):
+                print(f"  {group:<10} {name:<36} {result['median_ms'] / before['median_ms']:>6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs all benchmarks and writes the results as JSON")
+    parser.add_argument("--quick", action="store_true", help="only the small database")
+    parser.add_argument("--output", help="JSON file to write, by default in benchmarks/results/")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare with")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {}
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for name in (QUICK_DATABASES if args.quick else DATABASES):
+            roomcount, roomsize, playercount, crowd = DATABASES[name]
+            print(f"Generating {name} database: {roomcount} rooms of {roomsize[0]}x{roomsize[1]}, "
+                  f"{playercount} players")
+            path = os.path.join(tmpdir, f"{name}.db")
+            roomids = make_database(path, roomcount, roomsize, playercount, crowd)
+            results[name] = bench_storage(path, roomids, roomsize)
+    finally:
+        shutil.rmtree(tmpdir)
+    results['rendering'] = bench_rendering()
+
+    for group, benchmarks in results.items():
+        print(group)
+        for name, result in benchmarks.items():
+            if isinstance(result, dict):
+                print(f"  {name:<36} {result['median_ms']:>9.3f} ms  (p95 {result['p95_ms']:.3f} ms)")
+            else:
+                print(f"  {name}: {result}")
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'unknown'}.json")
+    with open(output, "w") as file:
+        json.dump({'commit': commit, 'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+                   'python': platform.python_version(), 'platform': platform.platform(),
+                   'results': results}, file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
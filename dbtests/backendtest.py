@@ -0,0 +1,295 @@
+## Runs the same checks against every storage backend given on the command line:
+##
+##     python backendtest.py memory sqlite mysql mysql-server
+##
+## Without arguments, the memory, sqlite and mysql backends are checked. The
+## sqlite backend works on a new temporary database file.
+##
+## mysql-server is the check of the MySQL backend: it runs against a real
+## server. Create dbconfig.py from dbconfig_TEMPLATE.py (in the repository
+## root, next to storage.py) and point it at an EMPTY database on a local MySQL
+## or MariaDB server, e.g. one started with:
+##
+##     docker run -e MARIADB_ROOT_PASSWORD=... -e MARIADB_DATABASE=dungeon -p 3306:3306 mariadb
+##
+## Run it after every change to mysqlbackend.py or the queries in sqlbackend.py.
+##
+## mysql runs the MySQL backend against the MySQLdb stand-in in mysqlstandin/,
+## which needs no server. The stand-in translates the statements to sqlite and
+## only checks their shape: the dialect, the placeholders and the parameters.
+## It doesn't have the row locks of FOR UPDATE, counts matched instead of
+## changed rows in rowcount and doesn't check AUTO_INCREMENT or index
+## definitions the way MySQL does, so passing it says nothing about how the
+## backend behaves on a server. It also checks the upgrade of a database
+## created at schema version 5 and the schema lock.
+import os.path, sys, tempfile, time
+import multiprocessing
+from types import SimpleNamespace
+
+BASEDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, BASEDIR)
+
+import storage
+
+STANDIN_DIR = os.path.join(BASEDIR, "dbtests", "mysqlstandin")
+
+# the tables of a MySQL database at schema version 5 that changed since
+V5_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS players (
+           player_id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY,
+           name VARCHAR(64),
+           room_id INTEGER,
+           position INTEGER,
+           object_id INTEGER,
+           last_seen VARCHAR(64),
+           UNIQUE INDEX players_name (name),
+           INDEX players_room_id (room_id))""",
+    """CREATE TABLE IF NOT EXISTS inventory (
+           playerid INTEGER NOT NULL,
+           objectid INTEGER NOT NULL,
+           INDEX inventory_playerid (playerid))""",
+    """CREATE TABLE IF NOT EXISTS schema_version (
+           version INTEGER PRIMARY KEY,
+           description TEXT,
+           applied_at VARCHAR(64))""",
+]
+
+
+def make_room(size, tile, objects):
+    cells = size[0] * size[1]
+    objectmap = [None] * cells
+    for index, objectid in objects.items():
+        objectmap[index] = objectid
+    return SimpleNamespace(mapsize=size, tilemap=[tile] * cells, objectmap=objectmap)
+
+
+def check_backend():
+    first = storage.store_new_room("first", make_room((4, 3), 22, {2: 45}))
+    second = storage.store_new_room("second", make_room((15, 15), 14, {}))
+    # new players spawn in room 2
+    while second < 2:
+        second = storage.store_new_room("filler", make_room((15, 15), 14, {}))
+    assert first in storage.get_room_ids() and second in storage.get_room_ids()
+    assert storage.load_tile_catalog() is storage.load_tile_catalog()
+
+    tiles, objects = storage.load_tilemap_data(first)
+    assert tiles == [22] * 12 and objects[2] == 45 and objects.count(None) == 11
+    assert storage.get_room_size(first) == (4, 3)
+    try:
+        storage.load_tilemap_data(9999)
+        assert False, "unknown room must raise ValueError"
+    except ValueError:
+        pass
+
+    storage.store_room(first, make_room((4, 3), 10, {5: 44}))
+    assert storage.get_objects_at(first) == [(44, 5)]
+
+    storage.create_room_connection(first, 7, second, 99)
+    layout = storage.load_room_layout(first)
+    assert layout.size == (4, 3) and layout.tiles == (10,) * 12 and layout.connections == ((7, second, 99),)
+
+    snapshot = storage.get_room_changes_since(first, None)
+    assert snapshot.resync and snapshot.objects_added == [(44, 5)]
+    storage.add_object_to_room(first, 1, 46)
+    storage.remove_object_from_room(first, 5)
+    changes = storage.get_room_changes_since(first, snapshot.revision)
+    assert not changes.resync and changes.objects_added == [(46, 1)] and changes.objects_removed == [5]
+    assert storage.get_room_changes_since(first, changes.revision).revision == changes.revision
+
+    player = storage.register_player("backendtest", 50)
+    assert storage.register_player("backendtest", 51) == player
+    assert player in storage.get_player_list()
+    assert storage.get_player_info(player)['name'] == "backendtest"
+    assert storage.get_player_location(player) == (2, 99)
+    before = storage.get_room_changes_since(second, None).revision
+    storage.set_player_location(player, second, 100)
+    storage.flush()
+    assert (player, 100) in storage.get_players_at(second)
+    storage.set_player_location(player, first, 3)
+    assert storage.get_player_location(player) == (first, 3)
+    assert storage.get_room_changes_since(second, before).players_left == [player]
+
+    storage.add_object_to_player_inventory(player, 45)
+    storage.add_object_to_player_inventory(player, 45)
+    storage.add_object_to_player_inventory(player, 46)
+    storage.remove_object_from_player_inventory(player, 45)
+    assert sorted(storage.get_player_inventory_objects(player)) == [45, 46]
+
+    revision = storage.get_room_changes_since(first, None).revision
+    assert storage.take_object(player, first, 1) == 46
+    assert storage.take_object(player, first, 1) is None
+    assert sorted(storage.get_player_inventory_objects(player)) == [45, 46, 46]
+    assert storage.get_player_inventory_counts(player) == {45: 1, 46: 2}
+    storage.add_object_to_player_inventory(player, 47, 1000)
+    storage.remove_object_from_player_inventory(player, 47, 999)
+    storage.remove_object_from_player_inventory(player, 45)
+    assert storage.get_player_inventory_counts(player) == {46: 2, 47: 1}
+    assert storage.get_room_changes_since(first, revision).objects_removed == [1]
+
+    revision = storage.get_room_changes_since(first, None).revision
+    storage.set_player_offline(player)
+    assert (player, 3) not in storage.get_players_at(first)
+    assert storage.get_room_changes_since(first, revision).players_left == [player]
+    storage.heartbeat(player)
+    storage.flush()
+    assert (player, 3) in storage.get_players_at(first)
+    assert storage.backend.mark_players_offline(seen_before=storage.timestamp(-60)) == [player]
+    assert storage.get_players_at(first) == []
+
+    # resizing a room rewrites its size with the layers
+    revision = storage.get_room_changes_since(first, None).revision
+    storage.load_room_layout(first)
+    storage.store_room(first, make_room((5, 4), 11, {14: 45}))
+    assert storage.get_room_size(first) == (5, 4)
+    tiles, objects = storage.load_tilemap_data(first)
+    assert tiles == [11] * 20 and len(objects) == 20 and objects[14] == 45
+    assert storage.load_room_layout(first).size == (5, 4)
+    assert storage.get_objects_at(first) == [(45, 14)]
+    assert storage.get_room_changes_since(first, revision).objects_added == [(45, 14)]
+
+
+def standin_config(path) -> dict:
+    """
+    Returns the connection settings for the MySQLdb stand-in, with the database 
+    in the sqlite file at path.
+    """
+    # the stand-in takes the place of the real driver in this process
+    if STANDIN_DIR not in sys.path:
+        sys.path.insert(0, STANDIN_DIR)
+    return {'SERVER_ADDRESS': "localhost", 'USERNAME': "backendtest", 'PASSWORD': "", 'DATABASE': path}
+
+
+def create_old_database(config, version) -> int:
+    """
+    Creates the tables of schema version 5 with a player who has some objects
+    in the inventory, recorded as schema version version. Returns the player.
+    """
+    import MySQLdb
+    connection = MySQLdb.connect(database=config['DATABASE'])
+    cur = connection.cursor()
+    for statement in V5_SCHEMA:
+        cur.execute(statement)
+    cur.execute("INSERT INTO players (name, room_id, position, object_id, last_seen) VALUES (%s, %s, %s, %s, %s)",
+                ("old player", 2, 99, 50, storage.timestamp()))
+    player = cur.lastrowid
+    cur.executemany("INSERT INTO inventory (playerid, objectid) VALUES (%s, %s)",
+                    [(player, 45), (player, 45), (player, 46)])
+    cur.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (%s, 'initial schema', NOW())",
+                (version,))
+    connection.commit()
+    connection.close()
+    return player
+
+
+def check_mysql_upgrade(config):
+    """
+    Opens a MySQL database created at schema version 5, before inventory counts
+    and presence, which must be upgraded to the current schema.
+    """
+    player = create_old_database(config, 5)
+    # the second time, there is nothing left to upgrade
+    for _ in range(2):
+        storage.initialize(backend="mysql", config=config)
+        try:
+            cur = storage.backend._read("SELECT version FROM schema_version ORDER BY version")
+            assert [row[0] for row in cur.fetchall()] == [5, 6, 7]
+            assert storage.get_player_inventory_counts(player) == {45: 2, 46: 1}
+            # players of an old database are offline until their next heartbeat
+            storage.heartbeat(player)
+            storage.flush()
+            assert (player, 99) in storage.get_players_at(2)
+        finally:
+            storage.finalize()
+
+
+def open_mysql(config, results):
+    try:
+        storage.initialize(backend="mysql", config=config)
+        storage.finalize()
+        results.put(None)
+    except Exception as exception:
+        results.put(f"{type(exception).__name__}: {exception}")
+
+
+def check_mysql_concurrent_upgrade(config, processes=4):
+    """
+    Opens a database at schema version 5 from several processes at once. They
+    must wait for the schema lock, and only one of them may upgrade it.
+    """
+    import MySQLdb
+    from mysqlbackend import SCHEMA_LOCK
+    player = create_old_database(config, 5)
+    connection = MySQLdb.connect(database=config['DATABASE'])
+    cur = connection.cursor()
+    cur.execute("SELECT GET_LOCK(%s, %s)", (SCHEMA_LOCK, 0))
+    assert cur.fetchone()[0] == 1
+
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=open_mysql, args=(config, results)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    time.sleep(1.0)
+    assert results.empty(), "the schema was upgraded while another connection held the schema lock"
+    cur.execute("SELECT MAX(version) FROM schema_version")
+    assert cur.fetchone()[0] == 5
+    cur.execute("SELECT RELEASE_LOCK(%s)", (SCHEMA_LOCK,))
+    cur.fetchone()
+    connection.close()
+
+    errors = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    assert errors == [None] * processes, errors
+    storage.initialize(backend="mysql", config=config)
+    try:
+        cur = storage.backend._read("SELECT version FROM schema_version ORDER BY version")
+        assert [row[0] for row in cur.fetchall()] == [5, 6, 7]
+        assert storage.get_player_inventory_counts(player) == {45: 2, 46: 1}
+    finally:
+        storage.finalize()
+
+
+def check_mysql_unknown_upgrade(config):
+    """
+    A database at a version without an entry in UPGRADES can't be upgraded and
+    must not be recorded as upgraded.
+    """
+    create_old_database(config, 4)
+    try:
+        storage.initialize(backend="mysql", config=config)
+        storage.finalize()
+        assert False, "a database without an upgrade path must raise ValueError"
+    except ValueError:
+        pass
+    import MySQLdb
+    connection = MySQLdb.connect(database=config['DATABASE'])
+    cur = connection.cursor()
+    cur.execute("SELECT version FROM schema_version ORDER BY version")
+    assert [row[0] for row in cur.fetchall()] == [4]
+    connection.close()
+
+
+def main():
+    backends = sys.argv[1:] or ["memory", "sqlite", "mysql"]
+    for backend in backends:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "backendtest.db")
+            config = None
+            if backend == "mysql":
+                config = standin_config(path)
+            elif backend == "mysql-server":
+                # the server configured in dbconfig.py
+                backend = "mysql"
+            storage.initialize(path, backend=backend, config=config)
+            try:
+                check_backend()
+            finally:
+                storage.finalize()
+            if config is not None:
+                check_mysql_upgrade(standin_config(os.path.join(tmpdir, "upgrade.db")))
+                check_mysql_concurrent_upgrade(standin_config(os.path.join(tmpdir, "concurrent.db")))
+                check_mysql_unknown_upgrade(standin_config(os.path.join(tmpdir, "unknown.db")))
+        print(f"{backend}: ok")
+
+
+main()
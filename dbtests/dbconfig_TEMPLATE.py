@@ -4,6 +4,9 @@
 # IP-Adresse des Servers, z.B. '192.168.0.100'. 'localhost' ist der lokale Computer.
 SERVER_ADDRESS = "localhost"
 
+# Port des Servers, 3306 ist der Standard von MySQL und MariaDB.
+PORT = 3306
+
 USERNAME = "example-username"
 
 # PASSWORT NICHT IN ECHTEN PROJEKTEN HARTKODIEREN!
@@ -0,0 +1,160 @@
+## Lets several game processes share one database file in WAL mode, the
+## setup of sqliteconnection.py. Every process polls its room and writes a
+## move every POLLS_PER_MOVE polls, while another process keeps taking the
+## write lock and holding it for HOLD seconds, like a long write transaction.
+##
+## With WAL, readers never wait for the writer, so no poll may take longer
+## than half of HOLD. The same run with the rollback journal the database used
+## before is the baseline: there, polls have to wait for the writer, which
+## shows that the check can fail at all. Any "database is locked" (or other)
+## error fails the check in both runs.
+##
+##     python multiclient.py [clients] [seconds]
+##
+## benchmarks/bench_multiclient.py measures the throughput.
+import os.path, shutil, sqlite3, sys, tempfile, time
+import multiprocessing
+
+BASEDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, BASEDIR)
+
+import storage
+
+CONFIGS = {
+    'rollback journal': {'journal_mode': "DELETE"},
+    'WAL': {},
+}
+
+POLLS_PER_MOVE = 10
+# pause after every poll, in seconds. Keeps the processes from competing for
+# the CPU, which would make the polls slow on a machine with a single core.
+POLL_PAUSE = 0.001
+# how long the writer holds the write lock, and the pause until it takes it again
+HOLD = 0.25
+HOLD_PAUSE = 0.25
+
+
+def writer(dbpath, roomid, duration, start_at, results):
+    try:
+        db = sqlite3.connect(dbpath, isolation_level=None, timeout=10)
+    except Exception as exception:
+        results.put((0, [f"starting writer: {exception}"]))
+        return
+    holds = 0
+    errors = []
+
+    while time.time() < start_at:
+        time.sleep(0.001)
+    end_at = start_at + duration
+    while time.time() < end_at:
+        try:
+            # EXCLUSIVE keeps readers out with the rollback journal, with WAL
+            # it takes the same lock as any other write
+            db.execute("BEGIN EXCLUSIVE")
+            db.execute("UPDATE Rooms SET description = description WHERE id = ?", (roomid,))
+            time.sleep(HOLD)
+            db.execute("COMMIT")
+            holds += 1
+        except Exception as exception:
+            errors.append(str(exception))
+        time.sleep(HOLD_PAUSE)
+    db.close()
+    results.put((holds, errors))
+
+
+def client(dbpath, config, number, roomid, duration, start_at, results):
+    try:
+        storage.initialize(dbpath, flush_interval=0, config=config)
+        playerid = storage.register_player(f"multiclient {number}", 50)
+    except Exception as exception:
+        # the result must arrive anyway, or run() waits forever
+        results.put(([], [f"starting client {number}: {exception}"]))
+        return
+    revision = None
+    latencies = []
+    errors = []
+
+    while time.time() < start_at:
+        time.sleep(0.001)
+    end_at = start_at + duration
+    while time.time() < end_at:
+        try:
+            start = time.perf_counter()
+            revision = storage.get_room_changes_since(roomid, revision).revision
+            latencies.append(time.perf_counter() - start)
+            if len(latencies) % POLLS_PER_MOVE == 0:
+                # every move is written through, no buffering
+                storage.set_player_location(playerid, roomid, len(latencies) % 15 + 15)
+        except Exception as exception:
+            errors.append(str(exception))
+        time.sleep(POLL_PAUSE)
+    try:
+        storage.finalize()
+    except Exception as exception:
+        errors.append(str(exception))
+    results.put((latencies, errors))
+
+
+def run(dbpath, config, roomid, clients, duration):
+    """
+    Returns the poll latencies of the given number of clients while the writer
+    holds the write lock, the number of times it did and the errors of all.
+    """
+    results = multiprocessing.Queue()
+    writer_results = multiprocessing.Queue()
+    # registering takes a moment, all processes start at the same time
+    start_at = time.time() + 1.0
+    workers = [multiprocessing.Process(target=client, args=(dbpath, config, i, roomid, duration, start_at, results))
+               for i in range(clients)]
+    workers.append(multiprocessing.Process(target=writer, args=(dbpath, roomid, duration, start_at, writer_results)))
+    for worker in workers:
+        worker.start()
+    latencies = []
+    errors = []
+    for _ in range(clients):
+        worker_latencies, worker_errors = results.get()
+        latencies.extend(worker_latencies)
+        errors.extend(worker_errors)
+    holds, writer_errors = writer_results.get()
+    errors.extend(writer_errors)
+    for worker in workers:
+        worker.join()
+    return latencies, holds, errors
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+
+    worst = {}
+    errors = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, config in CONFIGS.items():
+            dbpath = os.path.join(tmpdir, f"{name}.db")
+            shutil.copy(os.path.join(BASEDIR, storage.DATABASE_PATH), dbpath)
+            # also switches the file to the journal mode of the run
+            storage.initialize(dbpath, config=config)
+            roomid = storage.get_room_ids()[0]
+            storage.finalize()
+
+            latencies, holds, run_errors = run(dbpath, config, roomid, clients, duration)
+            latencies.sort()
+            worst[name] = latencies[-1] if latencies else 0
+            errors.extend(run_errors)
+            median = latencies[len(latencies) // 2] if latencies else 0
+            print(f"{name}: {clients} clients, {len(latencies) / duration:.0f} polls/s, "
+                  f"median {median * 1000:.1f} ms, worst {worst[name] * 1000:.1f} ms, "
+                  f"write lock held {holds} times, {len(run_errors)} errors")
+
+    locked = [error for error in errors if "locked" in error.lower()]
+    assert not locked, f"{len(locked)} lock errors, the first: {locked[0]}"
+    assert not errors, f"{len(errors)} errors, the first: {errors[0]}"
+    assert worst['rollback journal'] >= HOLD / 2, \
+        f"without WAL no poll waited for the writer ({worst['rollback journal'] * 1000:.1f} ms), the check proves nothing"
+    assert worst['WAL'] < HOLD / 2, \
+        f"with WAL a poll waited {worst['WAL'] * 1000:.1f} ms for the writer holding the lock {HOLD * 1000:.0f} ms"
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+A stand-in for the MySQLdb driver (mysqlclient), so backendtest.py can check
+the statements of MySQLBackend without a MySQL or MariaDB server. It only
+checks the shape of the statements; whether they behave correctly is checked
+against a server with backendtest.py mysql-server.
+
+The "database" given to connect() is a sqlite file. Every statement is
+checked for what MySQLdb and MySQL would reject and then translated to sqlite:
+
+- parameters are %s placeholders formatted like MySQLdb does, a ? placeholder
+  or a parameter count that doesn't match is an error
+- sqlite-only syntax (ON CONFLICT, excluded., AUTOINCREMENT, INSERT OR ...,
+  EXPLAIN QUERY PLAN, BEGIN, PRAGMA) is an error
+- CREATE TABLE with AUTO_INCREMENT and inline INDEX/UNIQUE INDEX definitions,
+  CREATE OR REPLACE VIEW, ON DUPLICATE KEY UPDATE with VALUES(column),
+  NOW(), EXPLAIN and START TRANSACTION are translated
+- SELECT ... FOR UPDATE is only allowed inside a transaction
+- SELECT GET_LOCK() and RELEASE_LOCK() take and release a lock file next to
+  the database, so named locks work across processes
+
+What it doesn't do like MySQL:
+
+- there are no row locks. Transactions take the sqlite write lock right away,
+  which serializes all of them, not only those locking the same rows.
+- for UPDATE, MySQL counts the rows actually changed while sqlite counts the
+  rows matched
+- AUTO_INCREMENT and index definitions are only translated, not checked
+  against the column types and key lengths MySQL requires
+"""
+import fcntl
+import os
+import re
+import sqlite3
+import time
+
+apilevel = "2.0"
+threadsafety = 1
+paramstyle = "format"
+
+
+class Error(Exception):
+    pass
+
+class DatabaseError(Error):
+    pass
+
+class OperationalError(DatabaseError):
+    pass
+
+class IntegrityError(DatabaseError):
+    pass
+
+class ProgrammingError(DatabaseError):
+    pass
+
+
+# syntax sqlite understands but MySQL doesn't
+SQLITE_ONLY = [r"\bON\s+CONFLICT\b", r"\bexcluded\.", r"\bAUTOINCREMENT\b", r"\bINSERT\s+OR\b",
+               r"\bEXPLAIN\s+QUERY\s+PLAN\b", r"^\s*BEGIN\b", r"^\s*PRAGMA\b", r"\bCREATE\s+VIEW\s+IF\b"]
+
+CREATE_TABLE = re.compile(r"^\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?(\w+)\s*\((.*)\)\s*$", re.I | re.S)
+INLINE_INDEX = re.compile(r"^(UNIQUE\s+)?(?:INDEX|KEY)\s+(\w+)\s*\(([^)]*)\)$", re.I)
+CREATE_OR_REPLACE_VIEW = re.compile(r"^\s*CREATE\s+OR\s+REPLACE\s+VIEW\s+(\w+)\s+AS\s+(.*)$", re.I | re.S)
+FOR_UPDATE = re.compile(r"\s+FOR\s+UPDATE\s*$", re.I)
+# name -> (process id, connection) of the named locks held in this process
+_lock_owners = {}
+
+NAMED_LOCK = re.compile(r"^\s*SELECT\s+(GET_LOCK|RELEASE_LOCK)\(\s*%s\s*(,\s*%s\s*)?\)\s*$", re.I)
+
+
+def connect(host="localhost", user=None, password=None, database=None, port=3306, **kwargs):
+    if database is None:
+        raise OperationalError("No database selected")
+    return Connection(database)
+
+
+def _format(query, args):
+    """
+    Checks the placeholders like MySQLdb's query % args would and returns the
+    query with sqlite placeholders.
+    """
+    if "?" in re.sub(r"'[^']*'", "", query):
+        raise ProgrammingError(f"MySQL has no ? placeholders: {query}")
+    if args is None:
+        return query
+    placeholders = re.findall(r"%(.)", query)
+    if any(kind not in "s%" for kind in placeholders):
+        raise ProgrammingError(f"Unsupported format character in: {query}")
+    count = placeholders.count("s")
+    if count != len(args):
+        raise ProgrammingError(f"{count} placeholders but {len(args)} parameters in: {query}")
+    return query.replace("%s", "?").replace("%%", "%")
+
+
+def _split_definitions(body):
+    """
+    Splits the body of a CREATE TABLE at the commas outside of parentheses.
+    """
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(body):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(body[start:i].strip())
+            start = i + 1
+    parts.append(body[start:].strip())
+    return parts
+
+
+def _translate_create_table(match, table_exists):
+    if_not_exists, table, body = match.groups()
+    if if_not_exists and table_exists(table):
+        # MySQL doesn't look at the definition, inline indexes included
+        return []
+    columns, indexes = [], []
+    for definition in _split_definitions(body):
+        index = INLINE_INDEX.match(definition)
+        if index:
+            unique, name, indexcolumns = index.groups()
+            indexes.append(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({indexcolumns})")
+            continue
+        if re.search(r"\bAUTO_INCREMENT\b", definition, re.I):
+            if not re.search(r"\bINTEGER\b.*\bAUTO_INCREMENT\s+PRIMARY\s+KEY\b", definition, re.I):
+                raise ProgrammingError(f"Unsupported AUTO_INCREMENT column: {definition}")
+            definition = re.sub(r"\bAUTO_INCREMENT\s+PRIMARY\s+KEY\b", "PRIMARY KEY AUTOINCREMENT", definition,
+                                flags=re.I)
+        columns.append(definition)
+    return [f"CREATE TABLE {if_not_exists or ''}{table} ({', '.join(columns)})"] + indexes
+
+
+def _translate(query, in_transaction, table_exists):
+    """
+    Returns the sqlite statements for a MySQL statement.
+    """
+    for pattern in SQLITE_ONLY:
+        if re.search(pattern, query, re.I):
+            raise ProgrammingError(f"You have an error in your SQL syntax (sqlite only): {query}")
+    if re.fullmatch(r"\s*START\s+TRANSACTION\s*", query, re.I):
+        return ["BEGIN IMMEDIATE"]
+    match = CREATE_TABLE.match(query)
+    if match:
+        return _translate_create_table(match, table_exists)
+    match = CREATE_OR_REPLACE_VIEW.match(query)
+    if match:
+        return [f"DROP VIEW IF EXISTS {match.group(1)}", f"CREATE VIEW {match.group(1)} AS {match.group(2)}"]
+
+    if FOR_UPDATE.search(query):
+        if not in_transaction:
+            raise ProgrammingError(f"FOR UPDATE outside of a transaction locks nothing: {query}")
+        query = FOR_UPDATE.sub("", query)
+    query = re.sub(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", "ON CONFLICT DO UPDATE SET", query, flags=re.I)
+    query = re.sub(r"\bVALUES\((\w+)\)", r"excluded.\1", query, flags=re.I)
+    query = re.sub(r"\bNOW\(\)", "strftime('%Y-%m-%d %H:%M:%S', 'now')", query, flags=re.I)
+    query = re.sub(r"^\s*EXPLAIN\s+", "EXPLAIN QUERY PLAN ", query, flags=re.I)
+    return [query]
+
+
+class Connection:
+
+    def __init__(self, path):
+        # transactions are handled here, like the server does
+        self._db = sqlite3.connect(path, isolation_level=None, timeout=10, check_same_thread=False)
+        self._path = path
+        self._autocommit = False
+        # name -> open lock file of the named locks held by this connection
+        self._named_locks = {}
+
+    def get_lock(self, name, timeout):
+        if name in self._named_locks:
+            return 1
+        deadline = time.monotonic() + timeout
+        while True:
+            # POSIX locks belong to the process, other connections of this
+            # process are kept out by _lock_owners
+            owner = _lock_owners.get(name)
+            if owner is None or owner[0] != os.getpid():
+                file = open(f"{self._path}.{name}.lock", "w")
+                try:
+                    fcntl.lockf(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    file.close()
+                else:
+                    _lock_owners[name] = (os.getpid(), self)
+                    self._named_locks[name] = file
+                    return 1
+            if time.monotonic() >= deadline:
+                return 0
+            time.sleep(0.01)
+
+    def release_lock(self, name):
+        file = self._named_locks.pop(name, None)
+        if file is None:
+            return 0
+        del _lock_owners[name]
+        file.close()
+        return 1
+
+    def autocommit(self, on):
+        if on and self._db.in_transaction:
+            self._db.execute("COMMIT")
+        self._autocommit = bool(on)
+
+    def cursor(self):
+        return Cursor(self)
+
+    def commit(self):
+        if self._db.in_transaction:
+            self._db.execute("COMMIT")
+
+    def rollback(self):
+        if self._db.in_transaction:
+            self._db.execute("ROLLBACK")
+
+    def close(self):
+        for name in list(self._named_locks):
+            self.release_lock(name)
+        self._db.close()
+
+
+class Cursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._db.cursor()
+        self.rowcount = -1
+        self.lastrowid = None
+        self._lock_result = None
+
+    def execute(self, query, args=None):
+        db = self.connection._db
+        self._lock_result = None
+        match = NAMED_LOCK.match(query)
+        if match:
+            return self._named_lock(match, query, args)
+        statements = _translate(_format(query, args), db.in_transaction, self._table_exists)
+        starts_transaction = statements[:1] == ["BEGIN IMMEDIATE"]
+        if re.match(r"\s*(CREATE|ALTER|DROP)\b", query, re.I) or starts_transaction:
+            # DDL and START TRANSACTION commit the current transaction on MySQL
+            if db.in_transaction:
+                db.execute("COMMIT")
+        elif not self.connection._autocommit and not db.in_transaction:
+            db.execute("BEGIN")
+        try:
+            for statement in statements:
+                self._cursor.execute(statement, args or ())
+        except sqlite3.IntegrityError as exception:
+            raise IntegrityError(str(exception)) from exception
+        except sqlite3.OperationalError as exception:
+            raise OperationalError(f"{exception}: {query}") from exception
+        except sqlite3.Error as exception:
+            raise ProgrammingError(f"{exception}: {query}") from exception
+        self.rowcount = self._cursor.rowcount
+        self.lastrowid = self._cursor.lastrowid
+        return self.rowcount
+
+    def _named_lock(self, match, query, args):
+        """
+        GET_LOCK and RELEASE_LOCK, with a lock file next to the database so
+        they work across processes like the named locks of the server.
+        """
+        function, timeout = match.groups()
+        count = 2 if timeout else 1
+        if args is None or len(args) != count:
+            raise ProgrammingError(f"{count} placeholders but {len(args or ())} parameters in: {query}")
+        if function.upper() == "GET_LOCK":
+            result = self.connection.get_lock(args[0], args[1])
+        else:
+            result = self.connection.release_lock(args[0])
+        self._lock_result = [(result,)]
+        self.rowcount = 1
+        return self.rowcount
+
+    def _table_exists(self, table):
+        QUERY = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ? COLLATE NOCASE"
+        return self.connection._db.execute(QUERY, (table,)).fetchone() is not None
+
+    def executemany(self, query, args):
+        rowcount = 0
+        for row in args:
+            rowcount += max(0, self.execute(query, row))
+        self.rowcount = rowcount
+        return rowcount
+
+    def fetchone(self):
+        if self._lock_result is not None:
+            return self._lock_result.pop(0) if self._lock_result else None
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        if self._lock_result is not None:
+            rows, self._lock_result = tuple(self._lock_result), []
+            return rows
+        return tuple(self._cursor.fetchall())
+
+    def close(self):
+        self._cursor.close()
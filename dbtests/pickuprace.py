@@ -0,0 +1,75 @@
+## Lets several game processes try to pick up the same object at the same time,
+## the race condition described in doc/Syncproblems-Raceconditions. Every round
+## exactly one process must get the object, and the inventories must contain 
+## exactly one object per round.
+##
+##     python pickuprace.py [processes] [rounds]
+import os.path, sys, tempfile, time
+import multiprocessing
+from types import SimpleNamespace
+
+BASEDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, BASEDIR)
+
+import storage
+
+OBJECT_ID = 45
+TILE_INDEX = 7
+
+
+def player(dbpath, number, roomid, rounds, barrier, results):
+    storage.initialize(dbpath)
+    playerid = storage.register_player(f"racer {number}", 50)
+    won = 0
+    for _ in range(rounds):
+        # everybody starts grabbing at the same moment
+        barrier.wait()
+        if storage.take_object(playerid, roomid, TILE_INDEX) is not None:
+            won += 1
+        barrier.wait()
+        if number == 0:
+            storage.add_object_to_room(roomid, TILE_INDEX, OBJECT_ID)
+        barrier.wait()
+    results.put((playerid, won))
+    storage.finalize()
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dbpath = os.path.join(tmpdir, "race.db")
+        storage.initialize(dbpath)
+        objectmap = [None] * 225
+        objectmap[TILE_INDEX] = OBJECT_ID
+        roomid = storage.store_new_room("race", SimpleNamespace(mapsize=(15, 15), tilemap=[22] * 225, 
+                                                                objectmap=objectmap))
+        storage.finalize()
+
+        barrier = multiprocessing.Barrier(processes)
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=player, args=(dbpath, i, roomid, rounds, barrier, results))
+                   for i in range(processes)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        wins = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        storage.initialize(dbpath)
+        inventory = sum(len(storage.get_player_inventory_objects(playerid)) for playerid, won in wins)
+        storage.finalize()
+
+    total = sum(won for playerid, won in wins)
+    print(f"{processes} processes, {rounds} rounds in {elapsed:.2f} s")
+    print("objects picked up per player:", [won for playerid, won in wins])
+    assert total == rounds, f"{total} pickups in {rounds} rounds"
+    assert inventory == rounds, f"{inventory} objects in inventories after {rounds} rounds"
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
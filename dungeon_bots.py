@@ -0,0 +1,201 @@
+"""
+A headless load generator: bot players walking through the dungeon, to find
+out how many players the storage can carry.
+
+The bots are spread over several processes, each with its own storage
+connection, like separate dungeon_game.py instances. Every bot registers as a
+player, polls its room like the game does, walks around at random following
+the same rules as GameWorld (see roomgrid.py), picks up every object it steps
+on and follows the portals it walks into. At the end the moves per second,
+the latency percentiles of every storage call and the number of lock errors
+are reported.
+
+    python dungeon_bots.py [--bots 20] [--processes 4] [--duration 10] [--db path]
+
+Without --db the bots work on a temporary copy of the default database. Use
+--flush-interval 0 to write every move through instead of buffering them.
+"""
+import argparse
+import multiprocessing
+import os.path
+import random
+import shutil
+import tempfile
+import time
+
+import storage
+from roomgrid import RoomGrid
+
+# Seconds between two moves of the same bot, like a player holding down a key.
+# 0 lets the bots move as fast as the storage allows.
+MOVE_INTERVAL = 0.1
+
+PERCENTILES = (50, 95, 99)
+
+
+class Bot:
+
+    def __init__(self, number, catalog, timed):
+        self.catalog = catalog
+        self.timed = timed
+        self.playerid = timed("register_player", storage.register_player, f"bot {number}", 50)
+        roomid, self.position = timed("get_player_location", storage.get_player_location, self.playerid)
+        self.enter_room(roomid, self.position)
+        self.next_move = 0
+
+    def enter_room(self, roomid, position):
+        layout = self.timed("load_room_layout", storage.load_room_layout, roomid)
+        self.roomid = roomid
+        self.position = position
+        self.width = layout.size[0]
+        self.grid = RoomGrid(self.catalog, layout.tiles, layout.connections)
+        self.objects = [None] * len(layout.tiles)
+        self.revision = None
+
+    def poll(self):
+        changes = self.timed("get_room_changes_since", storage.get_room_changes_since, self.roomid, self.revision)
+        if changes.resync:
+            self.objects = [None] * len(self.objects)
+        for objectid, tileindex in changes.objects_added:
+            self.objects[tileindex] = objectid
+        for tileindex in changes.objects_removed:
+            self.objects[tileindex] = None
+        self.revision = changes.revision
+
+    def step(self) -> bool:
+        """
+        Tries to move to a random neighbouring cell. Returns True if the bot moved.
+        """
+        self.poll()
+        moves = [-self.width, self.width]
+        # no wrapping around at the left and right border
+        if self.position % self.width > 0:
+            moves.append(-1)
+        if self.position % self.width < self.width - 1:
+            moves.append(1)
+        target = self.position + random.choice(moves)
+        if not self.grid.can_walk_to(target):
+            return False
+        self.position = target
+        portal = self.grid.get_portal(target)
+        if portal is not None:
+            self.enter_room(*portal)
+        self.timed("set_player_location", storage.set_player_location, self.playerid, self.roomid, self.position)
+        if portal is None and self.objects[self.position] is not None:
+            self.timed("take_object", storage.take_object, self.playerid, self.roomid, self.position)
+            self.objects[self.position] = None
+        return True
+
+
+def run_bots(dbpath, flush_interval, first, count, duration, move_interval, start_at, results):
+    """
+    Runs count bots in this process and puts the statistics into results.
+    """
+    latencies = {}
+    errors = {'lock': 0, 'other': 0}
+
+    def timed(name, function, *args):
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        except Exception as exception:
+            # sqlite: "database is locked", MySQL: "Lock wait timeout exceeded" / "Deadlock found"
+            errors['lock' if "lock" in str(exception).lower() else 'other'] += 1
+            raise
+        finally:
+            latencies.setdefault(name, []).append(time.perf_counter() - start)
+
+    storage.initialize(dbpath, flush_interval=flush_interval)
+    catalog = storage.load_tile_catalog()
+    bots = [Bot(number, catalog, timed) for number in range(first, first + count)]
+    moves = attempts = 0
+
+    while time.time() < start_at:
+        time.sleep(0.001)
+    end_at = time.time() + duration
+    while time.time() < end_at:
+        now = time.time()
+        for bot in bots:
+            if now < bot.next_move:
+                continue
+            bot.next_move = now + move_interval
+            attempts += 1
+            try:
+                if bot.step():
+                    moves += 1
+            except Exception:
+                pass
+        if move_interval:
+            time.sleep(min(move_interval, 0.005))
+
+    for bot in bots:
+        storage.set_player_offline(bot.playerid)
+    storage.finalize()
+    results.put((moves, attempts, latencies, errors))
+
+
+def percentile(sorted_values, percent):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless bot players for load tests")
+    parser.add_argument("--bots", type=int, default=20)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--move-interval", type=float, default=MOVE_INTERVAL, help="seconds between moves of a bot")
+    parser.add_argument("--flush-interval", type=float, default=storage.LOCATION_FLUSH_INTERVAL,
+                        help="seconds player locations are buffered")
+    parser.add_argument("--db", help="sqlite database file, a copy of the default database if missing")
+    args = parser.parse_args()
+
+    tmpdir = None
+    dbpath = args.db
+    if dbpath is None:
+        tmpdir = tempfile.mkdtemp()
+        dbpath = os.path.join(tmpdir, "bots.db")
+        shutil.copy(storage.DATABASE_PATH, dbpath)
+    try:
+        processcount = max(1, min(args.processes, args.bots))
+        results = multiprocessing.Queue()
+        # registering the bots takes a while, they all start walking at the same time
+        start_at = time.time() + 1.0 + args.bots * 0.02
+        processes = []
+        for i in range(processcount):
+            first = args.bots * i // processcount
+            count = args.bots * (i + 1) // processcount - first
+            processes.append(multiprocessing.Process(target=run_bots, args=(
+                dbpath, args.flush_interval, first, count, args.duration, args.move_interval, start_at, results)))
+        for process in processes:
+            process.start()
+
+        moves = attempts = 0
+        latencies = {}
+        errors = {'lock': 0, 'other': 0}
+        for _ in processes:
+            process_moves, process_attempts, process_latencies, process_errors = results.get()
+            moves += process_moves
+            attempts += process_attempts
+            for name, values in process_latencies.items():
+                latencies.setdefault(name, []).extend(values)
+            for kind, count in process_errors.items():
+                errors[kind] += count
+        for process in processes:
+            process.join()
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+    print(f"{args.bots} bots in {processcount} processes for {args.duration:.0f} s")
+    print(f"moves/s: {moves / args.duration:.0f} ({attempts} attempts, {moves} moves)")
+    print(f"lock errors: {errors['lock']}, other errors: {errors['other']}")
+    print(f"{'storage call':<24} {'calls':>7}" + "".join(f" {f'p{p} ms':>8}" for p in PERCENTILES) + f" {'max ms':>8}")
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        print(f"{name:<24} {len(values):>7}" + "".join(f" {percentile(values, p) * 1000:>8.2f}" for p in PERCENTILES)
+              + f" {values[-1] * 1000:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-import sys, os.path, pygame.transform
+import sys, os.path, pygame
+from types import SimpleNamespace
 sys.path.append((os.path.join(sys.path[0], "graphics2d")))
 
 from graphics2d import *
@@ -7,7 +8,9 @@ from popups import open_inputbox
 from graphics2d.scenetree.label import Label
 from graphics2d.scenetree.canvascontainer import CanvasContainer
 from tileatlas import TileAtlas
+import atlascache
 from tilemap import TileMap
+from storageworker import StorageWorker
 import storage
 
 
@@ -15,6 +18,8 @@ import storage
 # application on a low resolution monitor, change this to 1.5, 2 or 2.5
 # as needed.
 ATLAS_SCALE = 2
+# Scale the tile atlas with smoothscale instead of keeping the pixels sharp
+SMOOTH_SCALING = False
 
 # Initial size of the window
 WIDTH = 1060
@@ -39,11 +44,33 @@ status_label = None
 # Storage id of the room that's currently being edited
 active_room_id = None
 
+# all storage calls go through this worker, so editing never blocks on the database
+storage_worker = StorageWorker()
+
 def on_draw():
     # Give the window a background color
     get_window_surface().fill(Color(70, 70, 70))
 
 
+def on_update(dt):
+    # results of storage requests are applied here, on the main thread
+    storage_worker.process_results()
+
+
+def copy_of_tilemap():
+    """
+    Returns a copy of the room being edited that can safely be handed to the 
+    storage worker while editing goes on.
+    """
+    return SimpleNamespace(mapsize=tilemap.mapsize, tilemap=list(tilemap.tilemap), 
+                           objectmap=list(tilemap.objectmap))
+
+
+def on_room_stored(result):
+    status_label.set_text(f"Saved room with id {active_room_id}")
+    get_scenetree().request_redraw_all()
+
+
 def on_input(event):     
     # handle keyboard shortcuts for loading/saving rooms
     if event.type == KEYDOWN and event.key == pygame.K_n:
@@ -54,32 +81,41 @@ def on_input(event):
         
 
     if event.type == KEYDOWN and event.key == pygame.K_s:
-        defer_to_next_frame(lambda: storage.store_room(active_room_id, tilemap))
+        storage_worker.submit(storage.store_room, active_room_id, copy_of_tilemap(), callback=on_room_stored)
 
 
 def on_roomname_entered(prompt, text):
+    storage_worker.submit(storage.store_new_room, text, copy_of_tilemap(), callback=on_room_created)
+
+
+def on_room_created(room_id):
     global active_room_id    
-    active_room_id = storage.store_new_room(text, tilemap)
+    active_room_id = room_id
     status_label.set_text(f"Created new room with id {active_room_id}")
     tree = get_scenetree()    
     tree.request_redraw_all()
 
 
 def on_load_id_entered(prompt, text):
-    global active_room_id
     try:
-        active_room_id = int(text)
-        tilemap_data = storage.load_tilemap_data(active_room_id)
-        if tilemap_data:
-            tilemap.tilemap = tilemap_data[0]
-            tilemap.objectmap = tilemap_data[1]
-            tilemap.request_redraw()
+        room_id = int(text)
     except ValueError:
-        pass
-    finally:
-        status_label.text = f"Current room has id {active_room_id}"
-        tree = get_scenetree()
-        tree.request_redraw_all()
+        return
+    storage_worker.submit(storage.load_tilemap_data, room_id, 
+                          callback=lambda tilemap_data: on_room_loaded(room_id, tilemap_data),
+                          errback=lambda exception: on_room_loaded(room_id, None))
+
+
+def on_room_loaded(room_id, tilemap_data):
+    global active_room_id
+    active_room_id = room_id
+    if tilemap_data:
+        tilemap.set_tilemap(tilemap_data[0])
+        tilemap.objectmap = tilemap_data[1]
+        tilemap.request_redraw()
+    status_label.text = f"Current room has id {active_room_id}"
+    tree = get_scenetree()
+    tree.request_redraw_all()
     
 
 
@@ -88,9 +124,8 @@ def initialize_gui():
 
     path = "resources/ohmydungeon_v1.1.png"
     try:
-        tile_image = load_image(path)
-        size = (tile_image.get_width()*ATLAS_SCALE, tile_image.get_height()*ATLAS_SCALE)
-        tile_image = pygame.transform.scale(tile_image, size)
+        # scaled once, later starts load it from the cache in .cache/atlas
+        tile_image = atlascache.load_scaled_image(path, ATLAS_SCALE, SMOOTH_SCALING)
 
     except FileNotFoundError:
         print(f"Tile Atlas image not found at {path}...")
@@ -98,13 +133,13 @@ def initialize_gui():
 
     set_window_title("Dungeon Editor")
 
-    objectids = storage.get_tile_object_ids()
+    tile_catalog = storage_worker.call(storage.load_tile_catalog, ATLAS_ID)
 
     # Atlas aus Bild erzeugen und positionieren
     tile_atlas = TileAtlas(tilesize=(16*ATLAS_SCALE,16*ATLAS_SCALE), atlassize=(6,15), image=tile_image, flags=G2D.V_ALIGN_CENTERED)
 
     # Die tilemap erzeugen 
-    tilemap = TileMap(mapsize=MAPSIZE, atlas=tile_atlas, objectids=objectids, flags=G2D.V_ALIGN_CENTERED) 
+    tilemap = TileMap(mapsize=MAPSIZE, atlas=tile_atlas, catalog=tile_catalog, flags=G2D.V_ALIGN_CENTERED) 
     
     tree = get_scenetree()
     
@@ -136,12 +171,12 @@ def on_ready():
     if min(resolution.x, resolution.y) > 1000:
         ATLAS_SCALE = 3
     
-    storage.initialize()
+    storage_worker.start()
     initialize_gui()
 
 
 def on_exit():    
-    storage.finalize()
+    storage_worker.stop()
 
 
 # Starts the framework and its event loop
@@ -1,4 +1,4 @@
-import sys, os.path, pygame.transform
+import sys, os.path, argparse
 
 BASEDIR=os.path.dirname(os.path.realpath(__file__))
 sys.path.append(os.path.join(BASEDIR, "graphics2d"))
@@ -10,8 +10,13 @@ from graphics2d.scenetree.label import Label
 from graphics2d.scenetree.notification import listen, Notification
 from popups import open_inputbox
 from tileatlas import TileAtlas
+import atlascache
 from tilemap import TileMap
 from gameworld import GameWorld
+from storageworker import StorageWorker
+from tilecatalog import TileCatalog
+from gameclient import GameClient, to_room, to_room_changes
+import protocol
 import storage
 
 RESIZABLE = True
@@ -19,6 +24,8 @@ WIDTH = 1024
 HEIGHT = 800
 
 ATLAS_SCALE = 2
+# Scale the tile atlas with smoothscale instead of keeping the pixels sharp
+SMOOTH_SCALING = False
 
 ## Currently we only use a single Tile Atlas (with the atlas id 1 in the storage backend)
 ATLAS_ID = 1
@@ -30,25 +37,97 @@ tile_image = None
 
 gameworld = None
 
-walkable_tiles = []
+# properties of the tiles in the atlas, loaded once at startup
+tile_catalog = None
 
 active_room_id = None
 
 # id of the player controlling this instance
 player_id = 0
 
-def load_room(roomid):
-    tilemap_data = storage.load_tilemap_data(roomid)
-    if tilemap_data:
-        gameworld.tilemap = tilemap_data[0]
-        gameworld.objectmap = tilemap_data[1]
-        gameworld.room_id = roomid
+# all storage calls go through this worker, so the frame loop never blocks on the database
+storage_worker = StorageWorker()
+
+# True while a poll of the room state is being carried out by the storage worker
+room_poll_pending = False
+
+# roomid -> snapshot (RoomChanges) of the rooms behind the portals of the current 
+# room. Their layouts are prefetched into the room cache of the storage module.
+neighbour_snapshots = {}
+
+# With --server HOST:PORT the game plays on a dungeon_server.py instead of using
+# the storage directly: moves and pickups are sent to the server, which pushes
+# the changes in our room back.
+parser = argparse.ArgumentParser(description="Dungeon Game")
+parser.add_argument("--server", metavar="HOST:PORT", help="play on the given dungeon_server.py")
+arguments, _ = parser.parse_known_args()
+
+game_client = None
+if arguments.server:
+    host, _, port = arguments.server.rpartition(":")
+    game_client = GameClient(host or protocol.HOST, int(port))
+
+def fetch_room(roomid):
+    """
+    Runs on the storage worker: collects everything needed to show a room.
+    """
+    # the room layout is usually served from the storage's room cache
+    layout = storage.load_room_layout(roomid)
+    # without a known revision we get a full snapshot of players and objects
+    changes = storage.get_room_changes_since(roomid, None)
+    return layout, changes
+
+
+def fetch_neighbour_rooms(roomid):
+    """
+    Runs on the storage worker: prefetches the layouts of the rooms behind the 
+    portals of the given room and returns snapshots of them.
+    """
+    return {neighbour: storage.get_room_changes_since(neighbour, None) 
+            for neighbour in storage.prefetch_neighbour_rooms(roomid)}
+
+
+def on_neighbour_rooms_fetched(roomid, snapshots):
+    # ignore results for a room we already left again
+    if roomid == gameworld.room_id:
+        neighbour_snapshots.clear()
+        neighbour_snapshots.update(snapshots)
+
+
+def show_room(room, player_position=None):
+    layout, changes = room
+    gameworld.set_tilemap(list(layout.tiles))
+    gameworld.set_room(layout.roomid)
+    gameworld.set_loading_room(False)
+    gameworld.apply_room_changes(changes)
+    gameworld.set_portals(list(layout.connections))
+    if player_position is not None:
+        gameworld.set_player_position(player_position)
+
+    gameworld.request_redraw()
+
+    neighbour_snapshots.clear()
+    if game_client is not None:
+        return
+    storage_worker.submit(fetch_neighbour_rooms, layout.roomid,
+                          callback=lambda snapshots: on_neighbour_rooms_fetched(layout.roomid, snapshots))
 
-        portals = storage.get_room_connections(roomid)
-        gameworld.set_portals(portals)
 
-        gameworld.request_redraw()
-        
+def load_room(roomid, player_position=None):
+    """
+    Loads the given room in the background and shows it once it's there.
+    """
+    # until the room is shown, gameworld.room_id is still the room we leave
+    gameworld.set_loading_room(True)
+    storage_worker.submit(fetch_room, roomid, 
+                          callback=lambda room: show_room(room, player_position),
+                          errback=on_load_room_failed)
+
+
+def on_load_room_failed(exception):
+    gameworld.set_loading_room(False)
+    print(f"Loading room failed: {exception}")
+
 
 
 def initialize_gui():
@@ -56,9 +135,6 @@ def initialize_gui():
 
     set_window_title("Dungeon Game v0.6")
 
-    objectids = storage.get_tile_object_ids()
-    walkable_tiles = storage.get_walkable_tile_ids()
-
     status_label = Label(name="label", text="Hi. I'm Dungeon Game Version 0.6. Use WASD for player movement.", flags=G2D.V_ALIGN_CENTERED)
 
     pc = PanelContainer(name="panelcontainer", bg_color=Color(30, 30, 30), borders=(0, 0), max_size=(None, 40), flags=G2D.H_EXPAND)
@@ -88,33 +164,101 @@ def initialize_gui():
 
 def on_portal_entered(gameworld, target_roomid, target_tileindex):
     print(f"Portal entered to room {target_roomid} at tile {target_tileindex}")
-    load_room(target_roomid)
-    gameworld.set_player_position(target_tileindex)
+    if game_client is not None:
+        # the server moves us and sends the new room
+        return
+    # rooms next to the current one are usually prefetched. Their snapshot may be
+    # a bit old, the next room poll brings it up to date.
+    layout = storage.peek_room_layout(target_roomid)
+    snapshot = neighbour_snapshots.get(target_roomid)
+    if layout is not None and snapshot is not None:
+        show_room((layout, snapshot), target_tileindex)
+    else:
+        load_room(target_roomid, target_tileindex)
+    # changing rooms is written through right away
+    storage_worker.submit(storage.set_player_location, gameworld.player_id, target_roomid, target_tileindex)
     
 
 def on_player_moved(gameworld, new_player_position):
-    storage.set_player_location(gameworld.player_id, gameworld.room_id, new_player_position)
-
+    if game_client is not None:
+        game_client.send_move(new_player_position)
+        return
+    storage_worker.submit(storage.set_player_location, gameworld.player_id, gameworld.room_id, new_player_position)
 
 
 def on_object_taken(gameworld, object_position, object_id):
-    storage.add_object_to_player_inventory(gameworld.player_id, object_id)
-    storage.remove_object_from_room(gameworld.room_id, object_position)
+    # the object was already removed locally; if another player was faster, 
+    # nothing ends up in our inventory and the next room poll shows the truth
+    if game_client is not None:
+        game_client.send_take(object_position)
+        return
+    storage_worker.submit(storage.take_object, gameworld.player_id, gameworld.room_id, object_position,
+                          callback=on_take_object_done)
+
+
+def on_take_object_done(object_id):
+    if object_id is None:
+        print("Someone else was faster, the object is gone")
+
+
+def poll_room(playerid, roomid, revision):
+    """
+    Runs on the storage worker: keeps the player online, writes buffered locations,
+    evicts players that stopped sending heartbeats and fetches what changed in the room.
+    """
+    storage.heartbeat(playerid)
+    storage.flush_if_due()
+    storage.sweep_stale_players()
+    return storage.get_room_changes_since(roomid, revision)
+
+
+def on_room_polled(changes):
+    global room_poll_pending
+    room_poll_pending = False
+    gameworld.apply_room_changes(changes)
+
+
+def on_room_poll_failed(exception):
+    global room_poll_pending
+    room_poll_pending = False
+    print(f"Polling room failed: {exception}")
+
+
+def on_server_message(message):
+    kind = message["type"]
+    if kind == "room":
+        show_room(to_room(message), message["position"])
+    elif kind in protocol.ROOM_CHANGE_TYPES:
+        gameworld.apply_room_changes(to_room_changes(message))
+    elif kind == "taken":
+        on_take_object_done(message["objectid"])
+    elif kind == "disconnected":
+        print("Lost the connection to the server")
+
 
 time_count = 0
 def on_update(dt):
-    global time_count
+    global time_count, room_poll_pending
+    if game_client is not None:
+        # the server pushes everything, there is nothing to poll
+        game_client.process_messages(on_server_message)
+        return
+
+    # results of storage requests are applied here, on the main thread
+    storage_worker.process_results()
+
     # dt is in ms (milliseconds)
     time_count += dt
     if time_count < 100:
         return
     
     time_count = 0
-    # do this every 100 ms (eg 10 times per second)
-    players = storage.get_players_at(gameworld.room_id)
-    objects = storage.get_objects_at(gameworld.room_id)
-    gameworld.set_players(players)
-    gameworld.set_objects(objects)
+    # do this every 100 ms (eg 10 times per second). If nobody did anything in
+    # our room, this is a single cheap query and nothing gets redrawn.
+    if not room_poll_pending and gameworld.room_id is not None:
+        room_poll_pending = True
+        storage_worker.submit(poll_room, gameworld.player_id, gameworld.room_id, gameworld.room_revision,
+                              callback=on_room_polled, errback=on_room_poll_failed)
 
         
 
@@ -122,30 +266,33 @@ def on_update(dt):
 
 
 def on_ready():
-    global ATLAS_SCALE, gameworld, tile_atlas, tile_image, player_id
+    global ATLAS_SCALE, gameworld, tile_atlas, tile_image, tile_catalog, player_id
 
     # Adjust tile size for higher resolution monitors
     resolution = get_monitor_resolution()
     if min(resolution.x, resolution.y) > 1000:
         ATLAS_SCALE = 3
     
-    storage.initialize()
+    if game_client is None:
+        storage_worker.start()
     
     path = "resources/ohmydungeon_v1.1.png"
     try:
-        tile_image = load_image(path)
-        size = (tile_image.get_width()*ATLAS_SCALE, tile_image.get_height()*ATLAS_SCALE)
-        tile_image = pygame.transform.scale(tile_image, size)
+        # scaled once, later starts load it from the cache in .cache/atlas
+        tile_image = atlascache.load_scaled_image(path, ATLAS_SCALE, SMOOTH_SCALING)
 
     except FileNotFoundError:
         print(f"Tile Atlas image not found at {path}...")
         sys.exit(1)
 
-    objectids = storage.get_tile_object_ids()
-    walkable_tiles = storage.get_walkable_tile_ids()
+    if game_client is not None:
+        welcome = game_client.connect("Berserker", 50)
+        tile_catalog = TileCatalog(welcome["atlas_id"], welcome["tiles"])
+    else:
+        tile_catalog = storage_worker.call(storage.load_tile_catalog, ATLAS_ID)
 
     tile_atlas = TileAtlas(tilesize=(16*ATLAS_SCALE,16*ATLAS_SCALE), atlassize=(6,15), image=tile_image)
-    gameworld = GameWorld(mapsize=MAPSIZE, atlas=tile_atlas, objectids=objectids, walkable_tiles=walkable_tiles,
+    gameworld = GameWorld(mapsize=MAPSIZE, atlas=tile_atlas, catalog=tile_catalog,
                           flags=G2D.H_ALIGN_CENTERED) 
     
     listen(gameworld, GameWorld.portal_entered, on_portal_entered)
@@ -153,17 +300,38 @@ def on_ready():
     listen(gameworld, GameWorld.object_taken, on_object_taken)
 
 
-    player_id = storage.register_player("Berserker", 50)
-    gameworld.set_player(player_id)
-    print(player_id, "ist meine Spieler-ID")
-    
-    room_id, player_position = storage.get_player_location(player_id)
-    load_room(room_id)
-    gameworld.set_player_position(player_position)
+    if game_client is not None:
+        # the server sends our room right after the welcome
+        player_id = welcome["player_id"]
+        gameworld.set_player(player_id)
+        print(player_id, "ist meine Spieler-ID")
+    else:
+        # during startup we can afford to wait for the database
+        player_id = storage_worker.call(storage.register_player, "Berserker", 50)
+        gameworld.set_player(player_id)
+        print(player_id, "ist meine Spieler-ID")
+        # a returning player is offline until the first heartbeat
+        storage_worker.call(storage.heartbeat, player_id)
+        storage_worker.call(storage.flush)
+        
+        room_id, player_position = storage_worker.call(storage.get_player_location, player_id)
+        show_room(storage_worker.call(fetch_room, room_id), player_position)
 
     initialize_gui()
 
     #open_inputbox("Hello World", lambda x, text:print(text))
 
+
+def on_exit():
+    if game_client is not None:
+        # the server writes our location and marks us offline
+        game_client.close()
+        return
+    # other players should not have to wait for the presence TTL to see us leave
+    storage_worker.submit(storage.set_player_offline, player_id)
+    # carries out all outstanding requests, writes the buffered player location
+    # and closes the database
+    storage_worker.stop()
+
  
 go()
@@ -0,0 +1,316 @@
+"""
+An authoritative game server for dungeon_game.py clients on the same machine.
+
+The server holds the rooms and the players in them in memory, checks and
+carries out the moves and pickups of its clients and pushes every change to
+the clients in the same room, so clients never poll the database. Changes are
+persisted through the storage module in batches every PERSIST_INTERVAL seconds.
+
+    python dungeon_server.py [--port 7777] [--db resources/default_db.db]
+    python dungeon_game.py --server 127.0.0.1:7777
+
+See protocol.py for the messages.
+"""
+import argparse
+import asyncio
+import signal
+
+import protocol
+import storage
+from roomgrid import RoomGrid
+from storagebackend import SPAWN_ROOM, SPAWN_POSITION
+from storageworker import StorageWorker
+
+# Moves, pickups and heartbeats are written to storage this often (in seconds)
+PERSIST_INTERVAL = 0.5
+
+# Changes are not sent to clients with more unsent bytes than this. Once their
+# buffer has drained, they get the whole room again instead.
+MAX_WRITE_BUFFER = 64 * 1024
+
+
+class ServerRoom:
+
+    def __init__(self, layout, objects, catalog):
+        self.roomid = layout.roomid
+        self.layout = layout
+        self.grid = RoomGrid(catalog, layout.tiles, layout.connections)
+        # object ID per cell, None for empty cells
+        self.objects = objects
+        # playerid -> tileindex
+        self.players = {}
+        self.sessions = set()
+        self.sequence = 0
+
+    def is_adjacent(self, tileindex, other):
+        width = self.layout.size[0]
+        if abs(tileindex - other) == width:
+            return True
+        return abs(tileindex - other) == 1 and tileindex // width == other // width
+
+
+class Session:
+
+    def __init__(self, writer):
+        self.writer = writer
+        # drain() waits until the buffer is below MAX_WRITE_BUFFER again
+        writer.transport.set_write_buffer_limits(high=MAX_WRITE_BUFFER)
+        self.player_id = None
+        self.room = None
+        # set when changes were dropped, the client gets the whole room once its buffer has drained
+        self.needs_resync = False
+        self.resync_task = None
+
+    def send(self, message):
+        self.writer.write(protocol.encode(message))
+
+
+def persist_batch(moves, takes, online):
+    """
+    Runs on the storage worker: writes the moves and pickups collected since
+    the last batch and keeps the connected players online.
+    """
+    for playerid, (roomid, tileindex) in moves.items():
+        storage.set_player_location(playerid, roomid, tileindex)
+    for playerid, roomid, tileindex in takes:
+        if storage.take_object(playerid, roomid, tileindex) is None:
+            print(f"Object at {tileindex} in room {roomid} was already gone in storage")
+    for playerid in online:
+        storage.heartbeat(playerid)
+    storage.flush()
+
+
+def fetch_room(roomid):
+    """
+    Runs on the storage worker: loads the layout and the objects of a room.
+    """
+    layout = storage.load_room_layout(roomid)
+    snapshot = storage.get_room_changes_since(roomid, None)
+    return layout, snapshot.objects_added
+
+
+class GameServer:
+
+    def __init__(self, worker, persist_interval=PERSIST_INTERVAL):
+        self.worker = worker
+        self.persist_interval = persist_interval
+        self.catalog = None
+        # roomid -> ServerRoom, rooms are loaded when the first player enters them
+        self.rooms = {}
+        self.sessions = set()
+        # playerid -> (roomid, tileindex) and (playerid, roomid, tileindex) not yet persisted
+        self._pending_moves = {}
+        self._pending_takes = []
+
+    async def storage_call(self, function, *args):
+        return await asyncio.wrap_future(self.worker.run(function, *args))
+
+    async def serve(self, host=protocol.HOST, port=protocol.PORT):
+        self.catalog = await self.storage_call(storage.load_tile_catalog)
+        server = await asyncio.start_server(self._handle_client, host, port)
+        print(f"Dungeon server listening on {host}:{port}")
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+        except NotImplementedError:
+            # not available on Windows, use Ctrl+C there
+            pass
+        async with server:
+            persisting = asyncio.create_task(self._persist_regularly())
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                # stopped by SIGTERM or Ctrl+C
+                pass
+            finally:
+                persisting.cancel()
+                await self.persist()
+
+    async def persist(self):
+        """
+        Writes everything that changed since the last call to storage.
+        """
+        moves, self._pending_moves = self._pending_moves, {}
+        takes, self._pending_takes = self._pending_takes, []
+        online = [session.player_id for session in self.sessions if session.player_id is not None]
+        await self.storage_call(persist_batch, moves, takes, online)
+
+    async def _persist_regularly(self):
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            try:
+                await self.persist()
+            except Exception as exception:
+                print(f"Persisting failed: {exception}")
+
+    async def _handle_client(self, reader, writer):
+        session = Session(writer)
+        self.sessions.add(session)
+        try:
+            while True:
+                message = await protocol.read_message(reader)
+                if message is None:
+                    break
+                await self._dispatch(session, message)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, KeyError, TypeError) as exception:
+            print(f"Dropping client of player {session.player_id}: {exception}")
+        finally:
+            self.sessions.discard(session)
+            if session.resync_task is not None:
+                session.resync_task.cancel()
+            await self._disconnect(session)
+            writer.close()
+
+    async def _dispatch(self, session, message):
+        kind = message.get("type")
+        if kind == "hello":
+            await self._hello(session, message["name"], message["skin"])
+        elif session.player_id is None:
+            raise ValueError("expected hello")
+        elif kind == "move":
+            await self._move(session, message["tileindex"])
+        elif kind == "take":
+            self._take(session, message["tileindex"])
+        elif kind == "resync":
+            if session.room is not None and session.room.roomid == message["roomid"]:
+                self._send_room(session)
+        else:
+            raise ValueError(f"unknown message type {kind}")
+
+    async def _hello(self, session, name, skin):
+        playerid = await self.storage_call(storage.register_player, name, skin)
+        roomid, tileindex = await self.storage_call(storage.get_player_location, playerid)
+        if roomid is None:
+            roomid, tileindex = SPAWN_ROOM, SPAWN_POSITION
+        session.player_id = playerid
+        session.send({"type": "welcome", "player_id": playerid, "atlas_id": self.catalog.atlas_id,
+                      "tiles": self.catalog.get_properties()})
+        await self._enter_room(session, roomid, tileindex)
+
+    async def _move(self, session, tileindex):
+        room = session.room
+        current = room.players[session.player_id]
+        if not room.is_adjacent(tileindex, current) or not room.grid.can_walk_to(tileindex):
+            # put the client back where we think it is
+            self._send_room(session)
+            return
+        room.players[session.player_id] = tileindex
+        self._pending_moves[session.player_id] = (room.roomid, tileindex)
+        self._broadcast(room, {"type": "player_moved", "playerid": session.player_id, "tileindex": tileindex})
+        portal = room.grid.get_portal(tileindex)
+        if portal is not None:
+            await self._enter_room(session, *portal)
+
+    def _take(self, session, tileindex):
+        room = session.room
+        objectid = None
+        if room.players[session.player_id] == tileindex and room.objects[tileindex] is not None:
+            objectid = room.objects[tileindex]
+            room.objects[tileindex] = None
+            self._pending_takes.append((session.player_id, room.roomid, tileindex))
+            self._broadcast(room, {"type": "object_removed", "tileindex": tileindex})
+        session.send({"type": "taken", "tileindex": tileindex, "objectid": objectid})
+
+    async def _enter_room(self, session, roomid, tileindex):
+        self._leave_room(session)
+        room = await self._get_room(roomid)
+        session.room = room
+        room.sessions.add(session)
+        room.players[session.player_id] = tileindex
+        self._pending_moves[session.player_id] = (roomid, tileindex)
+        self._broadcast(room, {"type": "player_moved", "playerid": session.player_id, "tileindex": tileindex},
+                        exclude=session)
+        self._send_room(session)
+
+    def _leave_room(self, session):
+        room = session.room
+        if room is None:
+            return
+        session.room = None
+        room.sessions.discard(session)
+        room.players.pop(session.player_id, None)
+        self._broadcast(room, {"type": "player_left", "playerid": session.player_id})
+
+    async def _get_room(self, roomid):
+        room = self.rooms.get(roomid)
+        if room is None:
+            layout, objects = await self.storage_call(fetch_room, roomid)
+            # another client may have loaded it in the meantime
+            room = self.rooms.get(roomid)
+            if room is None:
+                objectmap = [None] * len(layout.tiles)
+                for objectid, tileindex in objects:
+                    objectmap[tileindex] = objectid
+                room = ServerRoom(layout, objectmap, self.catalog)
+                self.rooms[roomid] = room
+        return room
+
+    async def _disconnect(self, session):
+        if session.player_id is None:
+            return
+        self._leave_room(session)
+        # the worker carries out requests in order, the last location is written first
+        await self.persist()
+        await self.storage_call(storage.set_player_offline, session.player_id)
+
+    def _send_room(self, session):
+        room = session.room
+        session.send({
+            "type": "room", "roomid": room.roomid, "sequence": room.sequence,
+            "size": room.layout.size, "tiles": room.layout.tiles, "portals": room.layout.connections,
+            "objects": [(objectid, tileindex) for tileindex, objectid in enumerate(room.objects)
+                        if objectid is not None],
+            "players": list(room.players.items()),
+            "position": room.players[session.player_id]
+        })
+
+    def _broadcast(self, room, message, exclude=None):
+        room.sequence += 1
+        message["roomid"] = room.roomid
+        message["sequence"] = room.sequence
+        data = protocol.encode(message)
+        for session in room.sessions:
+            if session is exclude or session.needs_resync:
+                continue
+            if session.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                # the client would only notice the gap with the next change, which may never come
+                session.needs_resync = True
+                session.resync_task = asyncio.create_task(self._resync_when_drained(session))
+                continue
+            session.writer.write(data)
+
+    async def _resync_when_drained(self, session):
+        """
+        Sends the whole room to a client that missed changes, once it has read
+        what was sent to it so far.
+        """
+        try:
+            while session.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                await session.writer.drain()
+        except ConnectionError:
+            return
+        session.needs_resync = False
+        session.resync_task = None
+        if session.room is not None:
+            self._send_room(session)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Authoritative server for the dungeon game")
+    parser.add_argument("--port", type=int, default=protocol.PORT)
+    parser.add_argument("--db", default=storage.DATABASE_PATH, help="sqlite database file")
+    parser.add_argument("--persist-interval", type=float, default=PERSIST_INTERVAL)
+    args = parser.parse_args()
+
+    worker = StorageWorker()
+    worker.start(args.db)
+    try:
+        asyncio.run(GameServer(worker, args.persist_interval).serve(protocol.HOST, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+The client side of dungeon_server.py, used by dungeon_game.py in client mode.
+
+Messages from the server are received on a background thread and handed to a
+handler on the main thread when the frame loop calls process_messages(), the
+same way StorageWorker hands over its results. Changes of the room are checked
+for gaps in their sequence numbers; after a gap the client asks the server for
+the whole room again and drops changes until it arrives.
+
+    client = GameClient("127.0.0.1", 7777)
+    welcome = client.connect("Berserker", 50)
+    ...
+    # in the update function of the game, once per frame
+    client.process_messages(on_server_message)
+"""
+import queue
+import socket
+import threading
+
+import protocol
+from roomcache import RoomLayout
+from storagebackend import RoomChanges
+
+
+class GameClient:
+
+    def __init__(self, host=protocol.HOST, port=protocol.PORT):
+        self.host = host
+        self.port = port
+        self._socket = None
+        self._messages = queue.Queue()
+        self._thread = None
+        self.room_sequence = protocol.RoomSequence()
+        self.resyncs = 0
+
+    def connect(self, name, skin) -> dict:
+        """
+        Connects to the server as the player with the given name and returns the
+        welcome message. Blocks until the server answered.
+        """
+        self._socket = socket.create_connection((self.host, self.port))
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        file = self._socket.makefile("rb")
+        self._send({"type": "hello", "name": name, "skin": skin})
+        welcome = protocol.receive_message(file)
+        if welcome is None or welcome["type"] != "welcome":
+            raise ConnectionError(f"Unexpected answer from server: {welcome}")
+        self._thread = threading.Thread(target=self._receive, args=(file,), name="game-client", daemon=True)
+        self._thread.start()
+        return welcome
+
+    def close(self):
+        if self._socket is None:
+            return
+        self._socket.shutdown(socket.SHUT_RDWR)
+        self._socket.close()
+        self._socket = None
+
+    def send_move(self, tileindex):
+        self._send({"type": "move", "tileindex": tileindex})
+
+    def send_take(self, tileindex):
+        self._send({"type": "take", "tileindex": tileindex})
+
+    def process_messages(self, handler):
+        """
+        Calls handler(message) for all messages received since the last call,
+        except for room changes that don't apply to the current state of the 
+        room. Call this on the main thread, once per frame.
+        """
+        while True:
+            try:
+                message = self._messages.get_nowait()
+            except queue.Empty:
+                return
+            kind = message["type"]
+            if kind == "room":
+                self.room_sequence.reset(message["roomid"], message["sequence"])
+            elif kind in protocol.ROOM_CHANGE_TYPES:
+                verdict = self.room_sequence.check(message["roomid"], message["sequence"])
+                if verdict == "resync":
+                    self.resyncs += 1
+                    self._send({"type": "resync", "roomid": message["roomid"]})
+                if verdict != "apply":
+                    continue
+            handler(message)
+
+    def _send(self, message):
+        self._socket.sendall(protocol.encode(message))
+
+    def _receive(self, file):
+        try:
+            while True:
+                message = protocol.receive_message(file)
+                if message is None:
+                    break
+                self._messages.put(message)
+        except (OSError, protocol.ProtocolError):
+            pass
+        self._messages.put({"type": "disconnected"})
+
+
+def to_room(message):
+    """
+    Converts a room message to the (RoomLayout, RoomChanges) tuple the game
+    shows rooms from.
+    """
+    layout = RoomLayout(message["roomid"], tuple(message["size"]), tuple(message["tiles"]),
+                        tuple(tuple(portal) for portal in message["portals"]))
+    snapshot = RoomChanges(message["roomid"], message["sequence"],
+                           [tuple(player) for player in message["players"]], [],
+                           [tuple(obj) for obj in message["objects"]], [], True)
+    return layout, snapshot
+
+
+def to_room_changes(message) -> RoomChanges:
+    """
+    Converts a change message of the server to a RoomChanges delta.
+    """
+    kind = message["type"]
+    players_moved, players_left, objects_added, objects_removed = [], [], [], []
+    if kind == "player_moved":
+        players_moved.append((message["playerid"], message["tileindex"]))
+    elif kind == "player_left":
+        players_left.append(message["playerid"])
+    elif kind == "object_added":
+        objects_added.append((message["objectid"], message["tileindex"]))
+    elif kind == "object_removed":
+        objects_removed.append(message["tileindex"])
+    return RoomChanges(message["roomid"], message["sequence"], players_moved, players_left,
+                       objects_added, objects_removed, False)
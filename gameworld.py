@@ -4,8 +4,10 @@ from graphics2d.scenetree.notification import Notification
 import graphics2d.drawing as _draw
 import pygame
 import storage
+from collections import Counter
 
 from tilemap import TileMap
+from roomgrid import RoomGrid
 
 DEFAULT_PLAYER_SKIN = 54
 DEFAULT_PLAYER_POSITION = 7*15+7
@@ -18,13 +20,21 @@ class GameWorld(TileMap):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.walkable_tiles = kwargs.get('walkable_tiles', [])
         self.player_skin = kwargs.get('player_skin', DEFAULT_PLAYER_SKIN)
         self.player_position = kwargs.get('player_position', DEFAULT_PLAYER_POSITION)
         self.player_id = None
         self.room_id = None
         self.portals = []
-        self.players = []
+        # walkability and portal targets of the cells, kept in sync with tilemap and portals
+        self.grid = RoomGrid(self.catalog, self.tilemap)
+        # maps the ids of the other players in this room to their tile index
+        self.players = {}
+        # tile index -> number of other players on it, kept in sync with players
+        self._player_cells = Counter()
+        # revision of the room state in storage this world is in sync with
+        self.room_revision = None
+        # set while the next room is loaded in the background
+        self.loading_room = False
 
 
     def set_room(self, roomid):
@@ -32,8 +42,26 @@ class GameWorld(TileMap):
         Sets the current room id
         """
         self.room_id = roomid
+        self.room_revision = None
     
 
+    def set_loading_room(self, loading):
+        """
+        While a room is loading, input is ignored. Moves and pickups would be 
+        reported for the room the player is leaving.
+        """
+        self.loading_room = loading
+
+
+    def set_tilemap(self, tilemap):
+        super().set_tilemap(tilemap)
+        self.grid.set_tiles(tilemap)
+
+    def set_tile(self, index, tile_index):
+        super().set_tile(index, tile_index)
+        self.grid.set_tile(index, tile_index)
+
+
     def set_player(self, player_id):
         """
         Sets the current player
@@ -45,34 +73,94 @@ class GameWorld(TileMap):
         """
         Sets the player position
         """
+        self.request_cell_redraw(self.player_position, player_position)
         self.player_position = player_position
 
 
     def set_players(self, players : list):
-        self.players = []
-        for player in players:
+        self.players = {}
+        self._player_cells.clear()
+        for playerid, tileindex in players:
             # ignore our own self
-            if player[0] == self.player_id:
+            if playerid == self.player_id:
                 continue
-            self.players.append(player)
+            self._place_player(playerid, tileindex)
         self.request_redraw()
 
+    def _place_player(self, playerid, tileindex):
+        """
+        Moves another player to tileindex, returns the cell they were on or None
+        """
+        old_tileindex = self._remove_player(playerid)
+        self.players[playerid] = tileindex
+        self._player_cells[tileindex] += 1
+        return old_tileindex
+
+    def _remove_player(self, playerid):
+        """
+        Removes another player, returns the cell they were on or None
+        """
+        tileindex = self.players.pop(playerid, None)
+        if tileindex is not None:
+            self._player_cells[tileindex] -= 1
+            if not self._player_cells[tileindex]:
+                del self._player_cells[tileindex]
+        return tileindex
+
     def set_objects(self, objects : list):
         self.clear_objects()
         for objid, tileindex in objects:
             self.set_object(tileindex, objid)
 
+    def apply_room_changes(self, changes):
+        """
+        Applies a storage.RoomChanges delta to the players and objects of this 
+        room. Only requests a redraw if something visible actually changed.
+        """
+        if changes.roomid != self.room_id:
+            return
+        self.room_revision = changes.revision
+        if changes.resync:
+            self.set_players(changes.players_moved)
+            self.set_objects(changes.objects_added)
+            self.request_redraw()
+            return
+
+        # the cells that look different now
+        changed = set()
+        for playerid, tileindex in changes.players_moved:
+            if playerid != self.player_id and self.players.get(playerid) != tileindex:
+                old_tileindex = self._place_player(playerid, tileindex)
+                if old_tileindex is not None:
+                    changed.add(old_tileindex)
+                changed.add(tileindex)
+        for playerid in changes.players_left:
+            tileindex = self._remove_player(playerid)
+            if tileindex is not None:
+                changed.add(tileindex)
+        for objectid, tileindex in changes.objects_added:
+            if self.objectmap[tileindex] != objectid:
+                self.objectmap[tileindex] = objectid
+                changed.add(tileindex)
+        for tileindex in changes.objects_removed:
+            if self.objectmap[tileindex] is not None:
+                self.objectmap[tileindex] = None
+                changed.add(tileindex)
+        if changed:
+            self.request_cell_redraw(*changed)
+
     def set_portals(self, portals : list):
         """
         Sets the portal mapping for this room.
         Each portal is a (tileindex, targetroom, targettileindex) tuple
         """
         self.portals = portals
+        self.grid.set_portals(portals)
         
 
-    def on_draw(self, surface):
-        surface.fill(Color(40, 40, 40))
-        self._draw_tiles(surface)
+    def _draw_all(self, surface):
+        # the floor layer only changes with the room, everything on top of it is redrawn
+        self._draw_floor(surface)
         self._draw_objects(surface)
         self._draw_other_players(surface)
         self._draw_player(surface)
@@ -80,23 +168,31 @@ class GameWorld(TileMap):
         #self._draw_tile_grid(surface)
         #self._draw_selection_state(surface)
 
+    def _draw_cell(self, surface, index, rect):
+        self._draw_cell_floor(surface, index, rect)
+        if index in self._player_cells:
+            surface.blit(self.atlas.get_tile_image(self.player_skin), rect.topleft)
+        if index == self.player_position:
+            surface.blit(self.atlas.get_tile_image(self.player_skin), rect.topleft)
+        # clipped to the cell
+        self._draw_portals(surface)
+
 
     def _draw_player(self, surface):
         if self.player_position < 0 or self.player_position >= self.mapsize[0]*self.mapsize[1]:
             return
         
-        tile_rect = self.get_cell_rect(self.player_position)
         tile_image = self.atlas.get_tile_image(self.player_skin)
         if tile_image:
-            surface.blit(tile_image, Vector2(tile_rect.x, tile_rect.y))
+            surface.blit(tile_image, self.get_cell_positions()[self.player_position])
 
     def _draw_other_players(self, surface):
-        for player in self.players:
-            tile_rect = self.get_cell_rect(player[1])
-            # TODO: Use correct skin, not just the default
-            tile_image = self.atlas.get_tile_image(self.player_skin)
-            if tile_image:
-                surface.blit(tile_image, Vector2(tile_rect.x, tile_rect.y))
+        # TODO: Use correct skin, not just the default
+        tile_image = self.atlas.get_tile_image(self.player_skin)
+        if not tile_image:
+            return
+        positions = self.get_cell_positions()
+        surface.blits([(tile_image, positions[tileindex]) for tileindex in self.players.values()], False)
 
 
 
@@ -112,34 +208,22 @@ class GameWorld(TileMap):
         """
         Returns True if the player can walk to the given tile index
         """
-        if tile_index < 0 or tile_index >= self.mapsize[0]*self.mapsize[1]:
-            return False
-        tileid = self.tilemap[tile_index]
-        return tileid in self.walkable_tiles or self.is_portal(tile_index)
+        return self.grid.can_walk_to(tile_index)
     
 
     def is_portal(self, tile_index):
         """
         Returns True if the given tile index is a portal to another room
         """
-        if tile_index < 0 or tile_index >= self.mapsize[0]*self.mapsize[1]:
-            return False
-        
-        for portal in self.portals:
-            if portal[0] == tile_index:
-                return True
-        return False
+        return self.grid.get_portal(tile_index) is not None
 
 
     def notify_portal_entered(self):
-        if not self.is_portal(self.player_position):
-            return 
-        for portal in self.portals:
-            if portal[0] == self.player_position:
-                target_roomid = portal[1]
-                target_tileindex = portal[2]
-                self.emit(GameWorld.portal_entered, target_roomid, target_tileindex)
-                return
+        portal = self.grid.get_portal(self.player_position)
+        if portal is None:
+            return
+        target_roomid, target_tileindex = portal
+        self.emit(GameWorld.portal_entered, target_roomid, target_tileindex)
 
 
     def notify_player_moved(self):
@@ -158,18 +242,17 @@ class GameWorld(TileMap):
                  pygame.K_a: -1, pygame.K_d: 1
                  }
         pickup = {pygame.K_t: 1}
-        if event.type == KEYDOWN:
+        if event.type == KEYDOWN and not self.loading_room:
             # handles movement in the four cardinal directions
             if event.key in moves:
                 new_position = self.player_position + moves[event.key]
                 if self.can_walk_to(new_position):
-                    self.player_position = new_position
+                    self.set_player_position(new_position)
                     self.notify_player_moved()
-                    self.request_redraw()
-                if self.is_portal(self.player_position):
-                    self.notify_portal_entered()
+                self.notify_portal_entered()
             # handles picking up objects
             if event.key in pickup:
                 if self.get_object(self.player_position):
                     self.notify_object_taken()
                     self.objectmap[self.player_position] = None
+                    self.request_cell_redraw(self.player_position)
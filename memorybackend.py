@@ -0,0 +1,270 @@
+"""
+A storage backend that keeps everything in plain Python objects. Nothing is 
+persisted; it is meant for tests and benchmarks, where it shows the cost of 
+the game logic without any database in the way.
+"""
+import threading
+from collections import deque
+
+from roomcache import RoomLayout
+from storagebackend import (StorageBackend, RoomChanges, CHANGE_LOG_LENGTH, PLAYER_MOVED, PLAYER_LEFT,
+                            OBJECT_ADDED, OBJECT_REMOVED,
+                            SPAWN_ROOM, SPAWN_POSITION, diff_objects, summarize_changes, timestamp)
+
+
+class _Room:
+
+    def __init__(self, roomid, name, size, tiles, objects):
+        self.roomid = roomid
+        self.name = name
+        self.size = size
+        self.tiles = tiles
+        self.objects = objects
+        self.revision = 0
+        # (revision, kind, tileindex, objectid, playerid) entries, oldest first
+        self.changes = deque(maxlen=CHANGE_LOG_LENGTH)
+
+
+class MemoryBackend(StorageBackend):
+
+    def __init__(self, tile_info=None):
+        """
+        tile_info is a list of (atlas_id, tile_id, property) tuples, like the 
+        rows of the TileInfo table.
+        """
+        self.tile_info = list(tile_info or [])
+        self._lock = threading.RLock()
+        self._rooms = {}
+        self._connections = []
+        self._players = {}
+        # (playerid, objectid) -> count
+        self._inventory = {}
+        self._next_roomid = 1
+        self._next_playerid = 1
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def _room(self, roomid) -> _Room:
+        room = self._rooms.get(roomid)
+        if room is None:
+            raise ValueError(f"Room {roomid} does not exist in storage backend")
+        return room
+
+    def _record_changes(self, room, changes):
+        for kind, tileindex, objectid, playerid in changes:
+            room.revision += 1
+            room.changes.append((room.revision, kind, tileindex, objectid, playerid))
+
+    # rooms
+
+    def get_room_ids(self) -> list:
+        with self._lock:
+            return sorted(self._rooms)
+
+    def store_new_room(self, name, tilemap) -> int:
+        with self._lock:
+            roomid = self._next_roomid
+            self._next_roomid += 1
+            self._rooms[roomid] = _Room(roomid, name, tuple(tilemap.mapsize), 
+                                        list(tilemap.tilemap), list(tilemap.objectmap))
+            return roomid
+
+    def store_room(self, roomid, tilemap):
+        with self._lock:
+            room = self._rooms.get(roomid)
+            if room is None:
+                return
+            self._record_changes(room, diff_objects(room.objects, tilemap.objectmap))
+            room.size = tuple(tilemap.mapsize)
+            room.tiles = list(tilemap.tilemap)
+            room.objects = list(tilemap.objectmap)
+
+    def load_tilemap_data(self, roomid) -> tuple:
+        with self._lock:
+            room = self._room(roomid)
+            return (list(room.tiles), list(room.objects))
+
+    def load_room_layout(self, roomid) -> RoomLayout:
+        with self._lock:
+            room = self._room(roomid)
+            return RoomLayout(roomid, room.size, tuple(room.tiles), tuple(self.get_room_connections(roomid)))
+
+    def get_room_size(self, roomid) -> tuple:
+        with self._lock:
+            return self._room(roomid).size
+
+    def get_room_changes_since(self, roomid, revision) -> RoomChanges:
+        with self._lock:
+            room = self._room(roomid)
+            current = room.revision
+            if revision == current:
+                return RoomChanges(roomid, current, [], [], [], [], False)
+            oldest = room.changes[0][0] if room.changes else current + 1
+            if revision is None or revision > current or revision < oldest - 1:
+                return RoomChanges(roomid, current, self.get_players_at(roomid), [], 
+                                   self.get_objects_at(roomid), [], True)
+            entries = [entry[1:] for entry in room.changes if entry[0] > revision]
+            return summarize_changes(roomid, current, entries)
+
+    # connections
+
+    def get_room_connections(self, roomid) -> list:
+        with self._lock:
+            return [(tileid, targetroomid, targettileid) 
+                    for fromroom, tileid, targetroomid, targettileid in self._connections if fromroom == roomid]
+
+    def create_room_connection(self, roomid, tileid, targetroomid, targettileid):
+        with self._lock:
+            self._connections.append((roomid, tileid, targetroomid, targettileid))
+
+    # objects
+
+    def add_object_to_room(self, roomid, tileid, objectid):
+        with self._lock:
+            room = self._room(roomid)
+            if room.objects[tileid] != objectid:
+                room.objects[tileid] = objectid
+                self._record_changes(room, [(OBJECT_ADDED, tileid, objectid, None)])
+
+    def get_objects_at(self, roomid) -> list:
+        with self._lock:
+            room = self._rooms.get(roomid)
+            if room is None:
+                return []
+            return [(objectid, index) for index, objectid in enumerate(room.objects) if objectid is not None]
+
+    def remove_object_from_room(self, roomid, tileid):
+        with self._lock:
+            room = self._room(roomid)
+            objectid = room.objects[tileid]
+            if objectid is not None:
+                room.objects[tileid] = None
+                self._record_changes(room, [(OBJECT_REMOVED, tileid, objectid, None)])
+
+    def take_object(self, playerid, roomid, tileindex):
+        with self._lock:
+            room = self._room(roomid)
+            objectid = room.objects[tileindex]
+            if objectid is None:
+                return None
+            room.objects[tileindex] = None
+            self._add_to_inventory(playerid, objectid, 1)
+            self._record_changes(room, [(OBJECT_REMOVED, tileindex, objectid, playerid)])
+            return objectid
+
+    def get_tile_properties(self, atlas_id) -> list:
+        return [(tile_id, property) for atlas, tile_id, property in self.tile_info if atlas == atlas_id]
+
+    # players
+
+    def get_player_list(self) -> list:
+        with self._lock:
+            return list(self._players)
+
+    def get_player_info(self, playerid) -> dict:
+        with self._lock:
+            player = self._players.get(playerid)
+            return dict(player) if player else None
+
+    def register_player(self, playername, skin) -> int:
+        with self._lock:
+            for player in self._players.values():
+                if player['name'] == playername:
+                    return player['player_id']
+            playerid = self._next_playerid
+            self._next_playerid += 1
+            self._players[playerid] = {
+                'player_id': playerid,
+                'name': playername,
+                'room_id': SPAWN_ROOM,
+                'position': SPAWN_POSITION,
+                'object_id': skin,
+                'last_seen': timestamp(),
+                'online': True
+            }
+            if SPAWN_ROOM in self._rooms:
+                self._record_changes(self._rooms[SPAWN_ROOM], [(PLAYER_MOVED, SPAWN_POSITION, None, playerid)])
+            return playerid
+
+    def get_player_location(self, playerid) -> tuple:
+        with self._lock:
+            player = self._players.get(playerid)
+            if player:
+                return (player['room_id'], player['position'])
+            return None, None
+
+    def _record_player_change(self, player, change):
+        if player['room_id'] in self._rooms:
+            self._record_changes(self._rooms[player['room_id']], [change])
+
+    def set_player_locations(self, locations, last_seen):
+        with self._lock:
+            for playerid, roomid, tileid in locations:
+                player = self._players.get(playerid)
+                if player is None:
+                    continue
+                if player['room_id'] != roomid:
+                    self._record_player_change(player, (PLAYER_LEFT, None, None, playerid))
+                player['room_id'] = roomid
+                player['position'] = tileid
+                player['last_seen'] = last_seen
+                player['online'] = True
+                self._record_player_change(player, (PLAYER_MOVED, tileid, None, playerid))
+
+    def touch_players(self, playerids, last_seen):
+        with self._lock:
+            for playerid in playerids:
+                player = self._players.get(playerid)
+                if player is None:
+                    continue
+                if not player['online']:
+                    player['online'] = True
+                    self._record_player_change(player, (PLAYER_MOVED, player['position'], None, playerid))
+                player['last_seen'] = last_seen
+
+    def mark_players_offline(self, playerids=None, seen_before=None) -> list:
+        with self._lock:
+            if playerids is None:
+                playerids = [playerid for playerid, player in self._players.items() 
+                             if player['last_seen'] < seen_before]
+            marked = []
+            for playerid in playerids:
+                player = self._players.get(playerid)
+                if player is None or not player['online']:
+                    continue
+                player['online'] = False
+                self._record_player_change(player, (PLAYER_LEFT, None, None, playerid))
+                marked.append(playerid)
+            return marked
+
+    def get_players_at(self, roomid) -> list:
+        seen_since = timestamp(self.presence_ttl)
+        with self._lock:
+            return [(playerid, player['position']) for playerid, player in self._players.items() 
+                    if player['room_id'] == roomid and player['online'] and player['last_seen'] >= seen_since]
+
+    # inventory
+
+    def _add_to_inventory(self, playerid, objectid, count):
+        key = (playerid, objectid)
+        count = self._inventory.get(key, 0) + count
+        if count > 0:
+            self._inventory[key] = count
+        else:
+            self._inventory.pop(key, None)
+
+    def get_player_inventory_counts(self, playerid) -> dict:
+        with self._lock:
+            return {objectid: count for (owner, objectid), count in self._inventory.items() if owner == playerid}
+
+    def add_object_to_player_inventory(self, playerid, objectid, count=1):
+        with self._lock:
+            self._add_to_inventory(playerid, objectid, count)
+
+    def remove_object_from_player_inventory(self, playerid, objectid, count=1):
+        with self._lock:
+            self._add_to_inventory(playerid, objectid, -count)
@@ -0,0 +1,206 @@
+"""
+Versioned schema migrations for the sqlite storage backend.
+
+Every migration has a version number, a short description and a step. A step is 
+either a list of SQL statements or a function that gets a cursor and does the 
+work itself. storage.initialize() calls migrate(), which applies all migrations 
+newer than the version recorded in the schema_version table, in order and each 
+in its own transaction. Existing database files are thus upgraded in place; new
+ones first get the BASE_SCHEMA the migrations start from.
+
+Never change a migration that has been committed; add a new one instead.
+"""
+from datetime import datetime
+
+from roomformat import pack_layer
+
+
+def _rename_duplicate_player_names(cur):
+    """
+    Makes player names unique by appending the player id to every duplicate
+    name except the oldest one, so no player (and no inventory) is lost.
+    """
+    QUERY = """UPDATE players SET name = name || ' (' || player_id || ')'
+               WHERE player_id NOT IN (SELECT MIN(player_id) FROM players GROUP BY name)"""
+    cur.execute(QUERY)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS players_name ON players (name)")
+
+
+def pack_legacy_rooms(cur):
+    """
+    Converts the row-per-tile layout (TileMap and ObjectMap tables) of every room
+    into the packed tiles and objects columns of Rooms. Rooms that already have
+    packed layers are left alone. The legacy tables are kept but no longer used.
+    """
+    cur.execute("SELECT id, size_x, size_y FROM Rooms WHERE tiles IS NULL AND objects IS NULL")
+    for roomid, size_x, size_y in cur.fetchall():
+        cellcount = size_x * size_y
+        tiles = [None] * cellcount
+        cur.execute("SELECT tileid, tileindex FROM TileMap WHERE roomid = ?", (roomid,))
+        for tileid, tileindex in cur.fetchall():
+            if 0 <= tileindex < cellcount:
+                tiles[tileindex] = tileid
+        objects = [None] * cellcount
+        cur.execute("SELECT objectid, objectindex FROM ObjectMap WHERE roomid = ?", (roomid,))
+        for objectid, objectindex in cur.fetchall():
+            if 0 <= objectindex < cellcount:
+                objects[objectindex] = objectid
+        QUERY = "UPDATE Rooms SET tiles = ?, objects = ? WHERE id = ?"
+        cur.execute(QUERY, (pack_layer(tiles), pack_layer(objects), roomid))
+
+
+# The schema before the first migration, as in resources/dungeon_dump.sql. It is
+# created for new database files; existing ones already have these tables.
+BASE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS "TileMap" (
+           "tileid" INTEGER NOT NULL,
+           "tileindex" INTEGER NOT NULL,
+           "roomid" INTEGER NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS "TileInfo" (
+           "atlas_id" INTEGER NOT NULL,
+           "tile_id" INTEGER NOT NULL,
+           "property" TEXT NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS "TileAtlas" (
+           "atlas_id" INTEGER NOT NULL,
+           "size_x" INTEGER NOT NULL,
+           "size_y" INTEGER NOT NULL,
+           "name" TEXT,
+           "copyright" TEXT,
+           "filename" TEXT NOT NULL,
+           "author" TEXT,
+           PRIMARY KEY("atlas_id" AUTOINCREMENT))""",
+    """CREATE TABLE IF NOT EXISTS "Rooms" (
+           "id" INTEGER NOT NULL,
+           "description" TEXT,
+           "atlas_id" INTEGER NOT NULL,
+           "spawn_location" INTEGER,
+           "name" TEXT,
+           "size_x" INTEGER NOT NULL,
+           "size_y" INTEGER NOT NULL,
+           PRIMARY KEY("id" AUTOINCREMENT))""",
+    """CREATE TABLE IF NOT EXISTS skins (
+           skin_id INTEGER PRIMARY KEY AUTOINCREMENT,
+           position INTEGER)""",
+    """CREATE TABLE IF NOT EXISTS ObjectMap (
+           objectid int,
+           objectindex int,
+           roomid int)""",
+    """CREATE TABLE IF NOT EXISTS room_connections (
+           roomid INTEGER,
+           tileid INTEGER,
+           targetroomid INTEGER,
+           targettileid INTEGER)""",
+    """CREATE TABLE IF NOT EXISTS "players" (
+           "player_id" INTEGER,
+           "name" VARCHAR(64),
+           "room_id" INTEGER,
+           "position" INTEGER,
+           "object_id" INTEGER,
+           "last_seen" VARCHAR(64),
+           PRIMARY KEY("player_id" AUTOINCREMENT))""",
+    """CREATE TABLE IF NOT EXISTS "inventory" (
+           "playerid" INTEGER NOT NULL,
+           "objectid" INTEGER NOT NULL)""",
+]
+
+
+MIGRATIONS = [
+    (1, "index the room and player lookups", [
+        "CREATE INDEX IF NOT EXISTS tilemap_roomid ON TileMap (roomid)",
+        "CREATE INDEX IF NOT EXISTS objectmap_roomid ON ObjectMap (roomid)",
+        "CREATE INDEX IF NOT EXISTS room_connections_roomid ON room_connections (roomid)",
+        "CREATE INDEX IF NOT EXISTS players_room_id ON players (room_id)",
+        "CREATE INDEX IF NOT EXISTS inventory_playerid ON inventory (playerid)",
+        "CREATE INDEX IF NOT EXISTS tileinfo_atlas_property ON TileInfo (atlas_id, property)",
+    ]),
+    (2, "unique player names", _rename_duplicate_player_names),
+    (3, "packed room layers", [
+        "ALTER TABLE Rooms ADD COLUMN tiles BLOB",
+        "ALTER TABLE Rooms ADD COLUMN objects BLOB",
+    ]),
+    (4, "convert rooms to packed layers", pack_legacy_rooms),
+    (5, "room change feed", [
+        "ALTER TABLE Rooms ADD COLUMN revision INTEGER NOT NULL DEFAULT 0",
+        """CREATE TABLE IF NOT EXISTS room_changes (
+               roomid INTEGER NOT NULL,
+               revision INTEGER NOT NULL,
+               kind VARCHAR(16) NOT NULL,
+               tileindex INTEGER,
+               objectid INTEGER,
+               playerid INTEGER,
+               PRIMARY KEY (roomid, revision))""",
+    ]),
+    (6, "counted inventory", [
+        """CREATE TABLE IF NOT EXISTS inventory_counts (
+               playerid INTEGER NOT NULL,
+               objectid INTEGER NOT NULL,
+               count INTEGER NOT NULL,
+               PRIMARY KEY (playerid, objectid))""",
+        # the old one-row-per-item inventory table is kept but no longer used
+        """INSERT INTO inventory_counts (playerid, objectid, count) 
+               SELECT playerid, objectid, COUNT(*) FROM inventory GROUP BY playerid, objectid""",
+    ]),
+    (7, "player presence", [
+        # everybody starts offline until their next heartbeat
+        "ALTER TABLE players ADD COLUMN online INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS players_online_room ON players (room_id, last_seen) WHERE online = 1",
+        """CREATE VIEW IF NOT EXISTS online_players AS 
+               SELECT player_id, name, room_id, position, object_id, last_seen FROM players WHERE online = 1""",
+    ]),
+]
+
+
+def get_schema_version(connection) -> int:
+    """
+    Returns the schema version of the database, 0 if no migration was applied yet.
+    """
+    cur = connection.cursor()
+    cur.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+                       version INTEGER PRIMARY KEY,
+                       description TEXT,
+                       applied_at VARCHAR(64))""")
+    connection.commit()
+    cur.execute("SELECT MAX(version) FROM schema_version")
+    row = cur.fetchone()
+    return row[0] or 0
+
+
+def migrate(connection) -> int:
+    """
+    Applies all pending migrations and returns the resulting schema version.
+    """
+    version = get_schema_version(connection)
+    if version == 0:
+        _apply(connection, 0, "base schema", BASE_SCHEMA)
+    for migration_version, description, step in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        _apply(connection, migration_version, description, step)
+        version = migration_version
+    return version
+
+
+def _apply(connection, version, description, step):
+    """
+    Runs a single migration step and records it, all in one transaction.
+    """
+    cur = connection.cursor()
+    # take the write lock right away, another client might be migrating as well
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,))
+        if cur.fetchone():
+            connection.rollback()
+            return
+        if callable(step):
+            step(cur)
+        else:
+            for statement in step:
+                cur.execute(statement)
+        applied_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        QUERY = "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)"
+        cur.execute(QUERY, (version, description, applied_at))
+    except Exception:
+        connection.rollback()
+        raise
+    connection.commit()
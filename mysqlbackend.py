@@ -0,0 +1,184 @@
+"""
+The MySQL/MariaDB storage backend.
+
+Needs the mysqlclient package (import MySQLdb). The connection settings are 
+read from a dbconfig module: copy dbtests/dbconfig_TEMPLATE.py to dbconfig.py 
+next to this file and fill in the values, or pass them as a dict with the same
+keys to MySQLBackend.
+
+A new database gets the current schema on open(). dbtests/backendtest.py runs 
+the same checks against this backend as against the others on a local MySQL or
+MariaDB server (backendtest.py mysql-server). The MySQLdb stand-in in 
+dbtests/mysqlstandin/ (backendtest.py mysql) only checks the statements for 
+MySQL syntax, without a server.
+"""
+from sqlbackend import SQLBackend
+
+# The schema of an empty database, equivalent to the sqlite schema after 
+# all migrations in migrations.py. Keep both in sync: when adding a sqlite
+# migration, update SCHEMA and add the statements that bring an existing MySQL 
+# database to the new version to UPGRADES.
+SCHEMA_VERSION = 7
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS TileInfo (
+           atlas_id INTEGER NOT NULL,
+           tile_id INTEGER NOT NULL,
+           property VARCHAR(32) NOT NULL,
+           INDEX tileinfo_atlas_property (atlas_id, property))""",
+    """CREATE TABLE IF NOT EXISTS TileAtlas (
+           atlas_id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY,
+           size_x INTEGER NOT NULL,
+           size_y INTEGER NOT NULL,
+           name TEXT,
+           copyright TEXT,
+           filename TEXT NOT NULL,
+           author TEXT)""",
+    """CREATE TABLE IF NOT EXISTS Rooms (
+           id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY,
+           description TEXT,
+           atlas_id INTEGER NOT NULL,
+           spawn_location INTEGER,
+           name TEXT,
+           size_x INTEGER NOT NULL,
+           size_y INTEGER NOT NULL,
+           tiles LONGBLOB,
+           objects LONGBLOB,
+           revision INTEGER NOT NULL DEFAULT 0)""",
+    """CREATE TABLE IF NOT EXISTS room_connections (
+           roomid INTEGER,
+           tileid INTEGER,
+           targetroomid INTEGER,
+           targettileid INTEGER,
+           INDEX room_connections_roomid (roomid))""",
+    """CREATE TABLE IF NOT EXISTS room_changes (
+           roomid INTEGER NOT NULL,
+           revision INTEGER NOT NULL,
+           kind VARCHAR(16) NOT NULL,
+           tileindex INTEGER,
+           objectid INTEGER,
+           playerid INTEGER,
+           PRIMARY KEY (roomid, revision))""",
+    """CREATE TABLE IF NOT EXISTS players (
+           player_id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY,
+           name VARCHAR(64),
+           room_id INTEGER,
+           position INTEGER,
+           object_id INTEGER,
+           last_seen VARCHAR(64),
+           online INTEGER NOT NULL DEFAULT 0,
+           UNIQUE INDEX players_name (name),
+           INDEX players_room_id (room_id),
+           INDEX players_online_room (online, room_id, last_seen))""",
+    """CREATE TABLE IF NOT EXISTS inventory_counts (
+           playerid INTEGER NOT NULL,
+           objectid INTEGER NOT NULL,
+           count INTEGER NOT NULL,
+           PRIMARY KEY (playerid, objectid))""",
+    """CREATE TABLE IF NOT EXISTS schema_version (
+           version INTEGER PRIMARY KEY,
+           description TEXT,
+           applied_at VARCHAR(64))""",
+]
+
+# version -> statements upgrading a database from the previous version
+UPGRADES = {
+    6: ["""INSERT INTO inventory_counts (playerid, objectid, count) 
+               SELECT playerid, objectid, COUNT(*) FROM inventory GROUP BY playerid, objectid"""],
+    7: ["ALTER TABLE players ADD COLUMN online INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX players_online_room ON players (online, room_id, last_seen)"],
+}
+
+# Named lock (GET_LOCK) held while the schema is created or upgraded, and how
+# long open() waits for it in seconds
+SCHEMA_LOCK = "dungeon_schema"
+SCHEMA_LOCK_TIMEOUT = 30
+
+# Views, (re)created after the tables are up to date
+VIEWS = [
+    """CREATE OR REPLACE VIEW online_players AS 
+           SELECT player_id, name, room_id, position, object_id, last_seen FROM players WHERE online = 1""",
+]
+
+
+def _load_dbconfig() -> dict:
+    import dbconfig
+    return {
+        'SERVER_ADDRESS': dbconfig.SERVER_ADDRESS,
+        'USERNAME': dbconfig.USERNAME,
+        'PASSWORD': dbconfig.PASSWORD,
+        'DATABASE': dbconfig.DATABASE,
+        'PORT': getattr(dbconfig, 'PORT', 3306),
+    }
+
+
+class MySQLBackend(SQLBackend):
+
+    PARAM = "%s"
+    FOR_UPDATE = " FOR UPDATE"
+    INCREMENT_INVENTORY = """INSERT INTO inventory_counts (playerid, objectid, count) VALUES (?, ?, ?)
+                             ON DUPLICATE KEY UPDATE count = count + VALUES(count)"""
+
+    def __init__(self, config=None):
+        """
+        config is a dict with the keys of dbtests/dbconfig_TEMPLATE.py (and 
+        optionally PORT). Without it, the dbconfig module is used.
+        """
+        super().__init__()
+        self.config = config
+
+    def open(self):
+        import MySQLdb
+        self.IntegrityError = MySQLdb.IntegrityError
+        config = self.config or _load_dbconfig()
+        self.connection = MySQLdb.connect(host=config['SERVER_ADDRESS'], user=config['USERNAME'], 
+                                          password=config['PASSWORD'], database=config['DATABASE'], 
+                                          port=config.get('PORT', 3306))
+        # plain reads must see the latest data instead of a repeatable-read snapshot,
+        # writes use explicit transactions
+        self.connection.autocommit(True)
+        self.reader = self.connection
+        self._create_schema()
+
+    def close(self):
+        self.connection.close()
+        self.connection = None
+        self.reader = None
+
+    def _begin(self, cur):
+        cur.execute("START TRANSACTION")
+
+    def _create_schema(self):
+        cur = self.connection.cursor()
+        # DDL can't be rolled back, a named lock keeps other processes opening
+        # the same database from creating or upgrading the schema at the same time
+        cur.execute("SELECT GET_LOCK(%s, %s)", (SCHEMA_LOCK, SCHEMA_LOCK_TIMEOUT))
+        if cur.fetchone()[0] != 1:
+            raise TimeoutError(f"Timed out waiting for the schema lock {SCHEMA_LOCK}")
+        try:
+            self._upgrade_schema(cur)
+        finally:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (SCHEMA_LOCK,))
+            cur.fetchone()
+
+    def _upgrade_schema(self, cur):
+        for statement in SCHEMA:
+            cur.execute(statement)
+        # read under the lock, another process may have upgraded in the meantime
+        cur.execute("SELECT MAX(version) FROM schema_version")
+        version = cur.fetchone()[0]
+        if version is not None and version > SCHEMA_VERSION:
+            raise ValueError(f"Database schema version {version} is newer than this backend ({SCHEMA_VERSION})")
+        if version is not None:
+            missing = [v for v in range(version + 1, SCHEMA_VERSION + 1) if v not in UPGRADES]
+            if missing:
+                raise ValueError(f"Can't upgrade database schema version {version}, no upgrade to version {missing[0]}")
+        QUERY = "INSERT INTO schema_version (version, description, applied_at) VALUES (%s, %s, NOW())"
+        if version is None:
+            cur.execute(QUERY, (SCHEMA_VERSION, "initial schema"))
+        else:
+            for upgrade_version in range(version + 1, SCHEMA_VERSION + 1):
+                for statement in UPGRADES[upgrade_version]:
+                    cur.execute(statement)
+                cur.execute(QUERY, (upgrade_version, "upgrade"))
+        for statement in VIEWS:
+            cur.execute(statement)
@@ -0,0 +1,253 @@
+"""
+The messages exchanged between dungeon_server.py and its clients.
+
+In the code every message is a dict with a "type" key. On the wire it is a
+binary frame: the length of the rest of the frame (uint32), the protocol
+version and the message type (one byte each), followed by the fields of the
+message, all little-endian. A player moving costs 22 bytes, however many
+players are in the room.
+
+Client to server:
+    hello   {name, skin}          first message, answered with welcome and room
+    move    {tileindex}           move the own player to an adjacent cell
+    take    {tileindex}           pick up the object at the given cell
+    resync  {roomid}              ask for a new room message, e.g. after a gap
+
+Server to client:
+    welcome {player_id, atlas_id, tiles}       tiles are (tile_id, property) pairs of the atlas
+    room    {roomid, sequence, size, tiles, portals, objects, players, position}
+                                               snapshot of the room the player is in
+    player_moved   {roomid, sequence, playerid, tileindex}
+    player_left    {roomid, sequence, playerid}
+    object_added   {roomid, sequence, objectid, tileindex}
+    object_removed {roomid, sequence, tileindex}
+    taken   {tileindex, objectid}              answer to take, objectid is None if
+                                               somebody else was faster
+
+sequence counts the changes of a room; every change message carries the
+sequence number of the room after the change and a room message the current
+one. A client that sees a number other than the next one missed changes and
+sends resync, see RoomSequence.
+"""
+import asyncio
+import struct
+
+from roomformat import EMPTY, pack_layer, unpack_layer
+
+# Default address of the server. It only ever listens on localhost.
+HOST = "127.0.0.1"
+PORT = 7777
+
+# Increase whenever the layout of a message changes
+PROTOCOL_VERSION = 1
+
+ROOM_CHANGE_TYPES = ("player_moved", "player_left", "object_added", "object_removed")
+
+_FRAME = struct.Struct("<I")
+_HEADER = struct.Struct("<BB")
+_STRING_LENGTH = struct.Struct("<H")
+_COUNT = struct.Struct("<I")
+_ROOM_HEADER = struct.Struct("<IIHHi")
+
+# Messages with fixed fields only: type -> (type code, struct, field names).
+# None is sent as EMPTY in fields that may be missing.
+_FIXED_MESSAGES = {
+    "move": (2, struct.Struct("<i"), ("tileindex",)),
+    "take": (3, struct.Struct("<i"), ("tileindex",)),
+    "resync": (4, struct.Struct("<I"), ("roomid",)),
+    "player_moved": (20, struct.Struct("<IIii"), ("roomid", "sequence", "playerid", "tileindex")),
+    "player_left": (21, struct.Struct("<IIi"), ("roomid", "sequence", "playerid")),
+    "object_added": (22, struct.Struct("<IIii"), ("roomid", "sequence", "objectid", "tileindex")),
+    "object_removed": (23, struct.Struct("<IIi"), ("roomid", "sequence", "tileindex")),
+    "taken": (24, struct.Struct("<ii"), ("tileindex", "objectid")),
+}
+# Messages with variable parts, encoded by the functions below
+_HELLO, _WELCOME, _ROOM = 1, 10, 11
+_TYPES = {code: kind for kind, (code, _, _) in _FIXED_MESSAGES.items()}
+_TYPES.update({_HELLO: "hello", _WELCOME: "welcome", _ROOM: "room"})
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def encode(message) -> bytes:
+    """
+    Returns the frame of the given message.
+    """
+    kind = message["type"]
+    if kind in _FIXED_MESSAGES:
+        code, fields, names = _FIXED_MESSAGES[kind]
+        body = fields.pack(*[EMPTY if message[name] is None else message[name] for name in names])
+    elif kind == "room":
+        code, body = _ROOM, _encode_room(message)
+    elif kind == "hello":
+        code, body = _HELLO, struct.pack("<i", message["skin"]) + _encode_string(message["name"])
+    elif kind == "welcome":
+        code, body = _WELCOME, _encode_welcome(message)
+    else:
+        raise ProtocolError(f"Unknown message type {kind}")
+    return _FRAME.pack(_HEADER.size + len(body)) + _HEADER.pack(PROTOCOL_VERSION, code) + body
+
+
+def decode(payload) -> dict:
+    """
+    Decodes a frame without its length, as read by read_message().
+    """
+    version, code = _HEADER.unpack_from(payload)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Protocol version {version} is not supported, expected {PROTOCOL_VERSION}")
+    kind = _TYPES.get(code)
+    if kind is None:
+        raise ProtocolError(f"Unknown message type {code}")
+    offset = _HEADER.size
+    try:
+        if kind in _FIXED_MESSAGES:
+            _, fields, names = _FIXED_MESSAGES[kind]
+            message = dict(zip(names, fields.unpack_from(payload, offset)))
+            if kind == "taken" and message["objectid"] == EMPTY:
+                message["objectid"] = None
+        elif kind == "room":
+            message = _decode_room(payload, offset)
+        elif kind == "hello":
+            skin, = struct.unpack_from("<i", payload, offset)
+            name, _ = _decode_string(payload, offset + 4)
+            message = {"name": name, "skin": skin}
+        else:
+            message = _decode_welcome(payload, offset)
+    except struct.error as exception:
+        raise ProtocolError(f"Malformed {kind} message: {exception}")
+    message["type"] = kind
+    return message
+
+
+async def read_message(reader):
+    """
+    Reads the next message from an asyncio StreamReader. Returns None when the
+    connection was closed.
+    """
+    try:
+        header = await reader.readexactly(_FRAME.size)
+    except asyncio.IncompleteReadError as exception:
+        if exception.partial:
+            raise ProtocolError("Connection closed within a message")
+        return None
+    length, = _FRAME.unpack(header)
+    return decode(await reader.readexactly(length))
+
+
+def receive_message(file):
+    """
+    Reads the next message from a file-like object, e.g. socket.makefile("rb").
+    Returns None when the connection was closed.
+    """
+    header = file.read(_FRAME.size)
+    if not header:
+        return None
+    if len(header) < _FRAME.size:
+        raise ProtocolError("Connection closed within a message")
+    length, = _FRAME.unpack(header)
+    payload = file.read(length)
+    if len(payload) < length:
+        raise ProtocolError("Connection closed within a message")
+    return decode(payload)
+
+
+class RoomSequence:
+    """
+    Checks the sequence numbers of the messages of the room a client is in.
+    """
+
+    def __init__(self):
+        self.roomid = None
+        self.sequence = None
+
+    def reset(self, roomid, sequence):
+        """
+        Starts over from a room message.
+        """
+        self.roomid = roomid
+        self.sequence = sequence
+
+    def check(self, roomid, sequence) -> str:
+        """
+        Checks a change message. Returns "apply" for the next change of the room,
+        "ignore" for changes of another room or ones already contained in the
+        last room message, and "resync" if changes were missed. After "resync",
+        everything is ignored until the next room message.
+        """
+        if roomid != self.roomid or self.sequence is None or sequence <= self.sequence:
+            return "ignore"
+        if sequence != self.sequence + 1:
+            self.sequence = None
+            return "resync"
+        self.sequence = sequence
+        return "apply"
+
+
+def _encode_string(text) -> bytes:
+    data = text.encode()
+    return _STRING_LENGTH.pack(len(data)) + data
+
+
+def _decode_string(payload, offset):
+    length, = _STRING_LENGTH.unpack_from(payload, offset)
+    offset += _STRING_LENGTH.size
+    return bytes(payload[offset:offset + length]).decode(), offset + length
+
+
+def _encode_tuples(tuples) -> bytes:
+    # a count followed by the flattened tuples of int32 values
+    flat = [value for values in tuples for value in values]
+    return _COUNT.pack(len(tuples)) + struct.pack(f"<{len(flat)}i", *flat)
+
+
+def _decode_tuples(payload, offset, width):
+    count, = _COUNT.unpack_from(payload, offset)
+    offset += _COUNT.size
+    flat = struct.unpack_from(f"<{count * width}i", payload, offset)
+    return [flat[i:i + width] for i in range(0, len(flat), width)], offset + len(flat) * 4
+
+
+def _encode_room(message) -> bytes:
+    size_x, size_y = message["size"]
+    return b"".join([
+        _ROOM_HEADER.pack(message["roomid"], message["sequence"], size_x, size_y, message["position"]),
+        pack_layer(message["tiles"]),
+        _encode_tuples(message["portals"]),
+        _encode_tuples(message["objects"]),
+        _encode_tuples(message["players"]),
+    ])
+
+
+def _decode_room(payload, offset) -> dict:
+    roomid, sequence, size_x, size_y, position = _ROOM_HEADER.unpack_from(payload, offset)
+    offset += _ROOM_HEADER.size
+    cellcount = size_x * size_y
+    tiles = unpack_layer(bytes(payload[offset:offset + cellcount * 4]), cellcount)
+    offset += cellcount * 4
+    portals, offset = _decode_tuples(payload, offset, 3)
+    objects, offset = _decode_tuples(payload, offset, 2)
+    players, offset = _decode_tuples(payload, offset, 2)
+    return {"roomid": roomid, "sequence": sequence, "size": (size_x, size_y), "tiles": tiles,
+            "portals": portals, "objects": objects, "players": players, "position": position}
+
+
+def _encode_welcome(message) -> bytes:
+    parts = [struct.pack("<ii", message["player_id"], message["atlas_id"]), _COUNT.pack(len(message["tiles"]))]
+    for tile_id, property in message["tiles"]:
+        parts.append(struct.pack("<i", tile_id))
+        parts.append(_encode_string(property))
+    return b"".join(parts)
+
+
+def _decode_welcome(payload, offset) -> dict:
+    player_id, atlas_id = struct.unpack_from("<ii", payload, offset)
+    count, = _COUNT.unpack_from(payload, offset + 8)
+    offset += 8 + _COUNT.size
+    tiles = []
+    for _ in range(count):
+        tile_id, = struct.unpack_from("<i", payload, offset)
+        property, offset = _decode_string(payload, offset + 4)
+        tiles.append((tile_id, property))
+    return {"player_id": player_id, "atlas_id": atlas_id, "tiles": tiles}
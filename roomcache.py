@@ -0,0 +1,90 @@
+"""
+A bounded in-process LRU cache of room layouts, used by the storage module.
+
+Only the parts of a room that don't change while the game is running are cached
+(size, tiles and portal connections). Objects and players are always read from
+the storage backend.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+# size is a (size_x, size_y) tuple, tiles a tuple of tile IDs (None for empty 
+# cells) and connections a tuple of (tileid, targetroomid, targettileid) tuples.
+RoomLayout = namedtuple("RoomLayout", ["roomid", "size", "tiles", "connections"])
+
+
+class RoomCache:
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._layouts = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.prefetches = 0
+
+    def get(self, roomid):
+        """
+        Returns the cached layout of the given room or None, counting a hit or miss.
+        """
+        with self._lock:
+            layout = self._layouts.get(roomid)
+            if layout is None:
+                self.misses += 1
+                return None
+            self._layouts.move_to_end(roomid)
+            self.hits += 1
+            return layout
+
+    def peek(self, roomid):
+        """
+        Returns the cached layout of the given room or None, without counting a 
+        hit or miss and without changing the LRU order.
+        """
+        with self._lock:
+            return self._layouts.get(roomid)
+
+    def put(self, layout, prefetched=False):
+        """
+        Adds a layout to the cache, evicting the least recently used one if full.
+        Pass prefetched=True for layouts loaded before anybody asked for them.
+        """
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            if prefetched:
+                self.prefetches += 1
+            self._layouts[layout.roomid] = layout
+            self._layouts.move_to_end(layout.roomid)
+            while len(self._layouts) > self.capacity:
+                self._layouts.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, roomid):
+        """
+        Drops the given room from the cache. Call this whenever its layout is written.
+        """
+        with self._lock:
+            if self._layouts.pop(roomid, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._layouts.clear()
+
+    def get_stats(self) -> dict:
+        """
+        Returns the cache counters, useful for sizing the cache.
+        """
+        with self._lock:
+            return {
+                'capacity': self.capacity,
+                'size': len(self._layouts),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'prefetches': self.prefetches
+            }
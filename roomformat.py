@@ -0,0 +1,43 @@
+"""
+The packed on-disk format of room layers.
+
+A layer (the tiles or the objects of a room) is stored as a single blob of 
+little-endian 32 bit integers, one per cell in tile index order. Empty cells 
+are stored as EMPTY, since tile and object IDs are never negative.
+"""
+import sys
+from array import array
+
+# Sentinel for cells without a tile or object
+EMPTY = -1
+
+# array typecode of a 32 bit signed integer
+_TYPECODE = "i"
+assert array(_TYPECODE).itemsize == 4
+
+
+def pack_layer(cells) -> bytes:
+    """
+    Packs a list of tile or object IDs (None for empty cells) into a blob.
+    """
+    data = array(_TYPECODE, [EMPTY if cell is None else cell for cell in cells])
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data.tobytes()
+
+
+def unpack_layer(blob, cellcount) -> list:
+    """
+    Unpacks a blob created by pack_layer into a list of cellcount IDs, with None 
+    for empty cells. A missing blob (None) gives an empty layer. 
+    """
+    if blob is None:
+        return [None] * cellcount
+    data = array(_TYPECODE)
+    data.frombytes(blob)
+    if sys.byteorder == "big":
+        data.byteswap()
+    cells = [None if cell == EMPTY else cell for cell in data]
+    if len(cells) < cellcount:
+        cells.extend([None] * (cellcount - len(cells)))
+    return cells[:cellcount]
@@ -0,0 +1,69 @@
+"""
+Precomputed movement data of a room: which cells can be walked on and where
+the portals lead to.
+
+A RoomGrid is rebuilt when a room is loaded and updated cell by cell when
+tiles or portals change, so checking a move is a single index operation, no
+matter how big the room is or how many portals it has. It doesn't depend on
+graphics2d, so it can be used without a window.
+"""
+
+
+class RoomGrid:
+
+    def __init__(self, catalog, tiles=(), portals=()):
+        """
+        catalog is the TileCatalog of the atlas, tiles a flat list of tile IDs
+        (None for empty cells) and portals a list of (tileindex, targetroomid,
+        targettileindex) tuples.
+        """
+        self.catalog = catalog
+        # 1 for each cell that can be entered: walkable tiles and portals
+        self.passable = bytearray()
+        # tileindex -> (targetroomid, targettileindex)
+        self.portals = {}
+        self._walkable = bytearray()
+        self.set_tiles(tiles)
+        self.set_portals(portals)
+
+    def set_tiles(self, tiles):
+        """
+        Rebuilds the grid for a new tile layer. The portals are kept.
+        """
+        is_walkable = self.catalog.is_walkable
+        self._walkable = bytearray(1 if is_walkable(tileid) else 0 for tileid in tiles)
+        self.passable = bytearray(self._walkable)
+        for tileindex in self.portals:
+            if 0 <= tileindex < len(self.passable):
+                self.passable[tileindex] = 1
+
+    def set_tile(self, tileindex, tileid):
+        """
+        Updates a single cell after its tile changed.
+        """
+        if not 0 <= tileindex < len(self._walkable):
+            return
+        self._walkable[tileindex] = 1 if self.catalog.is_walkable(tileid) else 0
+        self.passable[tileindex] = 1 if self._walkable[tileindex] or tileindex in self.portals else 0
+
+    def set_portals(self, portals):
+        """
+        Replaces the portals of the room, a list of (tileindex, targetroomid,
+        targettileindex) tuples.
+        """
+        old_portals = self.portals
+        self.portals = {tileindex: (targetroomid, targettileindex)
+                        for tileindex, targetroomid, targettileindex in portals}
+        for tileindex in old_portals.keys() | self.portals.keys():
+            if 0 <= tileindex < len(self.passable):
+                self.passable[tileindex] = 1 if self._walkable[tileindex] or tileindex in self.portals else 0
+
+    def can_walk_to(self, tileindex) -> bool:
+        return 0 <= tileindex < len(self.passable) and self.passable[tileindex] == 1
+
+    def get_portal(self, tileindex):
+        """
+        Returns the (targetroomid, targettileindex) of the portal at the given
+        cell, or None if there is no portal.
+        """
+        return self.portals.get(tileindex)
@@ -0,0 +1,376 @@
+"""
+Storage backend code shared by the SQL databases (sqlite and MySQL).
+
+Queries are written with ? placeholders and translated to the parameter style
+of the database driver. Subclasses open self.connection, which is used for all
+writes, and self.reader, which is used for plain reads and may be the same 
+connection.
+"""
+import time
+
+from roomcache import RoomLayout
+from roomformat import pack_layer, unpack_layer
+from storagebackend import (StorageBackend, RoomChanges, CHANGE_LOG_LENGTH, PLAYER_MOVED, PLAYER_LEFT,
+                            OBJECT_REMOVED,
+                            SPAWN_ROOM, SPAWN_POSITION, diff_objects, summarize_changes, timestamp)
+
+
+class SQLBackend(StorageBackend):
+
+    # parameter placeholder of the database driver
+    PARAM = "?"
+    # appended to SELECTs inside write transactions to lock the rows read
+    FOR_UPDATE = ""
+    # exception the driver raises when a unique constraint is violated
+    IntegrityError = Exception
+    # adds count (the third parameter) to an inventory entry, creating it if necessary
+    INCREMENT_INVENTORY = """INSERT INTO inventory_counts (playerid, objectid, count) VALUES (?, ?, ?)
+                             ON CONFLICT (playerid, objectid) DO UPDATE SET count = count + excluded.count"""
+    # prefix that turns a query into one returning its query plan
+    EXPLAIN = "EXPLAIN "
+
+    def __init__(self):
+        self.connection = None
+        self.reader = None
+
+    def _begin(self, cur):
+        """
+        Starts a write transaction.
+        """
+        raise NotImplementedError
+
+    def _sql(self, query):
+        if self.PARAM == "?":
+            return query
+        return query.replace("?", self.PARAM)
+
+    def _read(self, query, parameters=()):
+        cur = self.reader.cursor()
+        self._execute(cur, query, parameters)
+        return cur
+
+    def _write(self, work):
+        """
+        Calls work(cur) inside a write transaction and returns its result. The 
+        transaction is rolled back if work raises an exception.
+        """
+        cur = self.connection.cursor()
+        self._begin(cur)
+        try:
+            result = work(cur)
+        except Exception:
+            self.connection.rollback()
+            raise
+        self.connection.commit()
+        if self.tracer is not None:
+            self.tracer.record_commit()
+        return result
+
+    def _execute(self, cur, query, parameters=()):
+        if self.tracer is None:
+            cur.execute(self._sql(query), parameters)
+            return
+        start = time.perf_counter()
+        cur.execute(self._sql(query), parameters)
+        self.tracer.record_query(query, time.perf_counter() - start, lambda: self.explain(query, parameters))
+
+    def _execute_many(self, cur, query, rows):
+        if self.tracer is None:
+            cur.executemany(self._sql(query), rows)
+            return
+        start = time.perf_counter()
+        cur.executemany(self._sql(query), rows)
+        self.tracer.record_query(query, time.perf_counter() - start, 
+                                 lambda: self.explain(query, rows[0]) if rows else None)
+
+    def explain(self, query, parameters=()) -> str:
+        """
+        Returns the query plan of the given query as a single line.
+        """
+        cur = self.reader.cursor()
+        cur.execute(self._sql(self.EXPLAIN + query), parameters)
+        return "; ".join(" ".join(str(value) for value in row) for row in cur.fetchall())
+
+    # rooms
+
+    def get_room_ids(self) -> list:
+        cur = self._read("SELECT id FROM Rooms ORDER BY id")
+        return [row[0] for row in cur.fetchall()]
+
+    def store_new_room(self, name, tilemap) -> int:
+        def work(cur):
+            # wir verwenden im Moment immer den Tile Atlas mit der ID 1
+            QUERY = "INSERT INTO Rooms (name, atlas_id, size_x, size_y, tiles, objects) VALUES (?, ?, ?, ?, ?, ?)"
+            self._execute(cur, QUERY, [name, 1, tilemap.mapsize[0], tilemap.mapsize[1], 
+                                       pack_layer(tilemap.tilemap), pack_layer(tilemap.objectmap)])
+            return cur.lastrowid
+        return self._write(work)
+
+    def store_room(self, roomid, tilemap):
+        def work(cur):
+            self._execute(cur, "SELECT size_x, size_y, objects FROM Rooms WHERE id = ?" + self.FOR_UPDATE, (roomid,))
+            row = cur.fetchone()
+            if row:
+                old_objects = unpack_layer(row[2], row[0] * row[1])
+                self._record_changes(cur, roomid, diff_objects(old_objects, tilemap.objectmap))
+            QUERY = "UPDATE Rooms SET size_x = ?, size_y = ?, tiles = ?, objects = ? WHERE id = ?"
+            self._execute(cur, QUERY, [tilemap.mapsize[0], tilemap.mapsize[1], 
+                                       pack_layer(tilemap.tilemap), pack_layer(tilemap.objectmap), roomid])
+        self._write(work)
+
+    def load_tilemap_data(self, roomid) -> tuple:
+        cur = self._read("SELECT size_x, size_y, tiles, objects FROM Rooms WHERE id = ?", (roomid,))
+        row = cur.fetchone()
+        if not row:
+            raise ValueError(f"Room {roomid} does not exist in storage backend")
+        cellcount = row[0] * row[1]
+        return (unpack_layer(row[2], cellcount), unpack_layer(row[3], cellcount))
+
+    def load_room_layout(self, roomid) -> RoomLayout:
+        cur = self._read("SELECT size_x, size_y, tiles FROM Rooms WHERE id = ?", (roomid,))
+        row = cur.fetchone()
+        if not row:
+            raise ValueError(f"Room {roomid} does not exist in storage backend")
+        tiles = tuple(unpack_layer(row[2], row[0] * row[1]))
+        connections = tuple(self.get_room_connections(roomid))
+        return RoomLayout(roomid, (row[0], row[1]), tiles, connections)
+
+    def get_room_size(self, roomid) -> tuple:
+        cur = self._read("SELECT size_x, size_y FROM Rooms WHERE id = ?", (roomid,))
+        row = cur.fetchone()
+        if row:
+            return (row[0], row[1])
+        else:
+            raise ValueError(f"Room {roomid} does not exist in storage backend")
+
+    def _record_changes(self, cur, roomid, changes):
+        """
+        Appends (kind, tileindex, objectid, playerid) entries to the change feed
+        of the given room and bumps its revision. Must be called inside the 
+        write transaction that makes the changes.
+        """
+        if not changes:
+            return
+        self._execute(cur, "UPDATE Rooms SET revision = revision + ? WHERE id = ?", (len(changes), roomid))
+        self._execute(cur, "SELECT revision FROM Rooms WHERE id = ?", (roomid,))
+        row = cur.fetchone()
+        if not row:
+            return
+        first_revision = row[0] - len(changes) + 1
+        QUERY = "INSERT INTO room_changes (roomid, revision, kind, tileindex, objectid, playerid) VALUES (?, ?, ?, ?, ?, ?)"
+        self._execute_many(cur, QUERY, [(roomid, first_revision + i, kind, tileindex, objectid, playerid)
+                                        for i, (kind, tileindex, objectid, playerid) in enumerate(changes)])
+        QUERY = "DELETE FROM room_changes WHERE roomid = ? AND revision <= ?"
+        self._execute(cur, QUERY, (roomid, row[0] - CHANGE_LOG_LENGTH))
+
+    def get_room_changes_since(self, roomid, revision) -> RoomChanges:
+        cur = self._read("SELECT revision FROM Rooms WHERE id = ?", (roomid,))
+        row = cur.fetchone()
+        if not row:
+            raise ValueError(f"Room {roomid} does not exist in storage backend")
+        current = row[0]
+        if revision == current:
+            return RoomChanges(roomid, current, [], [], [], [], False)
+
+        if revision is None or revision > current or revision < current - CHANGE_LOG_LENGTH:
+            return RoomChanges(roomid, current, self.get_players_at(roomid), [], 
+                               self.get_objects_at(roomid), [], True)
+
+        QUERY = """SELECT kind, tileindex, objectid, playerid FROM room_changes 
+                   WHERE roomid = ? AND revision > ? AND revision <= ? ORDER BY revision"""
+        cur = self._read(QUERY, (roomid, revision, current))
+        return summarize_changes(roomid, current, cur.fetchall())
+
+    # connections
+
+    def get_room_connections(self, roomid) -> list:
+        QUERY = "SELECT tileid, targetroomid, targettileid FROM room_connections WHERE roomid = ?"
+        cur = self._read(QUERY, (roomid,))
+        return [tuple(row) for row in cur.fetchall()]
+
+    def create_room_connection(self, roomid, tileid, targetroomid, targettileid):
+        def work(cur):
+            QUERY = "INSERT INTO room_connections (roomid, tileid, targetroomid, targettileid) VALUES (?, ?, ?, ?)"
+            self._execute(cur, QUERY, (roomid, tileid, targetroomid, targettileid))
+        self._write(work)
+
+    # objects
+
+    def _update_object_layer(self, roomid, update):
+        """
+        Reads the object layer of the given room, calls update(objects) on it 
+        and writes it back, all in one write transaction.
+        """
+        def work(cur):
+            self._execute(cur, "SELECT size_x, size_y, objects FROM Rooms WHERE id = ?" + self.FOR_UPDATE, (roomid,))
+            row = cur.fetchone()
+            if not row:
+                raise ValueError(f"Room {roomid} does not exist in storage backend")
+            old_objects = unpack_layer(row[2], row[0] * row[1])
+            objects = list(old_objects)
+            update(objects)
+            changes = diff_objects(old_objects, objects)
+            if changes:
+                self._execute(cur, "UPDATE Rooms SET objects = ? WHERE id = ?", (pack_layer(objects), roomid))
+                self._record_changes(cur, roomid, changes)
+        self._write(work)
+
+    def add_object_to_room(self, roomid, tileid, objectid):
+        def update(objects):
+            objects[tileid] = objectid
+        self._update_object_layer(roomid, update)
+
+    def get_objects_at(self, roomid) -> list:
+        cur = self._read("SELECT size_x, size_y, objects FROM Rooms WHERE id = ?", (roomid,))
+        row = cur.fetchone()
+        if not row:
+            return []
+        objects = unpack_layer(row[2], row[0] * row[1])
+        return [(objectid, index) for index, objectid in enumerate(objects) if objectid is not None]
+
+    def remove_object_from_room(self, roomid, tileid):
+        def update(objects):
+            objects[tileid] = None
+        self._update_object_layer(roomid, update)
+
+    def take_object(self, playerid, roomid, tileindex):
+        def work(cur):
+            self._execute(cur, "SELECT size_x, size_y, objects FROM Rooms WHERE id = ?" + self.FOR_UPDATE, (roomid,))
+            row = cur.fetchone()
+            if not row:
+                raise ValueError(f"Room {roomid} does not exist in storage backend")
+            objects = unpack_layer(row[2], row[0] * row[1])
+            objectid = objects[tileindex]
+            if objectid is None:
+                return None
+            objects[tileindex] = None
+            # only succeeds if nobody changed the object layer since we read it
+            QUERY = "UPDATE Rooms SET objects = ? WHERE id = ? AND objects = ?"
+            self._execute(cur, QUERY, (pack_layer(objects), roomid, row[2]))
+            if cur.rowcount != 1:
+                return None
+            self._execute(cur, self.INCREMENT_INVENTORY, (playerid, objectid, 1))
+            self._record_changes(cur, roomid, [(OBJECT_REMOVED, tileindex, objectid, playerid)])
+            return objectid
+        return self._write(work)
+
+    def get_tile_properties(self, atlas_id) -> list:
+        cur = self._read("SELECT tile_id, property FROM TileInfo WHERE atlas_id = ?", (atlas_id,))
+        return [tuple(row) for row in cur.fetchall()]
+
+    # players
+
+    def get_player_list(self) -> list:
+        cur = self._read("SELECT player_id FROM players")
+        return [row[0] for row in cur.fetchall()]
+
+    def get_player_info(self, playerid) -> dict:
+        QUERY = "SELECT player_id, name, room_id, position, object_id, last_seen FROM players WHERE player_id = ?"
+        cur = self._read(QUERY, (playerid,))
+        row = cur.fetchone()
+        if not row:
+            return None
+        return {
+            'player_id': row[0],
+            'name': row[1],
+            'room_id': row[2],               # the room id where the player currently is
+            'position': row[3],         # the player's current position in room_id
+            'object_id': row[4],          # the tile object ID representing the player
+            'last_seen': row[5]
+        }
+
+    def register_player(self, playername, skin) -> int:
+        cur = self._read("SELECT player_id FROM players WHERE name = ?", (playername,))
+        row = cur.fetchone()
+        if row:
+            return row[0]
+
+        def work(cur):
+            last_seen = timestamp()
+            QUERY = "INSERT INTO players (name, room_id, position, object_id, last_seen, online) VALUES (?, ?, ?, ?, ?, 1)"
+            self._execute(cur, QUERY, [playername, SPAWN_ROOM, SPAWN_POSITION, skin, last_seen])
+            player_id = cur.lastrowid
+            self._record_changes(cur, SPAWN_ROOM, [(PLAYER_MOVED, SPAWN_POSITION, None, player_id)])
+            return player_id
+        try:
+            return self._write(work)
+        except self.IntegrityError:
+            # another client registered the same name in the meantime
+            return self.register_player(playername, skin)
+
+    def get_player_location(self, playerid) -> tuple:
+        cur = self._read("SELECT room_id, position FROM players WHERE player_id = ?", (playerid,))
+        row = cur.fetchone()    
+        if row:
+            return (row[0], row[1])
+        else:
+            return None, None
+
+    def set_player_locations(self, locations, last_seen):
+        def work(cur):
+            for playerid, roomid, tileid in locations:
+                self._execute(cur, "SELECT room_id FROM players WHERE player_id = ?" + self.FOR_UPDATE, (playerid,))
+                row = cur.fetchone()
+                if not row:
+                    continue
+                if row[0] != roomid:
+                    self._record_changes(cur, row[0], [(PLAYER_LEFT, None, None, playerid)])
+                QUERY = "UPDATE players SET room_id = ?, position = ?, last_seen = ?, online = 1 WHERE player_id = ?"
+                self._execute(cur, QUERY, (roomid, tileid, last_seen, playerid))
+                self._record_changes(cur, roomid, [(PLAYER_MOVED, tileid, None, playerid)])
+        self._write(work)
+
+    def touch_players(self, playerids, last_seen):
+        def work(cur):
+            for playerid in playerids:
+                QUERY = "SELECT room_id, position FROM players WHERE player_id = ? AND online = 0" + self.FOR_UPDATE
+                self._execute(cur, QUERY, (playerid,))
+                row = cur.fetchone()
+                if row:
+                    # coming back online
+                    self._record_changes(cur, row[0], [(PLAYER_MOVED, row[1], None, playerid)])
+            QUERY = "UPDATE players SET last_seen = ?, online = 1 WHERE player_id = ?"
+            self._execute_many(cur, QUERY, [(last_seen, playerid) for playerid in playerids])
+        self._write(work)
+
+    def mark_players_offline(self, playerids=None, seen_before=None) -> list:
+        def work(cur):
+            if playerids is not None:
+                rows = []
+                for playerid in playerids:
+                    QUERY = "SELECT player_id, room_id FROM players WHERE player_id = ? AND online = 1" + self.FOR_UPDATE
+                    self._execute(cur, QUERY, (playerid,))
+                    rows.extend(cur.fetchall())
+            else:
+                QUERY = "SELECT player_id, room_id FROM players WHERE online = 1 AND last_seen < ?" + self.FOR_UPDATE
+                self._execute(cur, QUERY, (seen_before,))
+                rows = cur.fetchall()
+            for playerid, roomid in rows:
+                self._execute(cur, "UPDATE players SET online = 0 WHERE player_id = ?", (playerid,))
+                self._record_changes(cur, roomid, [(PLAYER_LEFT, None, None, playerid)])
+            return [row[0] for row in rows]
+        return self._write(work)
+
+    def get_players_at(self, roomid) -> list:
+        QUERY = "SELECT player_id, position FROM online_players WHERE room_id = ? AND last_seen >= ?"
+        cur = self._read(QUERY, (roomid, timestamp(self.presence_ttl)))
+        return [tuple(row) for row in cur.fetchall()]
+
+    # inventory
+
+    def get_player_inventory_counts(self, playerid) -> dict:
+        cur = self._read("SELECT objectid, count FROM inventory_counts WHERE playerid = ?", (playerid,))
+        return {objectid: count for objectid, count in cur.fetchall()}
+
+    def add_object_to_player_inventory(self, playerid, objectid, count=1):
+        def work(cur):
+            self._execute(cur, self.INCREMENT_INVENTORY, (playerid, objectid, count))
+        self._write(work)
+
+    def remove_object_from_player_inventory(self, playerid, objectid, count=1):
+        def work(cur):
+            QUERY = "UPDATE inventory_counts SET count = count - ? WHERE playerid = ? AND objectid = ?"
+            self._execute(cur, QUERY, (count, playerid, objectid))
+            QUERY = "DELETE FROM inventory_counts WHERE playerid = ? AND objectid = ? AND count <= 0"
+            self._execute(cur, QUERY, (playerid, objectid))
+        self._write(work)
@@ -0,0 +1,38 @@
+"""
+The sqlite storage backend, used by default.
+"""
+import sqlite3
+
+import migrations
+from sqlbackend import SQLBackend
+from sqliteconnection import ConnectionManager
+
+
+class SQLiteBackend(SQLBackend):
+
+    IntegrityError = sqlite3.IntegrityError
+    EXPLAIN = "EXPLAIN QUERY PLAN "
+
+    def __init__(self, path, config=None):
+        """
+        path is the database file, config a dict overriding the connection 
+        settings in sqliteconnection.DEFAULT_CONFIG.
+        """
+        super().__init__()
+        self.path = path
+        self.config = config
+        self._connections = None
+
+    def open(self):
+        self._connections = ConnectionManager(self.path, self.config)
+        self.connection, self.reader = self._connections.open()
+        migrations.migrate(self.connection)
+
+    def close(self):
+        self._connections.close()
+        self.connection = None
+        self.reader = None
+
+    def _begin(self, cur):
+        # takes the write lock right away, so read-modify-write cycles are atomic
+        cur.execute("BEGIN IMMEDIATE")
@@ -0,0 +1,71 @@
+"""
+Opens and configures the sqlite connections used by the storage module.
+
+Several game instances may share one database file. To keep them from blocking
+each other, the database is switched to write-ahead logging (WAL): readers then
+never block the writer and vice versa. Every process uses a read-only connection
+for the frequent polling queries and a separate connection for writes, and 
+waits up to busy_timeout milliseconds for a lock instead of failing right away
+with "database is locked".
+"""
+import sqlite3
+from pathlib import Path
+
+# Default connection settings, see https://sqlite.org/pragma.html
+DEFAULT_CONFIG = {
+    'journal_mode': "WAL",
+    'busy_timeout': 5000,         # milliseconds
+    'synchronous': "NORMAL",      # NORMAL is safe with WAL, FULL syncs on every commit
+}
+
+_JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+_SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+class ConnectionManager:
+
+    def __init__(self, path, config=None):
+        self.path = path
+        self.config = dict(DEFAULT_CONFIG)
+        if config:
+            self.config.update(config)
+        self.writer = None
+        self.reader = None
+
+    def open(self):
+        """
+        Opens the writer connection and, for file databases, a separate 
+        read-only reader connection. Returns (writer, reader).
+        """
+        journal_mode = self.config['journal_mode'].upper()
+        synchronous = self.config['synchronous'].upper()
+        if journal_mode not in _JOURNAL_MODES:
+            raise ValueError(f"Unknown journal mode {journal_mode}")
+        if synchronous not in _SYNCHRONOUS_LEVELS:
+            raise ValueError(f"Unknown synchronous level {synchronous}")
+
+        self.writer = self._connect(self.path)
+        self.writer.execute(f"PRAGMA journal_mode = {journal_mode}")
+        self.writer.execute(f"PRAGMA synchronous = {synchronous}")
+
+        if self.path == ":memory:":
+            # an in-memory database can't be shared between connections
+            self.reader = self.writer
+        else:
+            self.reader = self._connect(Path(self.path).absolute().as_uri() + "?mode=ro", uri=True)
+            self.reader.execute("PRAGMA query_only = ON")
+        return self.writer, self.reader
+
+    def close(self):
+        if self.reader is not None and self.reader is not self.writer:
+            self.reader.close()
+        if self.writer is not None:
+            self.writer.close()
+        self.writer = None
+        self.reader = None
+
+    def _connect(self, database, uri=False):
+        busy_timeout = int(self.config['busy_timeout'])
+        connection = sqlite3.connect(database, timeout=busy_timeout / 1000, uri=uri)
+        connection.execute(f"PRAGMA busy_timeout = {busy_timeout}")
+        return connection
@@ -1,255 +1,425 @@
 """
-This module is the interface between the actual game and it's storage backend. When we
-decide to switch from sqlite to another storage backend, all we have to do is switch out
-this module.
+This module is the interface between the actual game and it's storage backend. The
+game only ever calls the functions in this module; which backend actually stores 
+the data is selected in initialize() (see storagebackend.py for the available ones).
+
+On top of the backend, this module keeps an LRU cache of room layouts and buffers
+player locations and presence heartbeats before writing them.
+
+All storage calls can be timed, see enable_tracing().
 """
-import sqlite3
-from datetime import datetime
+import functools
+import os
+import time
+
+from roomcache import RoomCache, RoomLayout
+from tilecatalog import TileCatalog
+from storagetrace import StorageTracer, SLOW_QUERY_MS
+from storagebackend import StorageBackend, RoomChanges, PRESENCE_TTL, timestamp
+
+
+# Location of the sqlite database file, relative to the working directory
+DATABASE_PATH = "resources/default_db.db"
+
+# Maximum number of room layouts kept in memory
+ROOM_CACHE_SIZE = 32
+
+# Player locations are buffered and written at most this often (in seconds).
+# Successive moves of the same player in between are coalesced into one write.
+# Set to 0 to write every location immediately.
+LOCATION_FLUSH_INTERVAL = 0.5
+
+# Players send a heartbeat at most this often (in seconds) to stay online.
+# Players without a heartbeat for storagebackend.PRESENCE_TTL seconds are no 
+# longer shown and are marked offline by the next sweep.
+HEARTBEAT_INTERVAL = 5
 
+# Stale players are looked for at most this often (in seconds)
+SWEEP_INTERVAL = 10
 
-connection = None
+# If this environment variable is set, initialize() enables tracing
+TRACE_VARIABLE = "DUNGEON_STORAGE_TRACE"
 
-def initialize():
+## Currently we only use a single Tile Atlas (with the atlas id 1)
+TILE_ATLAS = 1
+
+# the StorageBackend all functions of this module delegate to
+backend = None
+
+# the StorageTracer while tracing is enabled
+tracer = None
+
+room_cache = RoomCache(ROOM_CACHE_SIZE)
+
+location_flush_interval = LOCATION_FLUSH_INTERVAL
+
+# playerid -> (roomid, tileid) of locations not yet written
+_pending_locations = {}
+# playerid -> roomid of the last location written or read for each player
+_player_rooms = {}
+_last_location_flush = 0
+_location_stats = {'requested': 0, 'coalesced': 0, 'written': 0, 'flushes': 0}
+# playerid -> time of the last heartbeat written, and heartbeats not yet written
+_last_heartbeats = {}
+_pending_heartbeats = set()
+_last_sweep = 0
+# atlas id -> TileCatalog
+_tile_catalogs = {}
+
+def initialize(path=DATABASE_PATH, flush_interval=LOCATION_FLUSH_INTERVAL, config=None, backend="sqlite",
+               trace=None):
     """
     Initializes the connection to the storage backend. Call this before using 
-    any other function in this module."""
-    global connection
-    connection = sqlite3.connect("resources/default_db.db")
+    any other function in this module. 
+    
+    backend is "sqlite" (the database file at path), "mysql" (the server 
+    configured in dbconfig.py), "memory" or a StorageBackend instance. config is
+    a dict passed on to the backend: connection settings overriding 
+    sqliteconnection.DEFAULT_CONFIG for sqlite, the dbconfig values for MySQL.
+    flush_interval is the maximum time in seconds player locations are buffered
+    before being written. trace=True enables tracing, by default it is enabled
+    if the environment variable DUNGEON_STORAGE_TRACE is set."""
+    global location_flush_interval, _last_location_flush, _last_sweep
+    # the parameter hides the module global, which is set by _set_backend()
+    new_backend = _create_backend(backend, path, config)
+    new_backend.open()
+    _set_backend(new_backend)
+    room_cache.clear()
+    location_flush_interval = flush_interval
+    _pending_locations.clear()
+    _player_rooms.clear()
+    _last_heartbeats.clear()
+    _pending_heartbeats.clear()
+    _tile_catalogs.clear()
+    if tracer is not None:
+        new_backend.tracer = tracer
+    elif trace or (trace is None and os.environ.get(TRACE_VARIABLE)):
+        enable_tracing()
+    _last_location_flush = time.monotonic()
+    _last_sweep = 0
+
+
+def _create_backend(kind, path, config) -> StorageBackend:
+    if isinstance(kind, StorageBackend):
+        return kind
+    if kind == "sqlite":
+        from sqlitebackend import SQLiteBackend
+        return SQLiteBackend(path, config)
+    if kind == "mysql":
+        from mysqlbackend import MySQLBackend
+        return MySQLBackend(config)
+    if kind == "memory":
+        from memorybackend import MemoryBackend
+        return MemoryBackend()
+    raise ValueError(f"Unknown storage backend {kind}")
+
+
+def _set_backend(new_backend):
+    global backend
+    backend = new_backend
+
 
 def finalize():
     """
-    Closes the connection to the storage backend. Call this before the application
-    exits.
+    Writes all buffered data and closes the connection to the storage backend. 
+    Call this before the application exits. While tracing, the trace report
+    is printed.
     """
-    connection.close()
+    flush()
+    if tracer is not None:
+        print(tracer.report())
+    backend.close()
 
 
+def enable_tracing(slow_query_ms=SLOW_QUERY_MS) -> StorageTracer:
+    """
+    Starts timing every call of the functions in this module and counting the
+    queries and commits of the backend. Queries slower than slow_query_ms are 
+    logged with their query plan. Returns the new StorageTracer.
+    """
+    global tracer
+    tracer = StorageTracer(slow_query_ms)
+    if backend is not None:
+        backend.tracer = tracer
+    return tracer
 
-def store_new_room(name, tilemap):  
+
+def disable_tracing():
+    global tracer
+    tracer = None
+    if backend is not None:
+        backend.tracer = None
+
+
+def get_trace_report() -> str:
     """
-    Store a new room in the database and return its assigned ID
-    """  
-    cur = connection.cursor()
-    # wir verwenden im Moment immer den Tile Atlas mit der ID 1 und die Grösse 15x15    
-    QUERY = "INSERT INTO Rooms (name, atlas_id, size_x, size_y) VALUES (?, ?, ?, ?)"        
-    cur.execute(QUERY, [name, 1, 15, 15])
-    room_id = cur.lastrowid
-    
-    QUERY = "INSERT INTO TileMap (tileid, tileindex, roomid) VALUES (?, ?, ?)"
-    for index, tileid in enumerate(tilemap.tilemap):
-        if tileid is None:
-            # Wir speichern keine leeren Felder ab
-            continue
-        cur.execute(QUERY, [tileid, index, room_id])
+    Returns the report of the data traced so far, or None if tracing is not enabled.
+    """
+    if tracer is None:
+        return None
+    return tracer.report()
 
-    QUERY = "INSERT INTO ObjectMap (objectid, objectindex, roomid) VALUES (?, ?, ?)"
-    for index, objectid in enumerate(tilemap.objectmap):
-        if objectid is None:
-            continue
-        cur.execute(QUERY, [objectid, index, room_id])
-    
-    connection.commit()
 
+def _traced(function):
+    """
+    Records the duration of every call of the decorated function while tracing is enabled.
+    """
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if tracer is None:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            # tracing may have been disabled in the meantime
+            if tracer is not None:
+                tracer.record_call(name, time.perf_counter() - start)
+    return wrapper
+
+
+@_traced
+def flush():
+    """
+    Writes all buffered player locations in a single transaction, followed by
+    the buffered heartbeats.
+    """
+    global _last_location_flush
+    _last_location_flush = time.monotonic()
+    if _pending_heartbeats:
+        # a location write counts as heartbeat as well
+        playerids = list(_pending_heartbeats - _pending_locations.keys())
+        _pending_heartbeats.clear()
+        if playerids:
+            backend.touch_players(playerids, timestamp())
+    if not _pending_locations:
+        return
+    locations = [(playerid, roomid, tileid) for playerid, (roomid, tileid) in _pending_locations.items()]
+    _pending_locations.clear()
+
+    backend.set_player_locations(locations, timestamp())
+    for playerid, roomid, tileid in locations:
+        _player_rooms[playerid] = roomid
+    _location_stats['written'] += len(locations)
+    _location_stats['flushes'] += 1
+
+
+@_traced
+def flush_if_due():
+    """
+    Writes the buffered player locations if the flush interval has passed. Call 
+    this regularly, e.g. from the update function of the game.
+    """
+    if time.monotonic() - _last_location_flush >= location_flush_interval:
+        flush()
+
+
+def get_location_write_stats() -> dict:
+    """
+    Returns how many player locations were requested, how many of those were 
+    coalesced with a later one and how many were actually written.
+    """
+    stats = dict(_location_stats)
+    stats['pending'] = len(_pending_locations)
+    return stats
+
+
+
+@_traced
+def get_room_ids() -> list:
+    """
+    Returns the IDs of all rooms.
+    """
+    return backend.get_room_ids()
+
+
+@_traced
+def store_new_room(name, tilemap):  
+    """
+    Store a new room in the database and return its assigned ID. The room 
+    and both of its layers are written with a single statement.
+    """  
+    room_id = backend.store_new_room(name, tilemap)
+    room_cache.invalidate(room_id)
     return room_id
 
 
+@_traced
 def store_room(roomid, tilemap):
     """
-    Store the tilemap data for an existing room
+    Store the tilemap data for an existing room. Both layers are replaced with
+    a single statement.
     """
-    QUERY = "DELETE FROM TileMap WHERE roomid = ?"
-    cur = connection.cursor()
-    cur.execute(QUERY, [roomid])
-    QUERY = "INSERT INTO TileMap (tileid, tileindex, roomid) VALUES (?, ?, ?)"
-    for index, tileid in enumerate(tilemap.tilemap):
-        if tileid is None:
-            # we only save non-empty tiles
-            continue
-        cur.execute(QUERY, [tileid, index, roomid])
-    
-    QUERY = "INSERT INTO ObjectMap (objectid, objectindex, roomid) VALUES (?, ?, ?)"
-    for index, objectid in enumerate(tilemap.objectmap):
-        if objectid is None:
-            continue
-        cur.execute(QUERY, [objectid, index, roomid])
-    connection.commit()
-
+    backend.store_room(roomid, tilemap)
+    room_cache.invalidate(roomid)
 
 
+@_traced
 def load_tilemap_data(roomid) -> list:
     """
-    Load the tilemap data for a given room. Returns a list of tile IDs, 
-    with None for empty tiles.
+    Load the tilemap data for a given room. Returns a (tiles, objects) tuple of
+    lists of tile IDs, with None for empty tiles. 
+    """
+    return backend.load_tilemap_data(roomid)
+
+
+@_traced
+def load_room_layout(roomid) -> RoomLayout:
+    """
+    Returns the layout (size, tiles and connections) of the given room. Layouts
+    are served from an LRU cache, which is invalidated whenever a room or its 
+    connections are written. The objects in a room are not part of the layout, 
+    use get_objects_at() for them.
+    """
+    layout = room_cache.get(roomid)
+    if layout is None:
+        layout = backend.load_room_layout(roomid)
+        room_cache.put(layout)
+    return layout
+
+
+@_traced
+def peek_room_layout(roomid) -> RoomLayout:
+    """
+    Returns the layout of the given room if it is in the room cache, otherwise
+    None. Never touches the storage backend, so unlike the other functions in 
+    this module it is safe to call from the main thread while a StorageWorker
+    is running.
+    """
+    return room_cache.peek(roomid)
+
+
+@_traced
+def prefetch_neighbour_rooms(roomid) -> list:
+    """
+    Loads the layouts of all rooms reachable through the portals of the given 
+    room into the room cache, so entering a portal doesn't have to wait for 
+    the backend. Returns the IDs of the neighbouring rooms.
+    """
+    neighbours = []
+    for _, targetroomid, _ in load_room_layout(roomid).connections:
+        if targetroomid in neighbours:
+            continue
+        neighbours.append(targetroomid)
+        if room_cache.peek(targetroomid) is None:
+            room_cache.put(backend.load_room_layout(targetroomid), prefetched=True)
+    return neighbours
+
+
+def get_room_cache_stats() -> dict:
+    """
+    Returns the hit, miss, eviction, invalidation and prefetch counters of the 
+    room cache.
     """
-    cur = connection.cursor()
-    QUERY = "SELECT tileid, tileindex FROM TileMap WHERE roomid = ?"
-    cur.execute(QUERY, (roomid,))
-    row = cur.fetchone()
-    room_size = get_room_size(roomid)
-    if not room_size:
-        raise ValueError(f"Room {roomid} does not have a size defined")
-        
-    tiles = [None]*room_size[0]*room_size[1]
-    while row:
-        tiles[row[1]] = row[0]
-        row = cur.fetchone()
+    return room_cache.get_stats()
 
-    QUERY = "SELECT objectid, objectindex FROM ObjectMap WHERE roomid = ?"
-    cur.execute(QUERY, (roomid,))
-    row = cur.fetchone()
 
-    objects = [None]*room_size[0]*room_size[1]
-    while row:
-        objects[row[1]] = row[0]
-        row = cur.fetchone()
+@_traced
+def get_room_changes_since(roomid, revision) -> RoomChanges:
+    """
+    Returns the changes to players and objects in the given room since the given
+    revision as a RoomChanges tuple. Pass None as revision to get a snapshot of 
+    the room. Remember the returned revision for the next call.
 
-    return (tiles, objects)
+    If nothing changed, this costs a single primary key lookup.
+    """
+    return backend.get_room_changes_since(roomid, revision)
 
 
+@_traced
 def get_room_size(roomid) -> tuple:
     """
     Get the size of a room. Returns a (size_x, size_y) tuple
     """
-    cur = connection.cursor()
-    QUERY = "SELECT size_x, size_y FROM Rooms WHERE id = ?"
-    cur.execute(QUERY, (roomid,))
-    row = cur.fetchone()
-    if row:
-        return (row[0], row[1])
-    else:
-        raise ValueError(f"Room {roomid} does not exist in storage backend")
+    return backend.get_room_size(roomid)
 
 
+@_traced
 def get_room_connections(roomid) -> list:
     """
     Returns (tileid, targetroomid, targettileid) tuples of all connections 
     to other rooms from the given room.
     """
-    cur = connection.cursor()
-    QUERY = "SELECT tileid, targetroomid, targettileid FROM room_connections WHERE roomid = ?"
-    cur.execute(QUERY, (roomid,))
-    rows = cur.fetchall()
-    if rows:
-        return rows
-    else:
-        return []
-    
+    return backend.get_room_connections(roomid)
 
 
+@_traced
 def create_room_connection(roomid, tileid, targetroomid, targettileid):
-    cur = connection.cursor()
-    parameters = {
-        'roomid': roomid, 
-        'tileid': tileid, 
-        'targetroomid': targetroomid, 
-        'targettileid': targettileid
-        }
-    cur.execute("INSERT INTO room_connections (roomid, tileid, targetroomid, targettileid) VALUES (:roomid, :tileid, :targetroomid, :targettileid)", parameters)
-    connection.commit()
+    backend.create_room_connection(roomid, tileid, targetroomid, targettileid)
+    room_cache.invalidate(roomid)
 
 
+@_traced
 def add_object_to_room(roomid, tileid, objectid):
     """
     Adds the given object ID to the given tile in the given room.
     """
-    cur = connection.cursor()
-    parameters = {
-        'objectid': objectid,
-        'objectindex': tileid,
-        'roomid': roomid
-        }
-    cur.execute("INSERT INTO ObjectMap (objectid, objectindex, roomid) VALUES (:objectid, :objectindex, :roomid)", parameters)
-    
-    connection.commit()
+    backend.add_object_to_room(roomid, tileid, objectid)
 
 
+@_traced
 def get_objects_at(roomid):
-    cur = connection.cursor()
-    QUERY = "SELECT objectid, objectindex FROM ObjectMap WHERE roomid = ?"
-    cur.execute(QUERY, (roomid,))
-    rows = cur.fetchall()
-    if rows:
-        return rows
-    else:
-        return []
+    """
+    Returns (objectid, tileindex) tuples of all objects in the given room.
+    """
+    return backend.get_objects_at(roomid)
 
 
+@_traced
 def remove_object_from_room(roomid, tileid):
     """
     Removes any object from the given tile in the given room.
     """
-    cur = connection.cursor()    
-    parameters = {
-        'objectindex': tileid,
-        'roomid': roomid
-        }
-    cur.execute("DELETE FROM ObjectMap WHERE objectindex = :objectindex AND roomid = roomid ", parameters)    
-    connection.commit()
+    backend.remove_object_from_room(roomid, tileid)
 
 
-def get_tile_object_ids() -> list:
+@_traced
+def take_object(playerid, roomid, tileindex):
     """
-    Returns a list of all tile object IDs in the storage backend.
-
-    A tile object is an object in the tile atlas that can be set 
-    above a tile in the tilemap.
+    Picks up the object at the given tile for the given player: removes it from
+    the room and adds it to the player's inventory in a single transaction.
+    Returns the object ID, or None if there was no object, e.g. because another 
+    player took it first. Use this instead of remove_object_from_room() and 
+    add_object_to_player_inventory(), which can't prevent two players from 
+    taking the same object.
     """
-    cur = connection.cursor()
-    TILE_ATLAS = 1
-    QUERY = "SELECT tile_id FROM TileInfo WHERE atlas_id = ? AND property = 'object'"
-
-    cur.execute(QUERY, (TILE_ATLAS,))
-    rows = cur.fetchall()
-    objectids = [row[0] for row in rows]
-    connection.commit()
-    return objectids
+    return backend.take_object(playerid, roomid, tileindex)
 
 
-def get_walkable_tile_ids() -> list:
+@_traced
+def load_tile_catalog(atlas_id=TILE_ATLAS) -> TileCatalog:
     """
-    Returns a list of all walkable tile IDs in the storage backend.
+    Returns the TileCatalog with the properties (walkable, object, ...) of all
+    tiles of the given atlas. The catalog is built once, later calls return 
+    the same one.
     """
-
-    cur = connection.cursor()
-    QUERY = "SELECT tile_id FROM TileInfo WHERE atlas_id = ? AND property = ?"
-    cur.execute(QUERY, (1, "walkable",))
-    row = cur.fetchone()
-    tileids = []
-    while row:
-        tileids.append(row[0])
-        row = cur.fetchone()
-    
-    return tileids
+    catalog = _tile_catalogs.get(atlas_id)
+    if catalog is None:
+        catalog = TileCatalog(atlas_id, backend.get_tile_properties(atlas_id))
+        _tile_catalogs[atlas_id] = catalog
+    return catalog
 
 
+@_traced
 def get_player_list() -> list:
     """
     Returns a list of all player IDs ever seen in the game.
     """
-    cur = connection.cursor()
-    QUERY = "SELECT player_id FROM players"
-    cur.execute(QUERY)
-    rows = cur.fetchall()
-    return [row[0] for row in rows]
+    return backend.get_player_list()
+
 
+@_traced
 def get_player_info(playerid) -> dict:
     """
-    Returns a dictionary with player information for the given player ID.
+    Returns a dictionary with player information for the given player ID,
+    or None if there is no such player.
     """
-    cur = connection.cursor()
-    result = cur.execute("SELECT player_id, name, room_id titel, position, object_id, last_seen FROM players")
-
-    row = result.fetchone()
-    return {
-        'player_id': row[0],
-        'name': row[1],
-        'room_id': row[2],               # the room id where the player currently is
-        'position': row[3],         # the player's current position in room_id
-        'object_id': row[4],          # the tile object ID representing the player
-        'last_seen': row[5]
-    }
+    return backend.get_player_info(playerid)
 
 
+@_traced
 def register_player(playername, skin) -> int:
     """
     Returns the player id of the player with the given name.
@@ -259,90 +429,125 @@ def register_player(playername, skin) -> int:
     Note: The name of the player can not be used twice. If used
     used twice, it will just use the already existing one.
     """
-    QUERY = "SELECT player_id FROM players WHERE name = ?"
-    cur = connection.cursor()
-    cur.execute(QUERY, (playername,))
-    row = cur.fetchone()
-    if row:
-        return row[0]
-    else:
-        room_id = 2
-        position = 99
-        last_seen = datetime.now().strftime("%Y-%m-%d %H:%M:%S") #Mit hilfe von ChatGPT
-        QUERY = "INSERT INTO players (name, room_id, position, object_id, last_seen) VALUES (?, ?, ?, ?, ?)"
-        cur = connection.cursor()
-        cur.execute(QUERY, [playername, room_id, position, skin, last_seen])
-        connection.commit()
-        player_id = cur.lastrowid
-        return player_id
-
+    return backend.register_player(playername, skin)
 
 
+@_traced
 def get_player_location(playerid) -> tuple:
     """
     Returns the current location of the given player as (roomid, tileid)
     """
-    cur = connection.cursor()
-    QUERY = "SELECT room_id, position FROM players WHERE player_id = ?"
-    cur.execute(QUERY, (playerid,))
-    row = cur.fetchone()    
-    if row:
-        return (row[0], row[1])
-    else:
-        return None, None
+    if playerid in _pending_locations:
+        return _pending_locations[playerid]
+    location = backend.get_player_location(playerid)
+    if location[0] is not None:
+        _player_rooms[playerid] = location[0]
+    return location
 
 
+@_traced
 def set_player_location(playerid, roomid, tileid):
     """
-    Sets the current location of the given player.
-    """
-    cur = connection.cursor()
-    QUERY = "UPDATE players SET room_id=?, position=? WHERE player_id = ?"
-    cur.execute(QUERY, (roomid, tileid, playerid))
-    connection.commit()
+    Sets the current location of the given player. 
+    
+    Locations within the same room are buffered and written by flush(); moving
+    to another room (or to an unknown one) flushes immediately.
+    """
+    _location_stats['requested'] += 1
+    if playerid in _pending_locations:
+        _location_stats['coalesced'] += 1
+    _pending_locations[playerid] = (roomid, tileid)
+    if _player_rooms.get(playerid) != roomid:
+        flush()
+    else:
+        flush_if_due()
 
 
+@_traced
 def get_players_at(roomid):
-    cur = connection.cursor()
-    QUERY = "SELECT player_id, position FROM players WHERE room_id = ?"
-    cur.execute(QUERY, (roomid,))
-    rows = cur.fetchall()
-    if rows:
-        return rows
-    else:
+    """
+    Returns (playerid, tileindex) tuples of all online players in the given room.
+    """
+    return backend.get_players_at(roomid)
+
+
+@_traced
+def heartbeat(playerid):
+    """
+    Keeps the given player online. Call this regularly while the player is 
+    playing; it is cheap, heartbeats are written at most every 
+    HEARTBEAT_INTERVAL seconds per player, together with the buffered locations.
+    """
+    now = time.monotonic()
+    if now - _last_heartbeats.get(playerid, -HEARTBEAT_INTERVAL) < HEARTBEAT_INTERVAL:
+        return
+    _last_heartbeats[playerid] = now
+    _pending_heartbeats.add(playerid)
+    flush_if_due()
+
+
+@_traced
+def sweep_stale_players() -> list:
+    """
+    Marks players without a heartbeat for PRESENCE_TTL seconds as offline, 
+    so they leave their room in the change feed. Does nothing if the last 
+    sweep was less than SWEEP_INTERVAL seconds ago. Returns the IDs of the 
+    players marked offline.
+    """
+    global _last_sweep
+    now = time.monotonic()
+    if now - _last_sweep < SWEEP_INTERVAL:
         return []
+    _last_sweep = now
+    return backend.mark_players_offline(seen_before=timestamp(PRESENCE_TTL))
+
 
+@_traced
+def set_player_offline(playerid):
+    """
+    Marks the given player as offline right away, e.g. when the game is closed.
+    """
+    flush()
+    _last_heartbeats.pop(playerid, None)
+    backend.mark_players_offline(playerids=[playerid])
 
+
+@_traced
+def get_player_inventory_counts(playerid) -> dict:
+    """
+    Returns the inventory of the given player as a dict mapping 
+    object IDs to how many of them the player has.
+    """
+    return backend.get_player_inventory_counts(playerid)
+
+
+@_traced
 def get_player_inventory_objects(playerid) -> list:
     """
     Returns a list of object IDs in the inventory of the given player.
     Note: The same objects can be present in the inventory multiple
-    times.
+    times. Prefer get_player_inventory_counts(), this list grows with
+    every object the player has.
     """
-    cur = connection.cursor()
-    QUERY = "SELECT objectid FROM Inventory WHERE playerid = ?"
-    cur.execute(QUERY, (playerid,))
-    rows = cur.fetchall()
-    return [row[0] for row in rows]
-    
+    objectids = []
+    for objectid, count in get_player_inventory_counts(playerid).items():
+        objectids.extend([objectid] * count)
+    return objectids
 
 
-def add_object_to_player_inventory(playerid, objectid):
+@_traced
+def add_object_to_player_inventory(playerid, objectid, count=1):
     """
-    Adds the given object ID to the inventory of the given player.
+    Adds count instances of the given object ID to the inventory of 
+    the given player.
     """
-    cur = connection.cursor()
-    QUERY = "INSERT INTO inventory (playerid, objectid) VALUES (?, ?)"
-    cur.execute(QUERY, (playerid, objectid,))
-    connection.commit()
+    backend.add_object_to_player_inventory(playerid, objectid, count)
 
 
-def remove_object_from_player_inventory(playerid, objectid):
+@_traced
+def remove_object_from_player_inventory(playerid, objectid, count=1):
     """
-    Removes one instance of the given object ID from the inventory
-    of the given player.
+    Removes count instances (one by default) of the given object ID 
+    from the inventory of the given player.
     """
-    cur = connection.cursor()
-    QUERY = """DELETE FROM inventory WHERE rowid = (SELECT rowid FROM inventory WHERE playerid = ? AND objectid = ? LIMIT 1)"""
-    cur.execute(QUERY, (playerid, objectid,))
-    connection.commit()
+    backend.remove_object_from_player_inventory(playerid, objectid, count)
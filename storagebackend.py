@@ -0,0 +1,230 @@
+"""
+The interface every storage backend implements, plus the pieces of the room 
+change feed that don't depend on a particular backend.
+
+The storage module is what the game talks to. It selects a backend in 
+storage.initialize() and adds the room cache and the write-behind buffer for 
+player locations on top of it. A backend only has to persist things:
+
+    SQLiteBackend   sqlitebackend.py    the default, a local sqlite file
+    MySQLBackend    mysqlbackend.py     a MySQL/MariaDB server
+    MemoryBackend   memorybackend.py    plain Python objects, for tests and benchmarks
+"""
+from collections import namedtuple
+from itertools import zip_longest
+from datetime import datetime, timedelta
+
+from roomcache import RoomLayout
+
+
+# Number of changes kept per room in the change feed. Clients that fall further
+# behind get a full snapshot of the room instead of a delta.
+CHANGE_LOG_LENGTH = 1000
+
+# Kinds of changes recorded in the change feed
+PLAYER_MOVED = "player_moved"
+PLAYER_LEFT = "player_left"
+OBJECT_ADDED = "object_added"
+OBJECT_REMOVED = "object_removed"
+
+# Result of get_room_changes_since(). players_moved holds (playerid, tileindex)
+# tuples, players_left player IDs, objects_added (objectid, tileindex) tuples and
+# objects_removed tile indices. If resync is True, the changes are a complete 
+# snapshot of the room and replace everything the client knew about it.
+RoomChanges = namedtuple("RoomChanges", ["roomid", "revision", "players_moved", "players_left",
+                                         "objects_added", "objects_removed", "resync"])
+
+# Room new players are spawned in, and where
+SPAWN_ROOM = 2
+SPAWN_POSITION = 99
+
+# Players without a heartbeat for this many seconds are considered offline
+PRESENCE_TTL = 30
+
+# Format of the last_seen column of players
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def timestamp(seconds_ago=0) -> str:
+    """
+    Returns the current time, or the time seconds_ago seconds ago, formatted 
+    for the last_seen column. These timestamps compare correctly as strings.
+    """
+    return (datetime.now() - timedelta(seconds=seconds_ago)).strftime(TIMESTAMP_FORMAT)
+
+
+def diff_objects(old_objects, new_objects) -> list:
+    """
+    Returns the change feed entries, (kind, tileindex, objectid, playerid) tuples,
+    that turn the object layer old_objects into new_objects. If the room was 
+    resized, the cells only one of the layers has count as empty in the other.
+    """
+    changes = []
+    for index, (old, new) in enumerate(zip_longest(old_objects, new_objects)):
+        if old == new:
+            continue
+        if new is None:
+            changes.append((OBJECT_REMOVED, index, old, None))
+        else:
+            changes.append((OBJECT_ADDED, index, new, None))
+    return changes
+
+
+def summarize_changes(roomid, revision, entries) -> RoomChanges:
+    """
+    Condenses (kind, tileindex, objectid, playerid) change feed entries, oldest 
+    first, into a RoomChanges delta. Only the latest change per player and per 
+    tile matters.
+    """
+    players = {}
+    objects = {}
+    for kind, tileindex, objectid, playerid in entries:
+        if kind == PLAYER_MOVED:
+            players[playerid] = tileindex
+        elif kind == PLAYER_LEFT:
+            players[playerid] = None
+        elif kind == OBJECT_ADDED:
+            objects[tileindex] = objectid
+        elif kind == OBJECT_REMOVED:
+            objects[tileindex] = None
+    
+    return RoomChanges(roomid, revision,
+                       [(playerid, tileindex) for playerid, tileindex in players.items() if tileindex is not None],
+                       [playerid for playerid, tileindex in players.items() if tileindex is None],
+                       [(objectid, tileindex) for tileindex, objectid in objects.items() if objectid is not None],
+                       [tileindex for tileindex, objectid in objects.items() if objectid is None],
+                       False)
+
+
+class StorageBackend:
+    """
+    Base class of all storage backends. Rooms are passed around as tilemap-like
+    objects with mapsize, tilemap and objectmap attributes; layers are lists of 
+    IDs with None for empty cells. Methods raise ValueError for unknown rooms 
+    where the storage module documents it.
+    """
+
+    # seconds after which players without a heartbeat are no longer shown
+    presence_ttl = PRESENCE_TTL
+
+    # the storagetrace.StorageTracer queries and commits are reported to, if any
+    tracer = None
+
+    def open(self):
+        """
+        Connects to the storage and brings its schema up to date.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    # rooms
+
+    def get_room_ids(self) -> list:
+        raise NotImplementedError
+
+    def store_new_room(self, name, tilemap) -> int:
+        raise NotImplementedError
+
+    def store_room(self, roomid, tilemap):
+        raise NotImplementedError
+
+    def load_tilemap_data(self, roomid) -> tuple:
+        raise NotImplementedError
+
+    def load_room_layout(self, roomid) -> RoomLayout:
+        raise NotImplementedError
+
+    def get_room_size(self, roomid) -> tuple:
+        raise NotImplementedError
+
+    def get_room_changes_since(self, roomid, revision) -> RoomChanges:
+        raise NotImplementedError
+
+    # connections
+
+    def get_room_connections(self, roomid) -> list:
+        raise NotImplementedError
+
+    def create_room_connection(self, roomid, tileid, targetroomid, targettileid):
+        raise NotImplementedError
+
+    # objects
+
+    def add_object_to_room(self, roomid, tileid, objectid):
+        raise NotImplementedError
+
+    def get_objects_at(self, roomid) -> list:
+        raise NotImplementedError
+
+    def remove_object_from_room(self, roomid, tileid):
+        raise NotImplementedError
+
+    def take_object(self, playerid, roomid, tileindex):
+        """
+        Moves the object at tileindex into the inventory of the player, in one
+        transaction. Returns the object ID, or None if there was no object 
+        (anymore), e.g. because another player was faster.
+        """
+        raise NotImplementedError
+
+    def get_tile_properties(self, atlas_id) -> list:
+        """
+        Returns (tile_id, property) tuples of all tiles of the given atlas.
+        """
+        raise NotImplementedError
+
+    # players
+
+    def get_player_list(self) -> list:
+        raise NotImplementedError
+
+    def get_player_info(self, playerid) -> dict:
+        raise NotImplementedError
+
+    def register_player(self, playername, skin) -> int:
+        raise NotImplementedError
+
+    def get_player_location(self, playerid) -> tuple:
+        raise NotImplementedError
+
+    def set_player_locations(self, locations, last_seen):
+        """
+        Writes a list of (playerid, roomid, tileid) locations in one transaction.
+        The players are marked as online and seen at last_seen.
+        """
+        raise NotImplementedError
+
+    def touch_players(self, playerids, last_seen):
+        """
+        Marks the given players as online and seen at last_seen, in one transaction.
+        Players that were offline are announced in the change feed of their room.
+        """
+        raise NotImplementedError
+
+    def mark_players_offline(self, playerids=None, seen_before=None) -> list:
+        """
+        Marks the given players, or all online players not seen since seen_before,
+        as offline and records them as having left their room. Returns the IDs
+        of the players marked offline.
+        """
+        raise NotImplementedError
+
+    def get_players_at(self, roomid) -> list:
+        """
+        Returns (playerid, tileindex) tuples of the online players in the given 
+        room that were seen within the last presence_ttl seconds.
+        """
+        raise NotImplementedError
+
+    # inventory
+
+    def get_player_inventory_counts(self, playerid) -> dict:
+        raise NotImplementedError
+
+    def add_object_to_player_inventory(self, playerid, objectid, count=1):
+        raise NotImplementedError
+
+    def remove_object_from_player_inventory(self, playerid, objectid, count=1):
+        raise NotImplementedError
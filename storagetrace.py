@@ -0,0 +1,157 @@
+"""
+Opt-in instrumentation of the storage layer, to find out which storage calls
+make frames stall.
+
+While tracing is enabled (see storage.enable_tracing()), a StorageTracer
+records how long every call of a storage function takes, in one latency
+histogram per function, and counts the queries and commits of the backend.
+Queries slower than slow_query_ms are logged with their query plan. The
+collected data is printed as a report by storage.finalize() and can be
+fetched at any time with storage.get_trace_report().
+"""
+import math
+import threading
+import time
+from collections import deque
+
+# Queries taking longer than this (in milliseconds) are logged
+SLOW_QUERY_MS = 20
+
+# Number of slow queries kept for the report
+SLOW_QUERY_LOG_LENGTH = 50
+
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram:
+    """
+    Counts latencies in logarithmic buckets, BUCKETS_PER_DECADE per factor of 10
+    starting at 1 microsecond, so percentiles are accurate to about 12% no matter
+    how many calls are recorded.
+    """
+
+    BUCKETS_PER_DECADE = 20
+    SMALLEST = 1e-6
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        bucket = 0
+        if seconds > self.SMALLEST:
+            bucket = int(math.log10(seconds / self.SMALLEST) * self.BUCKETS_PER_DECADE) + 1
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent) -> float:
+        """
+        Returns the upper bound in seconds of the bucket the given percentile falls in.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.max, self.SMALLEST * 10 ** (bucket / self.BUCKETS_PER_DECADE))
+        return self.max
+
+
+class StorageTracer:
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, log=print):
+        """
+        log is called with a message for every slow query, None to only keep
+        them for the report.
+        """
+        self.slow_query_ms = slow_query_ms
+        self.log = log
+        self.started = time.monotonic()
+        # function name -> LatencyHistogram
+        self.calls = {}
+        self.queries = 0
+        self.commits = 0
+        # (milliseconds, query, plan) of the latest slow queries
+        self.slow_queries = deque(maxlen=SLOW_QUERY_LOG_LENGTH)
+        # storage functions are called from the worker and the main thread
+        self._lock = threading.Lock()
+
+    def record_call(self, name, seconds):
+        with self._lock:
+            histogram = self.calls.get(name)
+            if histogram is None:
+                histogram = self.calls[name] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def record_query(self, query, seconds, explain=None):
+        """
+        Counts a query. If it was slow, explain() is called to get its query plan.
+        """
+        with self._lock:
+            self.queries += 1
+        milliseconds = seconds * 1000
+        if milliseconds < self.slow_query_ms:
+            return
+        plan = None
+        if explain is not None:
+            try:
+                plan = explain()
+            except Exception as exception:
+                plan = f"(no plan: {exception})"
+        query = " ".join(query.split())
+        with self._lock:
+            self.slow_queries.append((milliseconds, query, plan))
+        if self.log is not None:
+            self.log(f"Slow query ({milliseconds:.1f} ms): {query}" + (f"\n    plan: {plan}" if plan else ""))
+
+    def record_commit(self):
+        with self._lock:
+            self.commits += 1
+
+    def get_stats(self) -> dict:
+        """
+        Returns the collected data: per function the number of calls, total and
+        maximum time and the PERCENTILES, all times in milliseconds.
+        """
+        with self._lock:
+            functions = {}
+            for name, histogram in self.calls.items():
+                stats = {'calls': histogram.count, 'total_ms': histogram.total * 1000, 'max_ms': histogram.max * 1000}
+                for percent in PERCENTILES:
+                    stats[f'p{percent}_ms'] = histogram.percentile(percent) * 1000
+                functions[name] = stats
+            return {
+                'seconds': time.monotonic() - self.started,
+                'functions': functions,
+                'queries': self.queries,
+                'commits': self.commits,
+                'slow_queries': list(self.slow_queries)
+            }
+
+    def report(self) -> str:
+        """
+        Returns the collected data as a table, the functions that took the most
+        time in total first.
+        """
+        stats = self.get_stats()
+        lines = [f"Storage trace over {stats['seconds']:.1f} s: {stats['queries']} queries, "
+                 f"{stats['commits']} commits",
+                 f"{'function':<32} {'calls':>7} {'total ms':>10}"
+                 + "".join(f" {f'p{percent} ms':>8}" for percent in PERCENTILES) + f" {'max ms':>8}"]
+        for name, function in sorted(stats['functions'].items(), key=lambda item: -item[1]['total_ms']):
+            lines.append(f"{name:<32} {function['calls']:>7} {function['total_ms']:>10.1f}"
+                         + "".join(f" {function[f'p{percent}_ms']:>8.2f}" for percent in PERCENTILES)
+                         + f" {function['max_ms']:>8.2f}")
+        if stats['slow_queries']:
+            lines.append(f"Slow queries (> {self.slow_query_ms} ms):")
+            for milliseconds, query, plan in stats['slow_queries']:
+                lines.append(f"  {milliseconds:8.1f} ms  {query}")
+                if plan:
+                    lines.append(f"             plan: {plan}")
+        return "\n".join(lines)
@@ -0,0 +1,121 @@
+"""
+Runs storage functions on a dedicated worker thread, so the frame loop never
+waits for the database.
+
+The worker thread owns the storage connection: once the worker is started, ALL
+storage calls have to go through it. Requests are queued with submit(); their
+results are handed to callbacks which run on the main thread when the frame loop
+calls process_results(), i.e. on a later frame.
+
+    worker = StorageWorker()
+    worker.start()
+    worker.submit(storage.get_players_at, roomid, callback=show_players)
+    ...
+    # in the update function of the game, once per frame
+    worker.process_results()
+"""
+import queue
+import threading
+import traceback
+from concurrent.futures import Future
+
+import storage
+
+
+class StorageWorker:
+
+    def __init__(self):
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._thread = None
+
+    def start(self, *args, **kwargs):
+        """
+        Starts the worker thread and initializes storage on it. The arguments are
+        passed on to storage.initialize(). Blocks until storage is ready.
+        """
+        self._thread = threading.Thread(target=self._run, name="storage-worker", daemon=True)
+        self._thread.start()
+        self.call(storage.initialize, *args, **kwargs)
+
+    def stop(self):
+        """
+        Finalizes storage on the worker thread and waits for the thread to end.
+        Requests submitted before are still carried out.
+        """
+        if self._thread is None:
+            return
+        self.call(storage.finalize)
+        self._requests.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, function, *args, callback=None, errback=None, **kwargs) -> Future:
+        """
+        Queues function(*args, **kwargs) for the worker thread and returns a Future
+        for its result. callback(result) or, if the function raised an exception,
+        errback(exception) is called by process_results() on the main thread. 
+        Without an errback, exceptions are printed.
+        """
+        return self._queue(function, args, kwargs, callback, errback, True)
+
+    def call(self, function, *args, **kwargs):
+        """
+        Runs function on the worker thread and waits for its result. Only use 
+        this where blocking is acceptable, e.g. during startup.
+        """
+        return self.run(function, *args, **kwargs).result()
+
+    def run(self, function, *args, **kwargs) -> Future:
+        """
+        Queues function(*args, **kwargs) for the worker thread and returns a Future
+        for its result, without involving process_results(). For code that waits
+        for the Future itself, e.g. an asyncio loop using asyncio.wrap_future().
+        """
+        return self._queue(function, args, kwargs, None, None, False)
+
+    def process_results(self):
+        """
+        Runs the callbacks of all requests finished since the last call. Call 
+        this on the main thread, once per frame.
+        """
+        while True:
+            try:
+                future, callback, errback = self._results.get_nowait()
+            except queue.Empty:
+                return
+            exception = future.exception()
+            if exception is not None:
+                if errback is not None:
+                    errback(exception)
+                else:
+                    traceback.print_exception(exception)
+            elif callback is not None:
+                callback(future.result())
+
+    def pending(self) -> int:
+        """
+        Returns the number of requests not yet carried out by the worker thread.
+        """
+        return self._requests.qsize()
+
+    def _queue(self, function, args, kwargs, callback, errback, report):
+        future = Future()
+        self._requests.put((future, function, args, kwargs, callback, errback, report))
+        return future
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            future, function, args, kwargs, callback, errback, report = request
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args, **kwargs))
+            except Exception as exception:
+                future.set_exception(exception)
+            # results nobody is interested in are dropped, errors always reported
+            if report and (callback is not None or errback is not None or future.exception() is not None):
+                self._results.put((future, callback, errback))
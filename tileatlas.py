@@ -1,9 +1,13 @@
+import pygame
+
 from graphics2d import *
 import graphics2d.drawing as _draw
 
 class TileAtlas(CanvasRectAreaItem):
 
     def __init__(self, **kwargs):
+        # the images of all tiles, sliced from image on first use
+        self._tile_images = None
 
         if 'tilesize' in kwargs:
             self.tilesize = kwargs['tilesize']
@@ -29,6 +33,41 @@ class TileAtlas(CanvasRectAreaItem):
         self.min_size = Vector2(self.size)
         self.max_size = Vector2(self.size)
 
+    @property
+    def image(self):
+        return self._image
+
+    @image.setter
+    def image(self, image):
+        self._image = image
+        self._tile_images = None
+
+    @property
+    def tilesize(self):
+        return self._tilesize
+
+    @tilesize.setter
+    def tilesize(self, tilesize):
+        # a new scale of the atlas image comes with a new tile size
+        self._tilesize = tilesize
+        self._tile_images = None
+
+    def _slice_tiles(self):
+        """
+        Cuts the atlas image into one surface per tile. Once the display is set
+        up, the tiles are converted to its pixel format, which makes blitting 
+        them several times faster.
+        """
+        image = self._image
+        if pygame.display.get_surface() is not None:
+            if image.get_flags() & pygame.SRCALPHA:
+                image = image.convert_alpha()
+            else:
+                image = image.convert()
+        # the image may have fewer rows than atlassize, tiles outside of it don't exist
+        rows = min(self.atlassize[1], image.get_height() // self.tilesize[1])
+        self._tile_images = [image.subsurface(self.get_tile_rect(index)).copy()
+                             for index in range(self.atlassize[0] * rows)]
 
     def get_tile_index(self, local_point):            
         if local_point[0] >= self.atlassize[0] * self.tilesize[0]:
@@ -50,9 +89,11 @@ class TileAtlas(CanvasRectAreaItem):
     def get_tile_image(self, index):
         """
         Returns the tile image for index.
-        DO NOT DRAW ONTO THE SURFACE! IT REFERENCES THE ORIGINAL TILE!
-        """        
-        return self.image.subsurface(self.get_tile_rect(index))
+        DO NOT DRAW ONTO THE SURFACE! IT IS SHARED BY ALL USERS OF THE TILE!
+        """
+        if self._tile_images is None:
+            self._slice_tiles()
+        return self._tile_images[index]
 
 
     def set_hovered_tile(self, index):
@@ -0,0 +1,72 @@
+"""
+The properties of the tiles of a tile atlas (walkable, portal, object, ...), as
+stored in the TileInfo table.
+
+A TileCatalog is built once per atlas when the game or editor starts (see
+storage.load_tile_catalog()) and keeps the properties of each tile as bit
+flags, so asking whether a tile is walkable is a single dict lookup.
+"""
+
+# Flags of the properties the game knows about. Other properties found in
+# TileInfo get the next free bits, see TileCatalog.property_flags.
+WALKABLE = 1 << 0
+PORTAL = 1 << 1
+OBJECT = 1 << 2
+
+PROPERTY_FLAGS = {'walkable': WALKABLE, 'portal': PORTAL, 'object': OBJECT}
+
+
+class TileCatalog:
+
+    def __init__(self, atlas_id, properties=()):
+        """
+        properties is a list of (tile_id, property) tuples, like the rows of
+        the TileInfo table for the given atlas.
+        """
+        self.atlas_id = atlas_id
+        # property name -> flag
+        self.property_flags = dict(PROPERTY_FLAGS)
+        # tile id -> flags of all its properties
+        self._flags = {}
+        for tile_id, property in properties:
+            if property not in self.property_flags:
+                self.property_flags[property] = 1 << len(self.property_flags)
+            self._flags[tile_id] = self._flags.get(tile_id, 0) | self.property_flags[property]
+
+    def get_flags(self, tileid) -> int:
+        """
+        Returns the flags of the given tile, 0 for unknown tiles and None.
+        """
+        return self._flags.get(tileid, 0)
+
+    def has_flags(self, tileid, flags) -> bool:
+        """
+        Returns True if the given tile has all of the given flags.
+        """
+        return self._flags.get(tileid, 0) & flags == flags
+
+    def has_property(self, tileid, property) -> bool:
+        flag = self.property_flags.get(property)
+        return flag is not None and self.has_flags(tileid, flag)
+
+    def is_walkable(self, tileid) -> bool:
+        return self._flags.get(tileid, 0) & WALKABLE != 0
+
+    def is_portal(self, tileid) -> bool:
+        return self._flags.get(tileid, 0) & PORTAL != 0
+
+    def is_object(self, tileid) -> bool:
+        return self._flags.get(tileid, 0) & OBJECT != 0
+
+    def get_properties(self) -> list:
+        """
+        Returns the (tile_id, property) tuples the catalog was built from.
+        """
+        return [(tileid, property) for tileid, tile_flags in sorted(self._flags.items())
+                for property, flag in self.property_flags.items() if tile_flags & flag]
+
+    def get_tile_ids(self, flags) -> list:
+        """
+        Returns the sorted IDs of all tiles that have all of the given flags.
+        """
+        return sorted(tileid for tileid, tile_flags in self._flags.items() if tile_flags & flags == flags)
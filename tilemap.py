@@ -2,7 +2,9 @@ import pygame
 
 from graphics2d import *
 import graphics2d.drawing as _draw
+from tilecatalog import TileCatalog
 
+BACKGROUND_COLOR = Color(40, 40, 40)
 
 class TileMap(CanvasRectAreaItem):
 
@@ -23,10 +25,10 @@ class TileMap(CanvasRectAreaItem):
         else:
             self.objectmap = [None] * self.mapsize[0] * self.mapsize[1]
 
-        if 'objectids' in kwargs:
-            self.objectids = kwargs['objectids']
+        if 'catalog' in kwargs:
+            self.catalog = kwargs['catalog']
         else:
-            self.objectids = []
+            self.catalog = TileCatalog(None)
 
         if 'atlas' in kwargs:
             self.atlas = kwargs['atlas']
@@ -45,6 +47,18 @@ class TileMap(CanvasRectAreaItem):
         
         self.hovered_cell = -1
         self.draw_mode = 0
+        # the background and all tiles, composed offscreen. Rebuilt when the room 
+        # or the atlas changes, single edited cells are redrawn onto it.
+        self._floor = None
+        self._floor_image = None
+        self._floor_cells = set()
+        # cells to repaint on the next draw, unless the whole map is redrawn
+        self._dirty_cells = set()
+        self._redraw_all = True
+        self._drawn_surface = None
+        # top left corner of every cell, for the current mapsize and tilesize
+        self._cell_positions = None
+        self._cell_positions_key = None
 
         super().__init__(**kwargs)
         self.min_size = Vector2(self.size)
@@ -52,6 +66,21 @@ class TileMap(CanvasRectAreaItem):
 
     def clear_objects(self):
         self.objectmap = [None] * self.mapsize[0] * self.mapsize[1]
+        self.request_redraw()
+
+    def request_redraw(self):
+        """
+        Requests redrawing the whole map
+        """
+        self._redraw_all = True
+        super().request_redraw()
+
+    def request_cell_redraw(self, *indices):
+        """
+        Requests repainting only the given cells, indices outside the map are ignored
+        """
+        self._dirty_cells.update(indices)
+        super().request_redraw()
 
     def get_cell_index(self, local_point):
         """
@@ -74,28 +103,98 @@ class TileMap(CanvasRectAreaItem):
         Given a tile index, returns the boundary rect of the cell
         """
         x = tile_index % self.mapsize[0]
-        y = int(tile_index / self.mapsize[0])
+        y = tile_index // self.mapsize[0]
         return Rect(x*self.tilesize[0],y*self.tilesize[1], self.tilesize[0], self.tilesize[1])
 
+    def get_cell_positions(self):
+        """
+        Returns the top left corners of all cells, computed once per map and tile size
+        """
+        key = (tuple(self.mapsize), tuple(self.tilesize))
+        if key != self._cell_positions_key:
+            width, height = self.mapsize
+            tilewidth, tileheight = self.tilesize
+            self._cell_positions = [(x * tilewidth, y * tileheight) for y in range(height) for x in range(width)]
+            self._cell_positions_key = key
+        return self._cell_positions
+
+    def set_tilemap(self, tilemap):
+        """
+        Replaces the whole tile layer
+        """
+        self.tilemap = tilemap
+        self._floor = None
+        self.request_redraw()
+
     def set_tile(self, index, tile_index):
+        if self.tilemap[index] == tile_index:
+            return
         self.tilemap[index] = tile_index
-        self.request_redraw()
+        self._floor_cells.add(index)
+        self.request_cell_redraw(index)
     
     def set_object(self, index, object_id):
         self.objectmap[index] = object_id
-        self.request_redraw()
+        self.request_cell_redraw(index)
 
     def set_hovered_cell(self, index):
+        if index == self.hovered_cell:
+            return
+        self.request_cell_redraw(self.hovered_cell, index)
         self.hovered_cell = index
-        self.request_redraw()
 
     def on_draw(self, surface):
-        surface.fill(Color(40, 40, 40))        
-        self._draw_tiles(surface)
+        """
+        Draws the whole map if requested or if surface is new, else only repaints
+        the dirty cells. Returns the list of changed rects.
+        """
+        if self._redraw_all or surface is not self._drawn_surface or self.atlas is None:
+            self._draw_all(surface)
+            rects = [Rect((0, 0), self.size)]
+        else:
+            self._update_floor()
+            rects = self._draw_cells(surface, self._dirty_cells)
+        self._redraw_all = False
+        self._dirty_cells.clear()
+        self._drawn_surface = surface
+        return rects
+
+    def _draw_all(self, surface):
+        self._draw_floor(surface)
         self._draw_objects(surface)
         self._draw_tile_grid(surface)
         self._draw_selection_state(surface)
 
+    def _draw_cells(self, surface, indices):
+        """
+        Repaints the given cells, clipped to their rect so the outlines of 
+        neighbouring cells stay intact. Returns the rects of the cells.
+        """
+        rects = []
+        for i in indices:
+            if i < 0 or i >= self.mapsize[0] * self.mapsize[1]:
+                continue
+            rect = self.get_cell_rect(i)
+            surface.set_clip(rect)
+            self._draw_cell(surface, i, rect)
+            rects.append(rect)
+        surface.set_clip(None)
+        return rects
+
+    def _draw_cell(self, surface, index, rect):
+        self._draw_cell_floor(surface, index, rect)
+        self._draw_tile_grid(surface)
+        self._draw_selection_state(surface)
+
+    def _draw_cell_floor(self, surface, index, rect):
+        """
+        Draws the floor and the object of a single cell
+        """
+        surface.blit(self._floor, rect.topleft, rect)
+        objidx = self.objectmap[index]
+        if objidx is not None:
+            surface.blit(self.atlas.get_tile_image(objidx), rect.topleft)
+
 
     def _draw_tile_grid(self, surface):
         """
@@ -114,27 +213,54 @@ class TileMap(CanvasRectAreaItem):
             _draw.draw_line(surface, (pos.x, y), (pos.x+self.size[0], y), gridcolor, 1)
 
 
-    def _draw_tiles(self, surface):
+    def _draw_floor(self, surface):
+        """
+        Draws the background and the tiles with a single blit of the floor layer
+        """
         if self.atlas is None:
+            surface.fill(BACKGROUND_COLOR)
             return
-        
-        for i in range(self.mapsize[0]*self.mapsize[1]):
+        self._update_floor()
+        surface.blit(self._floor, (0, 0))
+
+    def _update_floor(self):
+        size = (int(self.size[0]), int(self.size[1]))
+        if self._floor is None or self._floor.get_size() != size or self._floor_image is not self.atlas.image:
+            self._floor = pygame.Surface(size)
+            if pygame.display.get_surface() is not None:
+                self._floor = self._floor.convert()
+            self._floor_image = self.atlas.image
+            self._floor.fill(BACKGROUND_COLOR)
+            self._draw_tiles(self._floor)
+            self._floor_cells.clear()
+            return
+
+        for i in self._floor_cells:
             dest_rect = self.get_cell_rect(i)
+            self._floor.fill(BACKGROUND_COLOR, dest_rect)
             tileidx = self.tilemap[i]
-            if tileidx is None:
-                continue            
-            surface.blit(self.atlas.get_tile_image(tileidx), dest_rect.topleft)
+            if tileidx is not None:
+                self._floor.blit(self.atlas.get_tile_image(tileidx), dest_rect.topleft)
+        self._floor_cells.clear()
+
+    def _draw_tiles(self, surface):
+        if self.atlas is None:
+            return
+        self._draw_layer(surface, self.tilemap)
     
     def _draw_objects(self, surface):
         if self.atlas is None:
             return
-        
-        for i in range(self.mapsize[0]*self.mapsize[1]):
-            dest_rect = self.get_cell_rect(i)
-            objidx = self.objectmap[i]
-            if objidx is None:
-                continue            
-            surface.blit(self.atlas.get_tile_image(objidx), dest_rect.topleft)
+        self._draw_layer(surface, self.objectmap)
+
+    def _draw_layer(self, surface, layer):
+        """
+        Draws the tiles of a tilemap or objectmap with a single Surface.blits() call
+        """
+        get_tile_image = self.atlas.get_tile_image
+        surface.blits([(get_tile_image(tileidx), position)
+                       for tileidx, position in zip(layer, self.get_cell_positions()) if tileidx is not None],
+                      False)
     
 
 
@@ -155,14 +281,14 @@ class TileMap(CanvasRectAreaItem):
             if self.hovered_cell != -1 and tileid != -1:
                 if event.button == 1:
                     self.draw_mode = 1
-                    if tileid in self.objectids:
+                    if self.catalog.is_object(tileid):
                         self.set_object(self.hovered_cell, tileid)
                     else:
                         self.set_tile(self.hovered_cell, tileid)
                     self.consume_event()
 
                 elif event.button == 3:
-                    if self.objectmap[self.hovered_cell] in self.objectids:
+                    if self.catalog.is_object(self.objectmap[self.hovered_cell]):
                         self.draw_mode = 2
                         self.set_object(self.hovered_cell, None)
                     else:
@@ -175,7 +301,7 @@ class TileMap(CanvasRectAreaItem):
             self.set_hovered_cell(cell_idx)
             tileid = self.atlas.get_selected_tile()
             if self.draw_mode == 1:
-                if tileid in self.objectids:
+                if self.catalog.is_object(tileid):
                     self.set_object(self.hovered_cell, tileid)
                 else:            
                     self.set_tile(self.hovered_cell, tileid)